@@ -0,0 +1,408 @@
+import argparse
+import ast
+import glob
+import json
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+from detections import Detections
+from tracker import iou_matrix
+
+# --- Backends de inferência intercambiáveis ---
+# Todos têm a mesma interface do YOLO do ultralytics: backend(frame_ou_lista, conf=...) devolve
+# uma lista de resultados com .boxes.data (N, 6), .names e .speed, por isso funcionam com
+# Detections.from_result() e com todos os scripts sem alterações.
+#   torch       -> ultralytics/PyTorch (.pt, ou qualquer artefacto que o ultralytics saiba abrir)
+#   onnxruntime -> ONNX Runtime no CPU, sem importar torch (.onnx, incluindo os quantizados INT8)
+#   openvino    -> OpenVINO no CPU (diretório *_openvino_model ou .xml, incluindo INT8)
+# Comandos:
+#   python backends.py export yolov8n.pt --calib amostras/ --formats onnx,onnx-int8,openvino,openvino-int8
+#   python backends.py report amostras/ --backends torch:yolov8n.pt onnxruntime:yolov8n_int8.onnx --max-map-drop 0.02
+
+DEFAULT_IMGSZ = 640
+NMS_IOU = 0.7 # Os mesmos valores por omissão do ultralytics
+MAX_DET = 300
+MAX_WH = 7680 # Deslocamento por classe para fazer NMS por classe numa só chamada
+LETTERBOX_COLOR = 114
+
+
+class BackendBoxes:
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class BackendResult:
+    def __init__(self, data, names, orig_shape, speed):
+        self.boxes = BackendBoxes(data)
+        self.names = names
+        self.orig_shape = orig_shape
+        self.speed = speed
+
+
+# --- Pré e pós-processamento equivalentes aos do YOLOv8 ---
+def letterbox(img, size):
+    h, w = img.shape[:2]
+    r = min(size / h, size / w)
+    nw, nh = int(round(w * r)), int(round(h * r))
+    resized = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR) if (nw, nh) != (w, h) else img
+    left, top = (size - nw) // 2, (size - nh) // 2
+    out = np.full((size, size, 3), LETTERBOX_COLOR, dtype=np.uint8)
+    out[top:top + nh, left:left + nw] = resized
+    return out, r, (left, top)
+
+
+def preprocess(images, size):
+    blob = np.empty((len(images), 3, size, size), dtype=np.float32)
+    metas = []
+    for i, img in enumerate(images):
+        boxed, r, pad = letterbox(img, size)
+        blob[i] = boxed[:, :, ::-1].transpose(2, 0, 1) # BGR -> RGB, HWC -> CHW
+        metas.append((r, pad, img.shape[:2]))
+    blob *= 1.0 / 255.0
+    return blob, metas
+
+
+def postprocess(output, metas, conf, iou=NMS_IOU, max_det=MAX_DET):
+    # output: (B, 4 + nc, A) com [cx, cy, w, h, pontuação por classe...] nas coordenadas da entrada
+    results = []
+    for pred, (r, (left, top), (h, w)) in zip(output, metas):
+        pred = pred.T
+        scores = pred[:, 4:]
+        cls = scores.argmax(axis=1)
+        score = scores[np.arange(len(cls)), cls]
+        keep = score >= conf
+        pred, cls, score = pred[keep], cls[keep], score[keep]
+        if not len(pred):
+            results.append(np.empty((0, 6), dtype=np.float32))
+            continue
+        xywh = pred[:, :4].copy()
+        xywh[:, :2] -= xywh[:, 2:] / 2 # Canto superior esquerdo
+        offset = (cls * MAX_WH)[:, None]
+        nms_boxes = np.concatenate([xywh[:, :2] + offset, xywh[:, 2:]], axis=1)
+        idx = cv2.dnn.NMSBoxes(nms_boxes.tolist(), score.tolist(), conf, iou)
+        idx = np.array(idx, dtype=np.int64).reshape(-1)
+        idx = idx[np.argsort(-score[idx], kind='stable')][:max_det]
+        xyxy = np.concatenate([xywh[idx, :2], xywh[idx, :2] + xywh[idx, 2:]], axis=1)
+        xyxy -= (left, top, left, top) # Desfaz o letterbox
+        xyxy /= r
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, w)
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, h)
+        results.append(np.concatenate([xyxy, score[idx, None], cls[idx, None]], axis=1).astype(np.float32))
+    return results
+
+
+def parse_names(value):
+    # Os modelos exportados pelo ultralytics guardam os nomes como "{0: 'person', ...}"
+    if isinstance(value, dict):
+        return {int(k): v for k, v in value.items()}
+    try:
+        return {int(k): v for k, v in ast.literal_eval(value).items()}
+    except (ValueError, SyntaxError, AttributeError):
+        return {}
+
+
+# --- Base comum aos backends que não usam o ultralytics ---
+class Backend:
+    name = 'base'
+
+    def __init__(self, model_path, imgsz=DEFAULT_IMGSZ):
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.names = {}
+        self.fixed_batch = None # 1 se o modelo exportado só aceita uma imagem de cada vez
+
+    def _infer(self, blob):
+        raise NotImplementedError
+
+    def __call__(self, source, verbose=False, conf=0.25, iou=NMS_IOU, max_det=MAX_DET, **kwargs):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        frames = [cv2.imread(f) if isinstance(f, str) else f for f in frames]
+        t0 = time.perf_counter()
+        blob, metas = preprocess(frames, self.imgsz)
+        t1 = time.perf_counter()
+        if self.fixed_batch == 1 and len(frames) > 1:
+            output = np.concatenate([self._infer(blob[i:i + 1]) for i in range(len(frames))])
+        else:
+            output = self._infer(blob)
+        t2 = time.perf_counter()
+        datas = postprocess(output, metas, conf, iou, max_det)
+        t3 = time.perf_counter()
+        n = len(frames)
+        speed = {'preprocess': (t1 - t0) * 1000 / n, 'inference': (t2 - t1) * 1000 / n, 'postprocess': (t3 - t2) * 1000 / n}
+        return [BackendResult(d, self.names, f.shape[:2], speed) for d, f in zip(datas, frames)]
+
+
+class TorchBackend:
+    name = 'torch'
+
+    def __init__(self, model_path, imgsz=DEFAULT_IMGSZ):
+        from ultralytics import YOLO
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.model = YOLO(model_path, task='detect')
+        self.names = self.model.names
+
+    def __call__(self, source, **kwargs):
+        kwargs.setdefault('imgsz', self.imgsz)
+        return self.model(source, **kwargs)
+
+
+class OnnxRuntimeBackend(Backend):
+    name = 'onnxruntime'
+
+    def __init__(self, model_path, imgsz=DEFAULT_IMGSZ, threads=0):
+        import onnxruntime as ort
+        super().__init__(model_path, imgsz)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads # 0 = todos os núcleos
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        inp = self.session.get_inputs()[0]
+        self.input_name = inp.name
+        if isinstance(inp.shape[0], int):
+            self.fixed_batch = inp.shape[0]
+        if isinstance(inp.shape[2], int):
+            self.imgsz = inp.shape[2] # O tamanho de entrada fica fixo na exportação
+        self.names = parse_names(self.session.get_modelmeta().custom_metadata_map.get('names', '{}'))
+
+    def _infer(self, blob):
+        return self.session.run(None, {self.input_name: blob})[0]
+
+
+class OpenVinoBackend(Backend):
+    name = 'openvino'
+
+    def __init__(self, model_path, imgsz=DEFAULT_IMGSZ):
+        import openvino as ov
+        super().__init__(model_path, imgsz)
+        xml = model_path if model_path.endswith('.xml') else glob.glob(os.path.join(model_path, '*.xml'))[0]
+        core = ov.Core()
+        model = core.read_model(xml)
+        shape = model.input(0).get_partial_shape()
+        if shape[0].is_static:
+            self.fixed_batch = shape[0].get_length()
+        if shape[2].is_static:
+            self.imgsz = shape[2].get_length()
+        self.compiled = core.compile_model(model, 'CPU', {'PERFORMANCE_HINT': 'LATENCY'})
+        self.output = self.compiled.output(0)
+        metadata = os.path.join(os.path.dirname(xml), 'metadata.yaml')
+        if os.path.exists(metadata):
+            import yaml
+            with open(metadata, encoding='utf-8') as f:
+                self.names = parse_names((yaml.safe_load(f) or {}).get('names', {}))
+
+    def _infer(self, blob):
+        return self.compiled(blob)[self.output]
+
+
+BACKENDS = {'torch': TorchBackend, 'onnxruntime': OnnxRuntimeBackend, 'openvino': OpenVinoBackend}
+
+
+def backend_for_path(model_path):
+    path = model_path.rstrip('/\\')
+    if path.endswith('.onnx'):
+        return 'onnxruntime'
+    if path.endswith('_openvino_model') or path.endswith('.xml'):
+        return 'openvino'
+    return 'torch'
+
+
+def create_backend(model_path, backend='auto', imgsz=DEFAULT_IMGSZ):
+    name = backend_for_path(model_path) if backend == 'auto' else backend
+    if name not in BACKENDS:
+        raise ValueError(f"Backend desconhecido: {name!r} (opções: {', '.join(BACKENDS)})")
+    if name != 'torch' and backend == 'auto':
+        try:
+            return BACKENDS[name](model_path, imgsz)
+        except ImportError:
+            # O ultralytics também abre .onnx e *_openvino_model, só que com o import do torch
+            print(f"{name} não está instalado; a usar o ultralytics para {model_path}")
+            name = 'torch'
+    return BACKENDS[name](model_path, imgsz)
+
+
+# --- Exportação e quantização INT8 ---
+def list_images(path):
+    if os.path.isdir(path):
+        exts = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+        return sorted(p for p in glob.glob(os.path.join(path, '**', '*'), recursive=True) if p.lower().endswith(exts))
+    return sorted(glob.glob(path))
+
+
+def quantize_onnx(onnx_path, calib_images, imgsz):
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    class Reader(CalibrationDataReader):
+        def __init__(self, input_name):
+            self.input_name = input_name
+            self._paths = iter(calib_images)
+
+        def get_next(self):
+            for path in self._paths:
+                img = cv2.imread(path)
+                if img is not None:
+                    return {self.input_name: preprocess([img], imgsz)[0]}
+            return None
+
+    source = onnx.load(onnx_path)
+    out_path = onnx_path[:-len('.onnx')] + '_int8.onnx'
+    quantize_static(onnx_path, out_path, Reader(source.graph.input[0].name), quant_format=QuantFormat.QDQ,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8, per_channel=True)
+    # Mantém os metadados do ultralytics (nomes das classes, imgsz...)
+    quantized = onnx.load(out_path)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source.metadata_props)
+    onnx.save(quantized, out_path)
+    return out_path
+
+
+def quantize_openvino(model_dir, calib_images, imgsz):
+    import nncf
+    import openvino as ov
+    xml = glob.glob(os.path.join(model_dir, '*.xml'))[0]
+    model = ov.Core().read_model(xml)
+    images = [p for p in calib_images if cv2.imread(p) is not None]
+    dataset = nncf.Dataset(images, lambda p: preprocess([cv2.imread(p)], imgsz)[0])
+    quantized = nncf.quantize(model, dataset, preset=nncf.QuantizationPreset.MIXED, subset_size=len(images))
+    out_dir = model_dir.rstrip('/\\').replace('_openvino_model', '_int8_openvino_model')
+    os.makedirs(out_dir, exist_ok=True)
+    ov.save_model(quantized, os.path.join(out_dir, os.path.basename(xml)))
+    metadata = os.path.join(model_dir, 'metadata.yaml')
+    if os.path.exists(metadata):
+        shutil.copy(metadata, out_dir)
+    return out_dir
+
+
+def export_all(model_path, formats, calib_images, imgsz=DEFAULT_IMGSZ):
+    from ultralytics import YOLO
+    yolo = YOLO(model_path)
+    outputs = {}
+    if {'onnx', 'onnx-int8'} & set(formats):
+        outputs['onnx'] = yolo.export(format='onnx', imgsz=imgsz)
+    if 'onnx-int8' in formats:
+        outputs['onnx-int8'] = quantize_onnx(outputs['onnx'], calib_images, imgsz)
+    if {'openvino', 'openvino-int8'} & set(formats):
+        outputs['openvino'] = yolo.export(format='openvino', imgsz=imgsz)
+    if 'openvino-int8' in formats:
+        outputs['openvino-int8'] = quantize_openvino(outputs['openvino'], calib_images, imgsz)
+    if 'torchscript' in formats:
+        outputs['torchscript'] = yolo.export(format='torchscript', imgsz=imgsz)
+    return outputs
+
+
+# --- Precisão vs. latência ---
+# Sem anotações, a referência são as deteções do primeiro backend (normalmente o PyTorch):
+# o mAP@0.5 mede quanto cada backend se afasta dele.
+def map50(predictions, references):
+    aps = []
+    classes = np.unique(np.concatenate([r[:, 5] for r in references])) if references else []
+    for c in classes:
+        scores, tps, n_ref = [], [], 0
+        for pred, ref in zip(predictions, references):
+            pc = pred[pred[:, 5] == c]
+            rc = ref[ref[:, 5] == c]
+            n_ref += len(rc)
+            pc = pc[np.argsort(-pc[:, 4], kind='stable')]
+            iou = iou_matrix(pc[:, :4], rc[:, :4])
+            matched = np.zeros(len(rc), dtype=bool)
+            for i in range(len(pc)):
+                tp = 0
+                if len(rc):
+                    cand = np.where(matched, 0.0, iou[i])
+                    j = int(cand.argmax())
+                    if cand[j] >= 0.5:
+                        matched[j] = True
+                        tp = 1
+                scores.append(pc[i, 4])
+                tps.append(tp)
+        if n_ref == 0:
+            continue
+        order = np.argsort(-np.array(scores), kind='stable')
+        tp = np.cumsum(np.array(tps)[order]) if tps else np.zeros(0)
+        fp = np.cumsum(1 - np.array(tps)[order]) if tps else np.zeros(0)
+        recall = tp / n_ref
+        precision = tp / np.maximum(tp + fp, 1e-9)
+        mrec = np.concatenate(([0.0], recall, [1.0]))
+        mpre = np.concatenate(([1.0], precision, [0.0]))
+        mpre = np.maximum.accumulate(mpre[::-1])[::-1]
+        i = np.flatnonzero(mrec[1:] != mrec[:-1])
+        aps.append(float(np.sum((mrec[i + 1] - mrec[i]) * mpre[i + 1])))
+    return float(np.mean(aps)) if aps else 1.0
+
+
+def compare_backends(specs, images, conf=0.25, imgsz=DEFAULT_IMGSZ, warmup=2):
+    frames = [img for img in (cv2.imread(p) for p in images) if img is not None]
+    rows, reference = [], None
+    for name, path in specs:
+        backend = create_backend(path, name, imgsz)
+        for frame in frames[:warmup]:
+            backend(frame, verbose=False, conf=conf)
+        latencies, preds = [], []
+        for frame in frames:
+            t0 = time.perf_counter()
+            result = backend(frame, verbose=False, conf=conf)[0]
+            latencies.append((time.perf_counter() - t0) * 1000)
+            preds.append(Detections.from_result(result, backend.names).data)
+        if reference is None:
+            reference = preds
+        lat = np.array(latencies)
+        rows.append({'backend': name, 'model': path, 'images': len(frames),
+                     'latency_ms_mean': float(lat.mean()), 'latency_ms_p95': float(np.percentile(lat, 95)),
+                     'map50_vs_reference': map50(preds, reference)})
+    return rows
+
+
+def parse_spec(value):
+    name, sep, path = value.partition(':')
+    if not sep:
+        return backend_for_path(value), value
+    return name, path
+
+
+# --- Script Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exportação, quantização e comparação de backends de inferência.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_export = sub.add_parser('export', help="Exporta o modelo e gera as versões INT8 calibradas")
+    p_export.add_argument('model', nargs='?', default='yolov8n.pt')
+    p_export.add_argument('--formats', default='onnx,onnx-int8,openvino,openvino-int8')
+    p_export.add_argument('--calib', default='minha_imagem.jpg', help="Diretório ou glob com imagens de calibração")
+    p_export.add_argument('--imgsz', type=int, default=DEFAULT_IMGSZ)
+
+    p_report = sub.add_parser('report', help="Compara latência e mAP@0.5 entre backends")
+    p_report.add_argument('images', help="Diretório ou glob com imagens de teste")
+    p_report.add_argument('--backends', nargs='+', required=True,
+                          help="nome:caminho (ex.: torch:yolov8n.pt onnxruntime:yolov8n_int8.onnx); o primeiro é a referência")
+    p_report.add_argument('--max-map-drop', type=float, default=0.02, help="Perda máxima de mAP@0.5 aceite")
+    p_report.add_argument('--conf', type=float, default=0.25)
+    p_report.add_argument('--imgsz', type=int, default=DEFAULT_IMGSZ)
+    p_report.add_argument('-o', '--output', default=None, help="Ficheiro JSON com o relatório")
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        calib = list_images(args.calib)
+        if any(f.endswith('-int8') for f in args.formats.split(',')) and not calib:
+            parser.error(f"nenhuma imagem de calibração em {args.calib}")
+        for fmt, path in export_all(args.model, args.formats.split(','), calib, args.imgsz).items():
+            print(f"{fmt:>14}: {path}")
+    else:
+        rows = compare_backends([parse_spec(s) for s in args.backends], list_images(args.images), args.conf, args.imgsz)
+        eligible = [r for r in rows if r['map50_vs_reference'] >= 1.0 - args.max_map_drop]
+        best = min(eligible, key=lambda r: r['latency_ms_mean']) if eligible else None
+        print(f"{'backend':>12} {'modelo':<40} {'media ms':>9} {'p95 ms':>8} {'mAP50':>6}")
+        for r in rows:
+            mark = ' <- escolhido' if r is best else ''
+            print(f"{r['backend']:>12} {r['model']:<40} {r['latency_ms_mean']:9.1f} {r['latency_ms_p95']:8.1f} "
+                  f"{r['map50_vs_reference']:6.3f}{mark}")
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump({'max_map_drop': args.max_map_drop, 'chosen': best, 'results': rows}, f, indent=2)
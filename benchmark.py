@@ -0,0 +1,200 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from detections import Detections
+from metrics import Metrics
+from renderer import LayeredRenderer
+from stub_model import StubModel
+
+# --- Benchmark reprodutível dos caminhos de deteção ---
+# Repete um conjunto fixo de frames sintéticos (minha_imagem.jpg redimensionada e deslocada
+# frame a frame) através das mesmas etapas dos scripts: inferência, construção das deteções,
+# hit-testing dos cliques e desenho. Mede latência por etapa e ponta a ponta, débito e pico de
+# memória para cada combinação de tamanho de lote, resolução e número de deteções.
+#   python benchmark.py --backend stub --detections 10,100,1000 -o bench.json
+#   python benchmark.py --backend yolo --model yolov8n.pt --batch-sizes 1,4
+#   python benchmark.py --backend onnxruntime --model yolov8n_int8.onnx
+# Com --backend stub não são precisos pesos nem torch; os resultados vão para um JSON.
+# 'yolo' escolhe o backend de inferência pela extensão do modelo (ver backends.py).
+
+BASE_IMAGE = 'minha_imagem.jpg'
+CLICKS_PER_FRAME = 10
+
+
+def parse_list(value, cast=int):
+    return [cast(v) for v in value.split(',') if v]
+
+
+def parse_resolution(value):
+    w, h = value.lower().split('x')
+    return int(w), int(h)
+
+
+# --- Frames sintéticos ---
+def synthetic_frames(base, resolution, count, seed=0):
+    width, height = resolution
+    img = cv2.resize(base, (width, height), interpolation=cv2.INTER_LINEAR)
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(count):
+        # Pequeno deslocamento e variação de brilho: frames diferentes mas reprodutíveis
+        dx, dy = rng.integers(-20, 21, 2)
+        frame = np.roll(img, (int(dy), int(dx)), axis=(0, 1))
+        frame = cv2.convertScaleAbs(frame, alpha=1.0, beta=float(rng.uniform(-15, 15)))
+        frames.append(frame)
+    return frames
+
+
+# --- Pico de memória (RSS) ---
+def reset_peak_rss():
+    # Em Linux, escrever "5" em clear_refs repõe o VmHWM; noutros sistemas o pico é o do processo
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def draw_info_panel(img, selected_det):
+    text = "Nenhum item selecionado" if selected_det is None else f"Selecionado: {selected_det['label']}"
+    cv2.rectangle(img, (5, 5), (350, 35), (200, 200, 200), -1)
+    cv2.putText(img, text, (10, 28), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 0), 1, cv2.LINE_AA)
+    return (0, 0, 360, 40)
+
+
+# --- Uma configuração ---
+def run_config(model, frames, batch_size, conf, warmup, seed=0):
+    metrics = Metrics(window=max(len(frames), 1))
+    renderer = LayeredRenderer(draw_info_panel, (0, 255, 0), (0, 0, 255), (255, 255, 255))
+    rng = np.random.default_rng(seed)
+    height, width = frames[0].shape[:2]
+    clicks = rng.uniform(0, 1, (len(frames), CLICKS_PER_FRAME, 2)) * (width, height)
+
+    for i in range(min(warmup, len(frames))): # Aquecimento fora das medições
+        model(frames[i:i + 1], verbose=False, conf=conf)
+
+    detections_total = 0
+    reset_supported = reset_peak_rss()
+    start = time.perf_counter()
+    for b in range(0, len(frames), batch_size):
+        batch = frames[b:b + batch_size]
+        t_batch = time.perf_counter()
+        with metrics.stage('inferencia'):
+            results = model(batch, verbose=False, conf=conf)
+        inference_share = (time.perf_counter() - t_batch) / len(batch)
+        for k, (frame, result) in enumerate(zip(batch, results)):
+            t_frame = time.perf_counter()
+            with metrics.stage('deteccoes'):
+                detections = Detections.from_result(result, getattr(model, 'names', None))
+            detections_total += len(detections)
+            with metrics.stage('hit_test'):
+                selected = -1
+                for x, y in clicks[b + k]:
+                    selected = detections.hit_test(x, y)
+            with metrics.stage('render'):
+                renderer.set_frame(frame, detections)
+                renderer.render(-1)
+            with metrics.stage('render_selecao'): # Mudança de seleção: só as zonas sujas
+                renderer.render(selected if selected != -1 else (0 if len(detections) else -1))
+            metrics.observe('ponta_a_ponta', inference_share + time.perf_counter() - t_frame)
+            metrics.mark_frame()
+    elapsed = time.perf_counter() - start
+
+    snap = metrics.snapshot()
+    return {
+        'frames': len(frames),
+        'elapsed_s': elapsed,
+        'throughput_fps': len(frames) / elapsed if elapsed > 0 else 0.0,
+        'mean_detections': detections_total / len(frames),
+        'peak_rss_mb': peak_rss_mb(),
+        'peak_rss_is_per_config': reset_supported,
+        'stages': snap['stages'],
+    }
+
+
+def environment():
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+    try:
+        info['git_commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        pass
+    return info
+
+
+# --- Script Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark reprodutível do caminho de deteção.")
+    parser.add_argument('--backend', choices=['stub', 'yolo', 'torch', 'onnxruntime', 'openvino'], default='stub')
+    parser.add_argument('--model', default='yolov8n.pt', help="Modelo para os backends que não são o stub")
+    parser.add_argument('--image', default=BASE_IMAGE, help="Imagem base dos frames sintéticos")
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--batch-sizes', default='1,4,8')
+    parser.add_argument('--resolutions', default='640x480,1280x720,1920x1080')
+    parser.add_argument('--detections', default='10,100,1000', help="Caixas por frame do modelo stub")
+    parser.add_argument('--stub-latency-ms', type=float, default=0.0)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default=None, help="Ficheiro JSON com os resultados")
+    args = parser.parse_args()
+
+    base = cv2.imread(args.image)
+    if base is None:
+        sys.exit(f"Erro: Não foi possível carregar a imagem: {args.image}")
+
+    if args.backend != 'stub':
+        from model_loader import load_model
+        real_model = load_model(args.model, backend='auto' if args.backend == 'yolo' else args.backend)
+        detection_counts = [None] # O número de caixas depende da imagem
+    else:
+        detection_counts = parse_list(args.detections)
+
+    results = []
+    for resolution in [parse_resolution(r) for r in args.resolutions.split(',') if r]:
+        frames = synthetic_frames(base, resolution, args.frames, args.seed)
+        for n in detection_counts:
+            for batch_size in parse_list(args.batch_sizes):
+                model = real_model if n is None else StubModel(n, seed=args.seed, latency_ms=args.stub_latency_ms)
+                r = run_config(model, frames, batch_size, args.conf, args.warmup, args.seed)
+                r.update({'backend': args.backend, 'resolution': f"{resolution[0]}x{resolution[1]}",
+                          'batch_size': batch_size, 'stub_detections': n})
+                results.append(r)
+                e2e = r['stages']['ponta_a_ponta']
+                print(f"{r['resolution']:>10} lote={batch_size:<3} caixas={r['mean_detections']:7.1f} "
+                      f"{r['throughput_fps']:8.1f} fps  p50={e2e['p50_ms']:.2f}ms p99={e2e['p99_ms']:.2f}ms "
+                      f"rss={r['peak_rss_mb']:.0f}MB")
+
+    report = {'environment': environment(), 'args': vars(args), 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Resultados gravados em {args.output}")
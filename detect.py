@@ -1,7 +1,14 @@
 import cv2
-from ultralytics import YOLO
 import numpy as np
-import time # Para calcular o FPS
+import time # Para medir os tempos de cada etapa
+from pipeline import DetectionPipeline, END_OF_STREAM
+from shm_ring import ProcessPipeline
+from detections import Detections
+from renderer import LayeredRenderer, text_size
+from tracker import KeyframeDetector, KeyframeScheduler
+from motion_gate import GatedDetector, MotionGate
+from metrics import REGISTRY
+from model_loader import load_model, resolve_model_path
 
 # --- Configurações Globais e Variáveis ---
 SOURCE_IS_VIDEO = True # Mude para False se quiser testar com uma imagem estática como antes
@@ -10,10 +17,39 @@ VIDEO_SOURCE = 0 # 0 para webcam, ou 'caminho/para/seu/video.mp4'
 IMAGE_SOURCE = 'minha_imagem.jpg' # Usado se SOURCE_IS_VIDEO for False
 
 CONFIDENCE_THRESHOLD = 0.4 # Limiar de confiança mínimo para considerar uma deteção
+MODEL_PATH = 'yolov8n.pt' # Pode usar 'yolov8n-seg.pt' para segmentação, por exemplo
+USE_EXPORTED_MODEL = True # Usa yolov8n.onnx / yolov8n.torchscript se existirem (ver model_loader.py)
+INFERENCE_BACKEND = 'auto' # 'auto' (pela extensão do modelo), 'torch', 'onnxruntime' ou 'openvino' (ver backends.py)
+
+# --- Pipeline em threads (apenas vídeo) ---
+USE_PIPELINE = True # Captura e inferência em threads separadas do render
+PIPELINE_QUEUE_SIZE = 2 # Tamanho máximo das filas entre etapas
+PIPELINE_BACKPRESSURE = 'drop' # 'drop' descarta o frame mais antigo, 'block' faz o produtor esperar
+PIPELINE_PROCESSES = False # True: captura e inferência em processos, com frames em memória partilhada
+PIPELINE_SHM_SLOTS = 8 # Número de frames pré-alocados na memória partilhada
+
+# --- Keyframes (apenas vídeo, modo série ou threads) ---
+KEYFRAME_MODE = False # True: o YOLO só corre a cada K frames; entre eles as caixas seguem um tracker
+TARGET_FPS = 25 # K ajusta-se para manter este FPS
+KEYFRAME_MAX = 10 # Valor máximo de K
+SCENE_CHANGE_THRESHOLD = 20.0 # Diferença média (0-255) entre miniaturas que força um keyframe
+
+# --- Movimento e regiões de interesse (apenas vídeo, modo série ou threads; ver motion_gate.py) ---
+MOTION_GATE = False # True: sem movimento o modelo não corre; com movimento parcial só corre nos recortes
+MOTION_METHOD = 'diff' # 'diff' (diferença de frames) ou 'mog2' (subtração de fundo)
+MOTION_ROIS = None # Ex.: [(0, 200, 640, 480)] para só olhar para essa zona do frame (x1, y1, x2, y2)
+MOTION_MAX_SKIPPED = 150 # Inferência completa forçada após este número de frames parados
+
+# --- Métricas (ver metrics.py) ---
+METRICS_JSON_LOG = None # Ex.: 'metricas.jsonl' para gravar um snapshot JSON periódico
+METRICS_JSON_INTERVAL = 10.0 # Segundos entre snapshots
+METRICS_HTTP_PORT = None # Ex.: 9100 para servir http://127.0.0.1:9100/metrics (formato Prometheus)
+PROFILE_FRAMES = 100 # Tecla 'r' (ou /profile?frames=N) grava um perfil destes N frames
+PROFILER = 'cprofile' # 'cprofile' ou 'pyinstrument'
 
 # --- Variáveis de Interface (resetadas por frame no caso de vídeo) ---
 img_display_processed = None # Imagem com as deteções para exibir
-detections_this_frame = [] # Lista para armazenar informações das deteções do frame atual
+detections_this_frame = Detections() # Deteções do frame atual (contentor colunar, ver detections.py)
 selected_box_index = -1
 
 COLOR_DEFAULT = (0, 255, 0) # Verde
@@ -23,29 +59,10 @@ TEXT_COLOR_INFO = (0, 0, 0) # Preto para informações no canto
 INFO_BG_COLOR = (200, 200, 200, 180) # Cinza claro semi-transparente
 FPS_COLOR = (0, 0, 255) # Vermelho para o texto do FPS
 
-# --- Função para Desenhar a Interface (Caixas, Informações, FPS) ---
-def draw_interface_video(original_frame):
-    global img_display_processed, detections_this_frame, selected_box_index
-
-    img_display_processed = original_frame.copy()
-
-    # Desenha todas as caixas delimitadoras válidas do frame atual
-    for i, det in enumerate(detections_this_frame):
-        xyxy = det['xyxy']
-        label = det['label']
-        conf = det['confidence']
-        color = COLOR_SELECTED if i == selected_box_index else COLOR_DEFAULT
-
-        cv2.rectangle(img_display_processed, (int(xyxy[0]), int(xyxy[1])), (int(xyxy[2]), int(xyxy[3])), color, 2)
-        text_on_box = f"{label}: {conf:.2f}"
-        (text_width, text_height), baseline = cv2.getTextSize(text_on_box, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1) # Fonte menor
-        cv2.rectangle(img_display_processed, (int(xyxy[0]), int(xyxy[1]) - text_height - baseline), (int(xyxy[0]) + text_width, int(xyxy[1])), color, -1)
-        cv2.putText(img_display_processed, text_on_box, (int(xyxy[0]), int(xyxy[1]) - baseline // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.5, TEXT_COLOR_BOX, 1, cv2.LINE_AA)
-
-    # Desenha informações do item selecionado
+# --- Painel de informação do item selecionado (devolve o retângulo que ocupa) ---
+def draw_info_panel_video(img, selected_det):
     info_text_lines = []
-    if selected_box_index != -1 and selected_box_index < len(detections_this_frame):
-        selected_det = detections_this_frame[selected_box_index]
+    if selected_det is not None:
         info_text_lines.append(f"Selecionado: {selected_det['label']}")
         info_text_lines.append(f"Confianca: {selected_det['confidence']:.2f}")
         # info_text_lines.append(f"Coords: {[int(c) for c in selected_det['xyxy']]}") # Opcional, pode poluir
@@ -59,12 +76,28 @@ def draw_interface_video(original_frame):
     # Altura do fundo baseada no número de linhas + um pouco de padding
     bg_height = info_y_start + (len(info_text_lines) * info_line_height)
     # Largura do fundo (ajuste conforme necessário)
-    cv2.rectangle(img_display_processed, (info_x_start -5 , info_y_start -5 ), (350, bg_height), INFO_BG_COLOR, -1)
+    cv2.rectangle(img, (info_x_start -5 , info_y_start -5 ), (350, bg_height), INFO_BG_COLOR, -1)
 
+    right, bottom = 351, bg_height + 1
     for i, line in enumerate(info_text_lines):
         y_pos = info_y_start + (i * info_line_height) + (info_line_height // 2) # Centraliza verticalmente
-        cv2.putText(img_display_processed, line, (info_x_start, y_pos), cv2.FONT_HERSHEY_SIMPLEX, 0.6, TEXT_COLOR_INFO, 1, cv2.LINE_AA)
+        cv2.putText(img, line, (info_x_start, y_pos), cv2.FONT_HERSHEY_SIMPLEX, 0.6, TEXT_COLOR_INFO, 1, cv2.LINE_AA)
+        (text_width, _), baseline = text_size(line, 0.6)
+        right, bottom = max(right, info_x_start + text_width + 2), max(bottom, y_pos + baseline + 2)
+    return (0, 0, right, bottom)
+
 
+# Renderizador por camadas: guarda o frame e as etiquetas e, numa mudança de seleção,
+# só redesenha as zonas afetadas (ver renderer.py)
+renderer = LayeredRenderer(draw_info_panel_video, COLOR_DEFAULT, COLOR_SELECTED, TEXT_COLOR_BOX, label_scale=0.5) # Fonte menor
+
+# --- Função para Desenhar a Interface (Caixas, Informações, FPS) ---
+def draw_interface_video(original_frame):
+    global img_display_processed, detections_this_frame, selected_box_index
+
+    # Frame ou deteções novos: redesenho completo; mesma imagem: só a seleção muda
+    renderer.set_frame(original_frame, detections_this_frame)
+    img_display_processed = renderer.render(selected_box_index)
 
     cv2.imshow("Deteccoes YOLOv8 - Video Interativo", img_display_processed)
 
@@ -75,19 +108,9 @@ def mouse_callback_video(event, x, y, flags, param):
     original_frame_for_redraw = param
 
     if event == cv2.EVENT_LBUTTONDOWN:
-        clicked_on_box_this_time = False
-        # Verifica se há deteções neste frame para evitar erro se detections_this_frame estiver vazio
-        if detections_this_frame:
-            for i, det in enumerate(detections_this_frame):
-                xmin, ymin, xmax, ymax = det['xyxy']
-                if xmin < x < xmax and ymin < y < ymax:
-                    selected_box_index = i
-                    print_selected_info_video()
-                    clicked_on_box_this_time = True
-                    break
-        if not clicked_on_box_this_time:
-            selected_box_index = -1
-            print_selected_info_video()
+        # Consulta o índice espacial do frame; com caixas sobrepostas ganha a mais pequena
+        selected_box_index = detections_this_frame.hit_test(x, y)
+        print_selected_info_video()
         # Importante: redesenha a interface COM O FRAME ORIGINAL para não acumular desenhos
         if original_frame_for_redraw is not None:
             draw_interface_video(original_frame_for_redraw)
@@ -105,9 +128,44 @@ def print_selected_info_video():
         print("\n--- Nenhum item destacado (Frame Atual) ---")
 
 
+# --- Função que corre o YOLO num frame e devolve as deteções ---
+def detect_frame(model, frame):
+    results = model(frame, verbose=False, conf=CONFIDENCE_THRESHOLD) # Já filtrado pela confiança
+    # O ultralytics mede as suas três fases (em ms) em results[0].speed
+    for stage, ms in results[0].speed.items():
+        if ms is not None:
+            REGISTRY.observe(stage, ms / 1000.0)
+    with REGISTRY.stage('deteccoes'):
+        return Detections.from_result(results[0], model.names)
+
+
 # --- Script Principal ---
 if __name__ == "__main__":
-    model = YOLO('yolov8n.pt') # Pode usar 'yolov8n-seg.pt' para segmentação, por exemplo
+    model_path = resolve_model_path(MODEL_PATH) if USE_EXPORTED_MODEL else MODEL_PATH
+    # No modo de processos quem carrega o modelo é o processo de inferência
+    model = None
+    if not (SOURCE_IS_VIDEO and USE_PIPELINE and PIPELINE_PROCESSES):
+        model = load_model(model_path, backend=INFERENCE_BACKEND) # Importa o ultralytics e aquece o modelo antes do primeiro frame
+
+    if METRICS_JSON_LOG:
+        REGISTRY.start_json_log(METRICS_JSON_LOG, METRICS_JSON_INTERVAL)
+    if METRICS_HTTP_PORT:
+        REGISTRY.start_http_server(METRICS_HTTP_PORT)
+        print(f"Métricas em http://127.0.0.1:{METRICS_HTTP_PORT}/metrics")
+
+    pipeline = None
+    frame = None # Frame atualmente mostrado (base para redesenhar após cliques/teclas)
+    shown_packet = None # Pacote do frame mostrado (no modo de processos segura o slot de memória partilhada)
+
+    # Função de deteção usada por frame: YOLO em todos os frames, ou em keyframes com tracking;
+    # com MOTION_GATE o YOLO só corre quando (e onde) há movimento
+    infer_fn = lambda f: detect_frame(model, f)
+    gated = None
+    if MOTION_GATE and SOURCE_IS_VIDEO:
+        infer_fn = gated = GatedDetector(infer_fn, MotionGate(MOTION_METHOD, MOTION_ROIS), MOTION_MAX_SKIPPED)
+    if KEYFRAME_MODE:
+        infer_fn = KeyframeDetector(infer_fn, KeyframeScheduler(target_fps=TARGET_FPS, k_max=KEYFRAME_MAX,
+                                                                scene_threshold=SCENE_CHANGE_THRESHOLD))
 
     if SOURCE_IS_VIDEO:
         cap = cv2.VideoCapture(VIDEO_SOURCE)
@@ -124,6 +182,27 @@ if __name__ == "__main__":
         # mas não é tão direto com a API padrão do OpenCV.
         # Por agora, vamos garantir que draw_interface_video use o frame correto.
 
+        if USE_PIPELINE and PIPELINE_PROCESSES:
+            # Captura e inferência em processos; só índices de slot passam entre eles
+            frame_shape = (int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+            if frame_shape[0] <= 0 or frame_shape[1] <= 0:
+                # Algumas webcams/streams não reportam o tamanho: lê-se um frame para o saber
+                ret, first_frame = cap.read()
+                if not ret:
+                    print(f"Erro: Não foi possível ler um frame de {VIDEO_SOURCE}")
+                    exit()
+                frame_shape = first_frame.shape
+            cap.release() # A fonte passa a ser aberta pelo processo de captura
+            cap = None
+            pipeline = ProcessPipeline(VIDEO_SOURCE, model_path, CONFIDENCE_THRESHOLD, frame_shape,
+                                       num_slots=PIPELINE_SHM_SLOTS, queue_size=PIPELINE_QUEUE_SIZE,
+                                       backend=INFERENCE_BACKEND, metrics=REGISTRY).start()
+        elif USE_PIPELINE:
+            # Captura e inferência em threads; o render continua nesta thread
+            pipeline = DetectionPipeline(cap, infer_fn,
+                                         queue_size=PIPELINE_QUEUE_SIZE,
+                                         backpressure=PIPELINE_BACKPRESSURE, metrics=REGISTRY).start()
+
     else: # Processamento de imagem única (código anterior adaptado)
         frame = cv2.imread(IMAGE_SOURCE)
         if frame is None:
@@ -132,77 +211,88 @@ if __name__ == "__main__":
         cv2.namedWindow("Deteccoes YOLOv8 - Video Interativo") # Mesmo nome de janela
 
         # Processa a imagem única
-        results = model(frame, verbose=False, conf=CONFIDENCE_THRESHOLD)
-        detections_this_frame.clear()
-        for box in results[0].boxes:
-            detections_this_frame.append({
-                'xyxy': box.xyxy[0].tolist(),
-                'label': model.names[int(box.cls[0].item())],
-                'confidence': box.conf[0].item()
-            })
+        detections_this_frame = detect_frame(model, frame)
         cv2.setMouseCallback("Deteccoes YOLOv8 - Video Interativo", mouse_callback_video, frame)
         draw_interface_video(frame)
 
 
     # Loop principal (para vídeo ou para manter a imagem estática aberta)
-    prev_time = 0 # Para cálculo do FPS
     while True:
         if SOURCE_IS_VIDEO:
-            ret, frame = cap.read()
-            if not ret:
-                print("Fim do vídeo ou erro na leitura do frame.")
-                break
-
-            # Atualiza o 'param' do callback do rato a cada novo frame.
-            # Isto é uma forma de dar ao callback acesso ao frame atual.
-            # No entanto, a função mouse_callback_video agora usa o frame que lhe é passado
-            # diretamente na sua chamada de draw_interface_video.
-            cv2.setMouseCallback("Deteccoes YOLOv8 - Video Interativo", mouse_callback_video, frame)
-
-
-            # Processa o frame atual com YOLO
-            # Adicionamos 'conf=CONFIDENCE_THRESHOLD' diretamente na chamada do modelo
-            results = model(frame, verbose=False, conf=CONFIDENCE_THRESHOLD) # stream=True pode ser mais eficiente para vídeo
-            current_detections = results[0].boxes
-
-            # Limpa as deteções do frame anterior e preenche com as novas
-            detections_this_frame.clear()
-            selected_box_index = -1 # Resetar seleção a cada novo frame
-
-            for box in current_detections: # Já filtrado pela confiança no 'model()'
-                detections_this_frame.append({
-                    'xyxy': box.xyxy[0].tolist(),
-                    'label': model.names[int(box.cls[0].item())],
-                    'confidence': box.conf[0].item()
-                })
-
-            # Calcular e mostrar FPS
-            curr_time = time.time()
-            fps = 1 / (curr_time - prev_time)
-            prev_time = curr_time
-            cv2.putText(frame, f"FPS: {fps:.1f}", (frame.shape[1] - 150, 30), # Canto superior direito
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, FPS_COLOR, 2, cv2.LINE_AA)
-
-            # Desenha a interface (caixas, infos) no frame processado
-            draw_interface_video(frame) # Passa o frame original para ser a base do desenho
+            packet = None
+            if pipeline is not None:
+                # Pega no próximo frame já processado, se houver; senão só trata o teclado
+                packet = pipeline.get_result(timeout=0.005)
+                if packet is END_OF_STREAM:
+                    if pipeline.error is not None:
+                        print(f"Erro no pipeline ({pipeline.error}).")
+                    else:
+                        print("Fim do vídeo ou erro na leitura do frame.")
+                    break
+                new_frame = packet.frame if packet is not None else None
+                new_detections = packet.detections if packet is not None else None
+            else:
+                with REGISTRY.stage('captura'):
+                    ret, new_frame = cap.read()
+                if not ret:
+                    print("Fim do vídeo ou erro na leitura do frame.")
+                    break
+                # Processa o frame atual com YOLO
+                new_detections = infer_fn(new_frame)
+
+            if new_frame is not None:
+                frame = new_frame
+                if pipeline is not None:
+                    pipeline.release(shown_packet) # O frame anterior deixa de ser mostrado
+                    shown_packet = packet
+
+                # Atualiza o 'param' do callback do rato a cada novo frame.
+                # Isto é uma forma de dar ao callback acesso ao frame atual.
+                # No entanto, a função mouse_callback_video agora usa o frame que lhe é passado
+                # diretamente na sua chamada de draw_interface_video.
+                cv2.setMouseCallback("Deteccoes YOLOv8 - Video Interativo", mouse_callback_video, frame)
+
+                # Substitui as deteções do frame anterior pelas novas.
+                # Com keyframes a seleção segue o mesmo track; sem tracking (ids -1) é resetada
+                selected_track_id = -1
+                if 0 <= selected_box_index < len(detections_this_frame):
+                    selected_track_id = detections_this_frame[selected_box_index]['track_id']
+                detections_this_frame = new_detections
+                selected_box_index = detections_this_frame.index_of_track(selected_track_id)
+
+                # Calcular e mostrar FPS (média dos frames mostrados nos últimos segundos)
+                REGISTRY.mark_frame()
+                fps = REGISTRY.fps()
+                cv2.putText(frame, f"FPS: {fps:.1f}", (frame.shape[1] - 150, 30), # Canto superior direito
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, FPS_COLOR, 2, cv2.LINE_AA)
+
+                # Desenha a interface (caixas, infos) no frame processado
+                t_render = time.perf_counter()
+                draw_interface_video(frame) # Passa o frame original para ser a base do desenho
+                render_seconds = time.perf_counter() - t_render
+                if packet is not None:
+                    pipeline.mark_rendered(packet, render_seconds)
+                else:
+                    REGISTRY.observe('render', render_seconds)
 
         # Lógica de Teclado (comum para imagem e vídeo)
         key = cv2.waitKey(1) & 0xFF # Espera por 1ms
 
         if key == ord('q') or key == 27:
             break
+        elif key == ord('r'): # Grava um perfil dos próximos PROFILE_FRAMES frames
+            path = REGISTRY.profile_frames(PROFILE_FRAMES, kind=PROFILER)
+            print(f"A perfilar {PROFILE_FRAMES} frames para {path}...")
         elif key == ord('n'):
-            if detections_this_frame:
+            if detections_this_frame and frame is not None:
                 selected_box_index = (selected_box_index + 1) % len(detections_this_frame)
                 print_selected_info_video()
-                if SOURCE_IS_VIDEO: draw_interface_video(frame) # Redesenha o frame atual
-                else: draw_interface_video(cv2.imread(IMAGE_SOURCE)) # Redesenha a imagem estática
+                draw_interface_video(frame) # Redesenha o frame atual (a imagem estática fica em memória)
         elif key == ord('p'):
-            if detections_this_frame:
+            if detections_this_frame and frame is not None:
                 selected_box_index = (selected_box_index - 1 + len(detections_this_frame)) % len(detections_this_frame)
                 print_selected_info_video()
-                if SOURCE_IS_VIDEO: draw_interface_video(frame)
-                else: draw_interface_video(cv2.imread(IMAGE_SOURCE))
+                draw_interface_video(frame)
 
         # Se não for vídeo, e uma tecla for pressionada (exceto q/esc/n/p),
         # o loop continua, mas nada muda visualmente até uma tecla de navegação.
@@ -215,6 +305,16 @@ if __name__ == "__main__":
 
 
     # Libera os recursos
-    if SOURCE_IS_VIDEO:
+    if pipeline is not None:
+        pipeline.release(shown_packet)
+        frame = shown_packet = None
+        pipeline.stop()
+        print(pipeline.summary())
+    if isinstance(infer_fn, KeyframeDetector):
+        print(infer_fn.summary())
+    if gated is not None:
+        print(gated.summary())
+    print(REGISTRY.summary())
+    if SOURCE_IS_VIDEO and cap is not None:
         cap.release()
     cv2.destroyAllWindows()
\ No newline at end of file
@@ -1,37 +1,50 @@
-from ultralytics import YOLO
+import cv2
 from PIL import Image # Pillow para manipulação de imagens
+from result_cache import DetectionCache, detect_cached
+from model_loader import load_model, resolve_model_path
 
-# 1. Carregar um modelo YOLOv8 pré-treinado
+# 1. Escolher um modelo YOLOv8 pré-treinado
 # Existem diferentes tamanhos de modelo: yolov8n.pt (nano, mais rápido), yolov8s.pt (small),
 # yolov8m.pt (medium), yolov8l.pt (large), yolov8x.pt (extra-large, mais preciso)
 # Vamos usar o 'yolov8n.pt' que é pequeno e rápido para começar.
-model = YOLO('yolov8n.pt')
+# O modelo (e o import do ultralytics) só é carregado se a imagem ainda não estiver na cache de
+# resultados (ver result_cache.py). Se existir um yolov8n.onnx ou yolov8n.torchscript exportado, é usado.
+caminho_modelo = resolve_model_path('yolov8n.pt')
+model = None
+
+def carregar_modelo():
+    global model
+    if model is None:
+        model = load_model(caminho_modelo, warmup=False) # Só vai correr uma vez: aquecer não compensa
+    return model
 
 # 2. Definir o caminho para a sua imagem
 caminho_imagem = 'minha_imagem.jpg' # SUBSTITUA PELO NOME DA SUA IMAGEM SE FOR DIFERENTE
 
 # 3. Fazer a deteção na imagem
-# O modelo retorna uma lista de objetos 'Results'. Como estamos a processar uma única imagem, teremos uma lista com um elemento.
-results = model(caminho_imagem)
+# A cache é indexada pelo conteúdo da imagem, pelos pesos e pelos parâmetros; se esta imagem já foi
+# processada, as deteções vêm da cache e 'result' é None. Caso contrário o modelo corre e
+# 'result' é o objeto 'Results' do ultralytics para a nossa imagem.
+cache = DetectionCache()
+deteccoes, result = detect_cached(caminho_imagem, cache, carregar_modelo, caminho_modelo)
+if result is None:
+    print("(resultado lido da cache; o modelo não foi carregado)")
 
 # 4. Processar e mostrar os resultados
-# O primeiro (e único) elemento da lista 'results' contém as deteções para a nossa imagem.
-result = results[0]
+# As deteções estão num array numpy com todas as caixas (ver detections.py)
 
 # Quantos objetos foram detetados?
-print(f"Número de objetos detetados: {len(result.boxes)}")
+print(f"Número de objetos detetados: {len(deteccoes)}")
 
 # Iterar sobre cada objeto detetado
-for i, box in enumerate(result.boxes):
+for i, det in enumerate(deteccoes):
     # Obter as coordenadas da caixa delimitadora (bounding box)
     # no formato (xmin, ymin, xmax, ymax)
-    coordenadas = box.xyxy[0].tolist()
-    # Obter a classe do objeto (como um número/índice)
-    classe_id = int(box.cls[0].item())
+    coordenadas = det['xyxy']
     # Obter o nome da classe a partir do ID
-    nome_classe = model.names[classe_id]
+    nome_classe = det['label']
     # Obter a confiança da deteção
-    confianca = box.conf[0].item()
+    confianca = det['confidence']
 
     print(f"  Objeto {i+1}:")
     print(f"    Classe: {nome_classe}")
@@ -40,8 +53,18 @@ for i, box in enumerate(result.boxes):
     print("-" * 20)
 
 # 5. Mostrar a imagem com as deteções desenhadas (opcional, mas útil)
-# O objeto 'result' tem um método 'plot()' que retorna a imagem com as caixas desenhadas (requer OpenCV instalado pela ultralytics).
-imagem_com_deteccoes_array = result.plot() # Retorna um array NumPy (BGR)
+# O objeto 'result' do ultralytics tem um método 'plot()' que retorna a imagem com as caixas desenhadas (requer OpenCV instalado pela ultralytics).
+# Os backends ONNX Runtime/OpenVINO (ver backends.py) não o têm.
+if result is not None and hasattr(result, 'plot'):
+    imagem_com_deteccoes_array = result.plot() # Retorna um array NumPy (BGR)
+else:
+    # Vindo da cache (ou de outro backend) não há 'plot()': desenha as caixas diretamente com o OpenCV
+    imagem_com_deteccoes_array = cv2.imread(caminho_imagem)
+    for det in deteccoes:
+        x1, y1, x2, y2 = (int(c) for c in det['xyxy'])
+        cv2.rectangle(imagem_com_deteccoes_array, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(imagem_com_deteccoes_array, f"{det['label']} {det['confidence']:.2f}", (x1, y1 - 4),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2, cv2.LINE_AA)
 
 # Converter o array NumPy (BGR) para uma imagem PIL (RGB) para fácil visualização
 imagem_com_deteccoes_pil = Image.fromarray(imagem_com_deteccoes_array[..., ::-1]) # Converte BGR para RGB
@@ -0,0 +1,355 @@
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from detections import Detections
+from model_loader import load_model
+
+# --- Deteção em lote, sem interface gráfica ---
+# Versão do detectar.py para processar árvores de diretórios com muitas imagens:
+#   python detectar_lote.py fotos/ 'outras/**/*.png' --manifest lista.txt -o resultados.jsonl
+# As imagens são descodificadas numa pool de threads, a inferência é feita em lotes
+# e os resultados são escritos em streaming (JSONL ou Parquet). Voltar a correr o mesmo
+# comando retoma o trabalho: as imagens que já têm resultado são ignoradas (as que ficaram
+# com erro só são repetidas com --retry-errors).
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp'}
+CONFIDENCE_THRESHOLD = 0.25
+BATCH_SIZE = 16
+ROW_GROUP_SIZE = 10000 # Linhas por row group no formato parquet
+
+
+# --- Recolha das entradas (geradores, para não ter milhões de caminhos em memória de uma vez) ---
+def is_image(path):
+    return os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+
+
+def iter_directory(directory):
+    for root, dirs, files in os.walk(directory):
+        dirs.sort() # Ordem determinística entre execuções
+        for name in sorted(files):
+            if is_image(name):
+                yield os.path.join(root, name)
+
+
+def iter_manifest(manifest_path):
+    # Um caminho por linha; linhas vazias e comentários (#) são ignorados
+    with open(manifest_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+
+def iter_inputs(patterns, manifests):
+    # Sem conjunto global de caminhos vistos: os repetidos são eliminados pelo índice em disco (DoneIndex)
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            yield from iter_directory(pattern)
+        elif glob.has_magic(pattern):
+            for path in glob.iglob(pattern, recursive=True):
+                if os.path.isdir(path):
+                    yield from iter_directory(path)
+                elif is_image(path):
+                    yield os.path.normpath(path)
+        else:
+            yield os.path.normpath(pattern)
+    for manifest in manifests:
+        for path in iter_manifest(manifest):
+            yield os.path.normpath(path)
+
+
+# --- Índice em disco das imagens já processadas (retoma) ---
+# Os caminhos ficam numa base SQLite ao lado da saída, e não num set em memória. É
+# reconstruído em cada execução a partir dos registos já escritos (lidos em streaming) e
+# serve também para ignorar entradas repetidas dentro da mesma execução.
+INDEX_COMMIT_EVERY = 10000 # Inserções por transação
+
+class DoneIndex:
+    def __init__(self, path):
+        self.path = path
+        for suffix in ('', '-journal'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix) # Índice de uma execução anterior; é sempre reconstruído
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA synchronous = OFF")
+        self._db.execute("CREATE TABLE done (path TEXT PRIMARY KEY, ok INTEGER NOT NULL)")
+        self._pending = 0
+
+    def _tick(self):
+        self._pending += 1
+        if self._pending >= INDEX_COMMIT_EVERY:
+            self._db.commit()
+            self._pending = 0
+
+    def load(self, records):
+        # records: pares (caminho, ok) dos resultados já escritos; um sucesso prevalece sobre um erro
+        count = 0
+        for path, ok in records:
+            self._db.execute("INSERT INTO done VALUES (?, ?) ON CONFLICT(path) DO UPDATE SET ok = MAX(ok, excluded.ok)",
+                             (path, int(ok)))
+            count += 1
+            self._tick()
+        self._db.commit()
+        return count
+
+    def claim(self, path, retry_errors=False):
+        # True se a imagem ainda tem de ser processada; marca-a para não ser repetida nesta execução
+        row = self._db.execute("SELECT ok FROM done WHERE path = ?", (path,)).fetchone()
+        if row is not None and not (retry_errors and row[0] == 0):
+            return False
+        self._db.execute("INSERT OR REPLACE INTO done VALUES (?, 2)", (path,)) # 2 = pedido nesta execução
+        self._tick()
+        return True
+
+    def counts(self):
+        ok, errors = self._db.execute("SELECT COALESCE(SUM(ok = 1), 0), COALESCE(SUM(ok = 0), 0) FROM done").fetchone()
+        return ok, errors
+
+    def close(self):
+        self._db.close()
+        for suffix in ('', '-journal'):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+
+# --- Escrita dos resultados ---
+class JsonlWriter:
+    def __init__(self, path):
+        self.path = path
+
+    def index_path(self):
+        return self.path + '.indice.sqlite'
+
+    def done_records(self):
+        # Gerador de (caminho, ok); ok é False para os registos com erro
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    yield record['path'], not record.get('error')
+                except (ValueError, KeyError):
+                    pass # Linha cortada de uma execução interrompida
+
+    def open(self):
+        # Garante que uma linha cortada no fim não se junta ao primeiro registo novo
+        needs_newline = False
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if needs_newline:
+            self._file.write('\n')
+        return self
+
+    def write(self, records):
+        for record in records:
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    # Cada execução escreve um novo ficheiro part-NNNNN.parquet dentro do diretório de saída.
+    # O rodapé só é escrito no close(): se o processo for morto sem passar pelo finally, o
+    # ficheiro dessa execução fica ilegível e as suas imagens são refeitas na retoma.
+    def __init__(self, directory):
+        try:
+            import pyarrow # noqa: F401
+        except ImportError:
+            sys.exit("Erro: o formato parquet precisa do pyarrow (pip install pyarrow)")
+        self.directory = directory
+
+    def _parts(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(os.path.join(self.directory, n) for n in os.listdir(self.directory)
+                      if n.startswith('part-') and n.endswith('.parquet'))
+
+    def index_path(self):
+        return os.path.normpath(self.directory) + '.indice.sqlite'
+
+    def done_records(self):
+        import pyarrow.parquet as pq
+        for part in self._parts():
+            try:
+                batches = pq.ParquetFile(part).iter_batches(columns=['path', 'error'])
+                for batch in batches:
+                    for path, error in zip(batch.column(0).to_pylist(), batch.column(1).to_pylist()):
+                        yield path, not error
+            except Exception:
+                pass # Ficheiro incompleto de uma execução interrompida
+
+    def open(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        os.makedirs(self.directory, exist_ok=True)
+        self._schema = pa.schema([
+            ('path', pa.string()),
+            ('width', pa.int32()),
+            ('height', pa.int32()),
+            ('error', pa.string()),
+            ('detections', pa.list_(pa.struct([
+                ('xyxy', pa.list_(pa.float32())),
+                ('label', pa.string()),
+                ('confidence', pa.float32()),
+                ('class_id', pa.int32()),
+            ]))),
+        ])
+        part = os.path.join(self.directory, f"part-{len(self._parts()):05d}.parquet")
+        self._writer = pq.ParquetWriter(part, self._schema)
+        self._pa = pa
+        self._rows = []
+        return self
+
+    def write(self, records):
+        # As linhas acumulam até ROW_GROUP_SIZE: um row group por lote de inferência ficaria minúsculo
+        self._rows.extend({'path': r['path'], 'width': r.get('width'), 'height': r.get('height'),
+                           'error': r.get('error'), 'detections': r.get('detections', [])} for r in records)
+        if len(self._rows) >= ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(self._pa.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+# --- Descodificação e inferência ---
+def decode_image(path):
+    img = cv2.imread(path)
+    if img is None:
+        return path, None
+    return path, img
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(model, decoded, conf, imgsz, device):
+    records = []
+    images = []
+    for path, img in decoded:
+        if img is None:
+            records.append({'path': path, 'error': 'falha ao ler a imagem'})
+        else:
+            records.append({'path': path, 'width': img.shape[1], 'height': img.shape[0], 'detections': []})
+            images.append(img)
+
+    if images:
+        ok_records = [r for r in records if 'error' not in r]
+        try:
+            results = model(images, verbose=False, conf=conf, imgsz=imgsz, device=device)
+        except Exception:
+            # Uma imagem que descodifica mas faz a inferência falhar não pode parar a execução:
+            # o lote é repetido imagem a imagem e só as que voltam a falhar ficam com erro
+            results = []
+            for record, img in zip(ok_records, images):
+                try:
+                    results.append(model([img], verbose=False, conf=conf, imgsz=imgsz, device=device)[0])
+                except Exception as e:
+                    record['error'] = f"falha na inferência: {type(e).__name__}: {e}"
+                    results.append(None)
+        for record, result in zip(ok_records, results):
+            if result is not None:
+                record['detections'] = Detections.from_result(result, model.names).to_dicts()
+    return records
+
+
+# --- Script Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deteção YOLOv8 em lote, sem interface gráfica e com retoma.")
+    parser.add_argument('inputs', nargs='*', help="Diretórios, ficheiros ou padrões glob (ex.: 'fotos/**/*.jpg')")
+    parser.add_argument('--manifest', action='append', default=[], help="Ficheiro com um caminho por linha (pode repetir)")
+    parser.add_argument('-o', '--output', required=True, help="Ficheiro .jsonl, ou diretório .parquet")
+    parser.add_argument('--format', choices=['jsonl', 'parquet'], default=None,
+                        help="Por omissão deduzido de --output (.jsonl, ou .parquet/diretório existente)")
+    parser.add_argument('--retry-errors', action='store_true', help="Volta a processar as imagens que ficaram com erro")
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--backend', choices=['auto', 'torch', 'onnxruntime', 'openvino'], default='auto', help="Ver backends.py")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4, help="Threads de descodificação")
+    parser.add_argument('--conf', type=float, default=CONFIDENCE_THRESHOLD)
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--device', default='cpu')
+    args = parser.parse_args()
+
+    if not args.inputs and not args.manifest:
+        parser.error("indique pelo menos uma entrada ou --manifest")
+
+    fmt = args.format
+    if fmt is None:
+        if args.output.lower().endswith('.jsonl'):
+            fmt = 'jsonl'
+        elif args.output.lower().rstrip('/\\').endswith('.parquet') or os.path.isdir(args.output):
+            fmt = 'parquet'
+        else:
+            parser.error(f"não sei o formato de '{args.output}': use .jsonl, um diretório .parquet ou --format")
+    writer = JsonlWriter(args.output) if fmt == 'jsonl' else ParquetWriter(args.output)
+
+    index = DoneIndex(writer.index_path())
+    if index.load(writer.done_records()):
+        ok, errors = index.counts()
+        action = "repetidas" if args.retry_errors else "ignoradas (use --retry-errors para as repetir)"
+        print(f"A retomar: {ok} imagens já têm resultado; {errors} com erro serão {action}.")
+    pending = (p for p in iter_inputs(args.inputs, args.manifest) if index.claim(p, args.retry_errors))
+
+    model = load_model(args.model, imgsz=args.imgsz, backend=args.backend)
+    writer.open()
+
+    processed = 0
+    failed = 0
+    start = time.time()
+    prefetch = deque()
+    batches = chunked(pending, max(1, args.batch_size))
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            # Mantém dois lotes a ser descodificados à frente do lote que está na inferência
+            for chunk in batches:
+                prefetch.append([pool.submit(decode_image, p) for p in chunk])
+                if len(prefetch) < 3:
+                    continue
+                records = run_batch(model, [f.result() for f in prefetch.popleft()], args.conf, args.imgsz, args.device)
+                writer.write(records)
+                processed += len(records)
+                failed += sum(1 for r in records if 'error' in r)
+                elapsed = time.time() - start
+                print(f"\r{processed} imagens ({processed / max(elapsed, 1e-6):.1f}/s), {failed} com erro", end='', flush=True)
+            while prefetch:
+                records = run_batch(model, [f.result() for f in prefetch.popleft()], args.conf, args.imgsz, args.device)
+                writer.write(records)
+                processed += len(records)
+                failed += sum(1 for r in records if 'error' in r)
+    except KeyboardInterrupt:
+        print("\nInterrompido; volte a correr o mesmo comando para retomar.")
+    finally:
+        writer.close()
+        index.close()
+
+    elapsed = time.time() - start
+    print(f"\nConcluído: {processed} imagens em {elapsed:.1f}s, {failed} com erro. Resultados em {args.output}")
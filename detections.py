@@ -0,0 +1,204 @@
+from collections.abc import Mapping, Sequence
+
+import numpy as np
+
+from spatial_index import GridIndex
+
+# --- Contentor colunar de deteções ---
+# Em vez de uma lista de dicionários criada caixa a caixa (várias conversões tensor -> Python
+# por deteção), os resultados de um frame ficam num único array numpy (N, 6):
+#   [x1, y1, x2, y2, confianca, classe]
+# obtido com uma só transferência a partir de result.boxes.data.
+# Indexar com um inteiro devolve uma vista "preguiçosa" da linha que se comporta como o
+# dicionário antigo (det['xyxy'], det['label'], det['confidence']), por isso o código de
+# desenho e os callbacks do rato funcionam sem alterações.
+# Opcionalmente cada linha tem um identificador de track (track_ids, -1 = sem track), ver tracker.py.
+
+COL_X1, COL_Y1, COL_X2, COL_Y2, COL_CONF, COL_CLS = range(6)
+
+
+class DetectionRow(Mapping):
+    __slots__ = ('_detections', '_index')
+
+    def __init__(self, detections, index):
+        self._detections = detections
+        self._index = index
+
+    def __getitem__(self, key):
+        row = self._detections.data[self._index]
+        if key == 'xyxy':
+            return row[:4].tolist()
+        if key == 'label':
+            return self._detections.label_of(row[COL_CLS])
+        if key == 'confidence':
+            return float(row[COL_CONF])
+        if key == 'class_id':
+            return int(row[COL_CLS])
+        if key == 'track_id':
+            return int(self._detections.track_ids[self._index])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(('xyxy', 'label', 'confidence', 'class_id', 'track_id'))
+
+    def __len__(self):
+        return 5
+
+    def __repr__(self):
+        return f"DetectionRow({dict(self)!r})"
+
+
+class Detections(Sequence):
+    def __init__(self, data=None, names=None, track_ids=None):
+        if data is None:
+            data = np.empty((0, 6), dtype=np.float32)
+        self.data = np.ascontiguousarray(data, dtype=np.float32).reshape(-1, 6)
+        self.names = names if names is not None else {}
+        if track_ids is None:
+            track_ids = np.full(len(self.data), -1, dtype=np.int64)
+        self.track_ids = np.asarray(track_ids, dtype=np.int64).reshape(-1)
+        self._index = None
+
+    # --- Construção ---
+    @classmethod
+    def from_result(cls, result, names=None):
+        # Uma única cópia GPU/CPU -> numpy para todas as caixas do frame
+        data = result.boxes.data
+        if hasattr(data, 'cpu'):
+            data = data.cpu().numpy()
+        data = np.asarray(data, dtype=np.float32)
+        track_ids = None
+        if data.ndim == 2 and data.shape[1] == 7: # Com tracking: [x1, y1, x2, y2, id, conf, cls]
+            track_ids = data[:, 4].astype(np.int64)
+            data = data[:, [0, 1, 2, 3, 5, 6]]
+        return cls(data, names if names is not None else getattr(result, 'names', None), track_ids)
+
+    @classmethod
+    def from_dicts(cls, dicts, names=None):
+        # Converte a lista de dicionários antiga; as classes são numeradas pela ordem das etiquetas
+        names = dict(names) if names is not None else {}
+        ids = {label: i for i, label in names.items()}
+        rows = []
+        for det in dicts:
+            label = det['label']
+            if 'class_id' in det:
+                class_id = det['class_id']
+            elif label in ids:
+                class_id = ids[label]
+            else:
+                class_id = len(names)
+                while class_id in names:
+                    class_id += 1
+                names[class_id] = label
+                ids[label] = class_id
+            rows.append(list(det['xyxy']) + [det['confidence'], class_id])
+        return cls(np.array(rows, dtype=np.float32).reshape(-1, 6), names)
+
+    @classmethod
+    def concatenate(cls, parts, names=None):
+        parts = list(parts)
+        if names is None:
+            names = parts[0].names if parts else {}
+        if not parts:
+            return cls(names=names)
+        return cls(np.concatenate([p.data for p in parts], axis=0), names,
+                   np.concatenate([p.track_ids for p in parts]))
+
+    # --- Colunas (vistas, sem cópia) ---
+    @property
+    def xyxy(self):
+        return self.data[:, :4]
+
+    @property
+    def conf(self):
+        return self.data[:, COL_CONF]
+
+    @property
+    def cls(self):
+        return self.data[:, COL_CLS]
+
+    @property
+    def areas(self):
+        return (self.data[:, COL_X2] - self.data[:, COL_X1]) * (self.data[:, COL_Y2] - self.data[:, COL_Y1])
+
+    def label_of(self, class_id):
+        class_id = int(class_id)
+        return self.names.get(class_id, str(class_id)) if isinstance(self.names, dict) else self.names[class_id]
+
+    # --- Interface de sequência ---
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            n = len(self)
+            if index < 0:
+                index += n
+            if not 0 <= index < n:
+                raise IndexError("índice de deteção fora do intervalo")
+            return DetectionRow(self, int(index))
+        # Fatias, máscaras booleanas e arrays de índices devolvem um novo contentor
+        return Detections(self.data[index], self.names, self.track_ids[index])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield DetectionRow(self, i)
+
+    def __repr__(self):
+        return f"Detections(n={len(self)})"
+
+    # --- Operações vetorizadas ---
+    def filter(self, min_conf=None, classes=None):
+        mask = np.ones(len(self), dtype=bool)
+        if min_conf is not None:
+            mask &= self.conf >= min_conf
+        if classes is not None:
+            ids = []
+            for c in classes:
+                if isinstance(c, str):
+                    ids.extend(k for k, v in self._names_items() if v == c)
+                else:
+                    ids.append(int(c))
+            mask &= np.isin(self.cls.astype(np.int64), ids)
+        return self[mask]
+
+    def topk(self, k):
+        # As k deteções de maior confiança, por ordem decrescente
+        if k >= len(self):
+            order = np.argsort(-self.conf, kind='stable')
+        else:
+            part = np.argpartition(-self.conf, k)[:k]
+            order = part[np.argsort(-self.conf[part], kind='stable')]
+        return self[order]
+
+    def contains_point(self, x, y):
+        # Máscara das caixas que contêm (x, y), com o mesmo critério estrito dos callbacks do rato
+        d = self.data
+        return (d[:, COL_X1] < x) & (x < d[:, COL_X2]) & (d[:, COL_Y1] < y) & (y < d[:, COL_Y2])
+
+    def spatial_index(self):
+        # Índice espacial construído na primeira consulta e reutilizado (os dados não mudam)
+        if self._index is None:
+            self._index = GridIndex.from_detections(self)
+        return self._index
+
+    def index_of_track(self, track_id):
+        # Índice da deteção com este identificador de track, ou -1
+        if track_id < 0:
+            return -1
+        hits = np.flatnonzero(self.track_ids == track_id)
+        return int(hits[0]) if hits.size else -1
+
+    def hit_test(self, x, y):
+        # Índice da caixa sob o ponto, ou -1; com sobreposição ganha a de menor área (ver spatial_index.py)
+        return self.spatial_index().query_point(x, y)
+
+    def to_dicts(self):
+        dicts = [dict(row) for row in self]
+        for d in dicts:
+            if d['track_id'] < 0: # Sem tracking: mantém o formato antigo
+                del d['track_id']
+        return dicts
+
+    def _names_items(self):
+        return self.names.items() if isinstance(self.names, dict) else enumerate(self.names)
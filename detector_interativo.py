@@ -1,19 +1,76 @@
 import cv2
-from ultralytics import YOLO
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from detections import Detections
+from renderer import LayeredRenderer, text_size
+from result_cache import DetectionCache, detect_cached
+from model_loader import BackgroundModel, resolve_model_path
+from tiling import TiledDetector, open_image
+from viewport import Viewport
+
+MODEL_PATH = 'yolov8n.pt'
+USE_EXPORTED_MODEL = True # Usa yolov8n.onnx / yolov8n.torchscript se existirem (ver model_loader.py)
+
+# --- Imagens muito grandes (ver tiling.py e viewport.py) ---
+TILED_MIN_SIDE = 4096 # A partir deste lado maior: deteção por mosaicos e vista com zoom/deslocamento
+VIEW_SIZE = (1280, 800) # Tamanho da janela no modo de imagem grande
+ZOOM_STEP = 1.25
+PAN_STEP = 200 # Píxeis da vista por tecla W/A/S/D
 
 # --- Variáveis Globais para a Interface ---
 img_display = None
 img_original_for_drawing = None # Usaremos uma cópia limpa da imagem original para desenhar a cada vez
-detections_list = []
+detections_list = Detections() # Contentor colunar (ver detections.py); cada linha comporta-se como um dicionário
 selected_box_index = -1
 
+# Modo de imagem grande: detections_list e img_original_for_drawing são os da vista atual;
+# all_detections tem as coordenadas da imagem original e view_indices liga as duas
+viewport = None
+all_detections = Detections()
+view_indices = np.empty(0, dtype=np.intp)
+selected_global = -1
+drag_last = None
+drag_moved = False
+
 COLOR_DEFAULT = (0, 255, 0) # Verde
 COLOR_SELECTED = (0, 0, 255) # Vermelho
 TEXT_COLOR_BOX = (255, 255, 255) # Branco para texto na caixa
 TEXT_COLOR_INFO = (0, 0, 0) # Preto para informações no canto (melhor contraste em fundo claro)
 INFO_BG_COLOR = (200, 200, 200, 100) # Cinza claro semi-transparente para fundo da info
 
+# --- Painel de informação no canto superior esquerdo (devolve o retângulo que ocupa) ---
+def draw_info_panel(img, selected_det):
+    if selected_det is not None:
+        selected_det = current_detection() # No modo de imagem grande mostra as coordenadas originais
+        info_text_l1 = f"Selecionado: {selected_det['label']}"
+        info_text_l2 = f"Confianca: {selected_det['confidence']:.2f}"
+        info_text_l3 = f"Coords (xyxy): {[int(c) for c in selected_det['xyxy']]}"
+
+        # Adiciona um fundo para melhor legibilidade
+        y_offset = 30
+        cv2.rectangle(img, (5, 5), (350, y_offset * 3 + 10), INFO_BG_COLOR, -1) # Fundo
+        cv2.putText(img, info_text_l1, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.7, TEXT_COLOR_INFO, 2, cv2.LINE_AA)
+        cv2.putText(img, info_text_l2, (10, y_offset * 2), cv2.FONT_HERSHEY_SIMPLEX, 0.7, TEXT_COLOR_INFO, 2, cv2.LINE_AA)
+        cv2.putText(img, info_text_l3, (10, y_offset * 3), cv2.FONT_HERSHEY_SIMPLEX, 0.7, TEXT_COLOR_INFO, 2, cv2.LINE_AA)
+        lines = [(info_text_l1, y_offset), (info_text_l2, y_offset * 2), (info_text_l3, y_offset * 3)]
+        right, bottom = 351, y_offset * 3 + 11
+    else:
+        cv2.rectangle(img, (5, 5), (250, 35), INFO_BG_COLOR, -1) # Fundo
+        cv2.putText(img, "Nenhum item selecionado", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, TEXT_COLOR_INFO, 2, cv2.LINE_AA)
+        lines = [("Nenhum item selecionado", 30)]
+        right, bottom = 251, 36
+
+    # O texto pode passar para fora do fundo; o retângulo devolvido cobre os dois
+    for text, y in lines:
+        (text_width, _), baseline = text_size(text, 0.7, 2)
+        right, bottom = max(right, 10 + text_width + 2), max(bottom, y + baseline + 2)
+    return (0, 0, right, bottom)
+
+
+# Renderizador por camadas: guarda a imagem e as etiquetas e, numa mudança de seleção,
+# só redesenha as zonas afetadas (ver renderer.py)
+renderer = LayeredRenderer(draw_info_panel, COLOR_DEFAULT, COLOR_SELECTED, TEXT_COLOR_BOX, label_scale=0.6)
+
 # --- Função para Desenhar as Deteções e Informações ---
 def draw_interface():
     global img_display, detections_list, selected_box_index, img_original_for_drawing
@@ -23,66 +80,73 @@ def draw_interface():
             cv2.imshow("Deteccoes YOLOv8 - Interativo", img_original_for_drawing)
         return
 
-    # Começa sempre com uma cópia limpa da imagem original
-    current_img_to_show = img_original_for_drawing.copy()
-
-    # Desenha todas as caixas delimitadoras
-    for i, det in enumerate(detections_list):
-        xyxy = det['xyxy']
-        label = det['label']
-        conf = det['confidence']
-        color = COLOR_SELECTED if i == selected_box_index else COLOR_DEFAULT
-
-        cv2.rectangle(current_img_to_show, (int(xyxy[0]), int(xyxy[1])), (int(xyxy[2]), int(xyxy[3])), color, 2)
-        text_on_box = f"{label}: {conf:.2f}"
-        (text_width, text_height), baseline = cv2.getTextSize(text_on_box, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 1)
-        cv2.rectangle(current_img_to_show, (int(xyxy[0]), int(xyxy[1]) - text_height - baseline), (int(xyxy[0]) + text_width, int(xyxy[1])), color, -1)
-        cv2.putText(current_img_to_show, text_on_box, (int(xyxy[0]), int(xyxy[1]) - baseline // 2), cv2.FONT_HERSHEY_SIMPLEX, 0.6, TEXT_COLOR_BOX, 1, cv2.LINE_AA)
-
-    # Desenha informações do item selecionado no canto superior esquerdo
-    if selected_box_index != -1 and selected_box_index < len(detections_list):
-        selected_det = detections_list[selected_box_index]
-        info_text_l1 = f"Selecionado: {selected_det['label']}"
-        info_text_l2 = f"Confianca: {selected_det['confidence']:.2f}"
-        info_text_l3 = f"Coords (xyxy): {[int(c) for c in selected_det['xyxy']]}"
+    # A imagem original limpa é a base; a partir do segundo desenho só a seleção é redesenhada
+    renderer.set_frame(img_original_for_drawing, detections_list)
+    img_display = renderer.render(selected_box_index)
 
-        # Adiciona um fundo para melhor legibilidade
-        y_offset = 30
-        cv2.rectangle(current_img_to_show, (5, 5), (350, y_offset * 3 + 10), INFO_BG_COLOR, -1) # Fundo
-        cv2.putText(current_img_to_show, info_text_l1, (10, y_offset), cv2.FONT_HERSHEY_SIMPLEX, 0.7, TEXT_COLOR_INFO, 2, cv2.LINE_AA)
-        cv2.putText(current_img_to_show, info_text_l2, (10, y_offset * 2), cv2.FONT_HERSHEY_SIMPLEX, 0.7, TEXT_COLOR_INFO, 2, cv2.LINE_AA)
-        cv2.putText(current_img_to_show, info_text_l3, (10, y_offset * 3), cv2.FONT_HERSHEY_SIMPLEX, 0.7, TEXT_COLOR_INFO, 2, cv2.LINE_AA)
-    else:
-        cv2.rectangle(current_img_to_show, (5, 5), (250, 35), INFO_BG_COLOR, -1) # Fundo
-        cv2.putText(current_img_to_show, "Nenhum item selecionado", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, TEXT_COLOR_INFO, 2, cv2.LINE_AA)
+    cv2.imshow("Deteccoes YOLOv8 - Interativo", img_display)
 
+# --- Modo de imagem grande: recompõe a vista e projeta as deteções ---
+def update_view():
+    global img_original_for_drawing, detections_list, view_indices, selected_box_index
+    img_original_for_drawing = viewport.render_base()
+    detections_list, view_indices = viewport.project(all_detections)
+    hits = np.flatnonzero(view_indices == selected_global)
+    selected_box_index = int(hits[0]) if hits.size else -1
+    draw_interface()
 
-    cv2.imshow("Deteccoes YOLOv8 - Interativo", current_img_to_show)
+def select_global(index):
+    global selected_global
+    selected_global = index
+    if index != -1:
+        viewport.center_on(all_detections.xyxy[index])
+    update_view()
 
 # --- Função de Callback do Rato ---
 def mouse_callback(event, x, y, flags, param):
-    global selected_box_index, detections_list
+    global selected_box_index, detections_list, selected_global, drag_last, drag_moved
+
+    if viewport is not None: # Roda: zoom; arrastar: deslocar; clique: selecionar
+        if event == cv2.EVENT_MOUSEWHEEL:
+            viewport.zoom_at(ZOOM_STEP if cv2.getMouseWheelDelta(flags) > 0 else 1 / ZOOM_STEP, x, y)
+            update_view()
+        elif event == cv2.EVENT_LBUTTONDOWN:
+            drag_last, drag_moved = (x, y), False
+        elif event == cv2.EVENT_MOUSEMOVE and drag_last is not None and flags & cv2.EVENT_FLAG_LBUTTON:
+            dx, dy = x - drag_last[0], y - drag_last[1]
+            if drag_moved or abs(dx) + abs(dy) > 3:
+                drag_last, drag_moved = (x, y), True
+                viewport.pan(dx, dy)
+                update_view()
+        elif event == cv2.EVENT_LBUTTONUP and drag_last is not None:
+            drag_last = None
+            if not drag_moved:
+                hit = detections_list.hit_test(x, y)
+                selected_global = int(view_indices[hit]) if hit != -1 else -1
+                update_view()
+                print_selected_info()
+        return
 
     if event == cv2.EVENT_LBUTTONDOWN:
-        clicked_on_box_this_time = False
-        for i, det in enumerate(detections_list):
-            xmin, ymin, xmax, ymax = det['xyxy']
-            if xmin < x < xmax and ymin < y < ymax:
-                selected_box_index = i
-                print_selected_info() # Função auxiliar para imprimir no console
-                clicked_on_box_this_time = True
-                break
-        if not clicked_on_box_this_time:
-            selected_box_index = -1
-            print_selected_info()
+        # Consulta o índice espacial (construído uma vez); com caixas sobrepostas ganha a mais pequena
+        selected_box_index = detections_list.hit_test(x, y)
+        print_selected_info() # Função auxiliar para imprimir no console
         draw_interface()
 
+# --- Deteção selecionada, em coordenadas da imagem original ---
+def current_detection():
+    if viewport is not None:
+        return all_detections[selected_global] if selected_global != -1 else None
+    if selected_box_index != -1 and selected_box_index < len(detections_list):
+        return detections_list[selected_box_index]
+    return None
+
 # --- Função para imprimir informações do selecionado no console ---
 def print_selected_info():
-    global selected_box_index, detections_list
-    if selected_box_index != -1 and selected_box_index < len(detections_list):
-        det = detections_list[selected_box_index]
-        print(f"\n--- Item Destacado (Índice: {selected_box_index}) ---")
+    det = current_detection()
+    if det is not None:
+        index = selected_global if viewport is not None else selected_box_index
+        print(f"\n--- Item Destacado (Índice: {index}) ---")
         print(f"  Classe: {det['label']}")
         print(f"  Confiança: {det['confidence']:.2f}")
         print(f"  Coordenadas (xyxy): {[int(c) for c in det['xyxy']]}")
@@ -91,42 +155,86 @@ def print_selected_info():
 
 # --- Script Principal ---
 if __name__ == "__main__":
-    model = YOLO('yolov8n.pt')
     caminho_imagem = 'minha_imagem.jpg'
 
-    img_bgr = cv2.imread(caminho_imagem)
-    if img_bgr is None:
+    # Imagens muito grandes não são carregadas inteiras: são lidas por janelas (ver tiling.py)
+    try:
+        source = open_image(caminho_imagem)
+    except OSError:
         print(f"Erro: Não foi possível carregar a imagem de '{caminho_imagem}'")
         exit()
-    img_original_for_drawing = img_bgr.copy() # Mantém uma cópia original limpa
-
-    print("Processando imagem com YOLO...")
-    results = model(caminho_imagem, verbose=False)
-    result = results[0]
-
-    for box in result.boxes:
-        detections_list.append({
-            'xyxy': box.xyxy[0].tolist(),
-            'label': model.names[int(box.cls[0].item())],
-            'confidence': box.conf[0].item()
-        })
-
-    print(f"Número de objetos detetados: {len(detections_list)}")
-    if not detections_list:
-        print("Nenhum objeto detetado.")
+    large_image = max(source.shape) >= TILED_MIN_SIDE
+    if large_image:
+        viewport = Viewport(source, VIEW_SIZE)
+        img_original_for_drawing = viewport.render_base()
     else:
-        print("Pressione 'N' para próximo, 'P' para anterior. Clique para selecionar.")
-        print("Pressione 'Q' ou ESC para sair.")
+        img_original_for_drawing = source.read(0, 0, source.shape[1], source.shape[0]).copy() # Cópia original limpa
+        source.close()
 
+    # A janela abre logo com a imagem; as deteções aparecem quando estiverem prontas
     cv2.namedWindow("Deteccoes YOLOv8 - Interativo")
     cv2.setMouseCallback("Deteccoes YOLOv8 - Interativo", mouse_callback)
-    draw_interface() # Desenha pela primeira vez
+    draw_interface() # Desenha pela primeira vez (ainda sem deteções)
+
+    print("Processando imagem com YOLO...")
+    # Cache por conteúdo da imagem + pesos + parâmetros; numa imagem já vista o modelo nem é carregado.
+    # Numa falha, o modelo é importado, carregado e aquecido em segundo plano.
+    cache = DetectionCache()
+    loader = BackgroundModel(resolve_model_path(MODEL_PATH) if USE_EXPORTED_MODEL else MODEL_PATH)
+    executor = ThreadPoolExecutor(max_workers=1)
+    tiler = TiledDetector(loader.get) if large_image else None
+    if large_image:
+        print(f"Imagem grande ({source.shape[1]}x{source.shape[0]}): deteção por mosaicos.")
+    # A fonte já aberta é partilhada com o tiler: a imagem não é lida/descodificada duas vezes
+    pending_detection = executor.submit(detect_cached, caminho_imagem, cache, loader.get, loader.model_path,
+                                        tiler=tiler, image_source=source if large_image else None)
 
     while True:
+        if pending_detection is not None and pending_detection.done():
+            detections_list, result = pending_detection.result()
+            pending_detection = None
+            if tiler is not None and tiler.last_stats:
+                stats = tiler.last_stats
+                print(f"{stats['mosaicos']} mosaicos em {stats['segundos']:.1f}s "
+                      f"({stats['caixas_brutas']} caixas antes da fusão).")
+            elif result is None:
+                print("Deteções lidas da cache.")
+            else:
+                print(f"Modelo {loader.model_path} carregado em {loader.load_seconds:.1f}s.")
+
+            print(f"Número de objetos detetados: {len(detections_list)}")
+            if not detections_list:
+                print("Nenhum objeto detetado.")
+            else:
+                print("Pressione 'N' para próximo, 'P' para anterior. Clique para selecionar.")
+                print("Pressione 'Q' ou ESC para sair.")
+            if viewport is not None:
+                all_detections = detections_list
+                print("Roda do rato ou +/-: zoom. Arrastar ou W/A/S/D: deslocar. F: imagem inteira.")
+                update_view()
+            else:
+                draw_interface()
+
         key = cv2.waitKey(1) & 0xFF
 
         if key == ord('q') or key == 27: # 'q' ou tecla ESC para sair
             break
+        elif viewport is not None: # Modo de imagem grande
+            if key in (ord('n'), ord('p')) and all_detections:
+                step = 1 if key == ord('n') else -1
+                select_global((selected_global + step) % len(all_detections) if selected_global != -1 else (0 if step == 1 else len(all_detections) - 1))
+                print_selected_info()
+            elif key in (ord('+'), ord('='), ord('-')):
+                viewport.zoom_at(ZOOM_STEP if key != ord('-') else 1 / ZOOM_STEP, VIEW_SIZE[0] / 2, VIEW_SIZE[1] / 2)
+                update_view()
+            elif key in (ord('w'), ord('a'), ord('s'), ord('d')):
+                dx = {ord('a'): PAN_STEP, ord('d'): -PAN_STEP}.get(key, 0)
+                dy = {ord('w'): PAN_STEP, ord('s'): -PAN_STEP}.get(key, 0)
+                viewport.pan(dx, dy)
+                update_view()
+            elif key == ord('f'):
+                viewport.fit()
+                update_view()
         elif key == ord('n'): # Tecla 'N' para próximo
             if detections_list: # Só faz algo se houver deteções
                 selected_box_index = (selected_box_index + 1) % len(detections_list)
@@ -140,4 +248,7 @@ if __name__ == "__main__":
                 print_selected_info()
                 draw_interface()
 
+    executor.shutdown(wait=False)
+    if viewport is not None:
+        source.close()
     cv2.destroyAllWindows()
\ No newline at end of file
@@ -0,0 +1,306 @@
+import cProfile
+import json
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# --- Métricas de latência e débito do ciclo de deteção ---
+# Tempos por etapa com percentis (p50/p95/p99) sobre uma janela móvel, contadores
+# (ex.: frames descartados), FPS medido sobre os últimos segundos e exportação
+# como log JSON periódico ou texto no formato do Prometheus num endpoint HTTP.
+# Inclui também a captura de um perfil (cProfile ou pyinstrument) de N frames a pedido.
+
+WINDOW = 1024 # Amostras guardadas por etapa para os percentis
+QUANTILES = (0.5, 0.95, 0.99)
+FPS_WINDOW = 2.0 # Segundos usados no cálculo do FPS
+
+
+class RollingHistogram:
+    def __init__(self, window=WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def quantiles(self, qs=QUANTILES):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return {q: 0.0 for q in qs}
+        return {q: samples[min(int(q * len(samples)), len(samples) - 1)] for q in qs}
+
+
+class Metrics:
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+        self._frame_times = deque()
+        self._lock = threading.Lock()
+        self._profile_active = False # Perfil pedido e ainda a contar frames
+        self._profile_running = 0 # Threads com o perfilador ligado
+        self._profile_remaining = 0
+        self._profile_path = None
+        self._profile_kind = None
+        self._profile_counting = False
+        self._profile_results = []
+        self._thread_profile = threading.local()
+        self.last_profile = None # Caminho do último perfil gravado
+
+    # --- Registo ---
+    def _stage(self, name):
+        hist = self._stages.get(name)
+        if hist is None:
+            with self._lock:
+                hist = self._stages.setdefault(name, RollingHistogram(self.window))
+        return hist
+
+    def observe(self, name, seconds):
+        self._stage(name).observe(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - t0)
+
+    def inc(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def set_counter(self, name, value):
+        # Para contadores mantidos noutro sítio (ex.: filas do pipeline)
+        with self._lock:
+            self._counters[name] = value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    # Chamado uma vez por frame mostrado; também avança o perfil pedido, se houver
+    def mark_frame(self):
+        now = time.perf_counter()
+        with self._lock:
+            self._frame_times.append(now)
+            while self._frame_times and now - self._frame_times[0] > FPS_WINDOW:
+                self._frame_times.popleft()
+        self.inc('frames')
+        self._profile_tick()
+
+    def fps(self):
+        with self._lock:
+            if len(self._frame_times) < 2:
+                return 0.0
+            span = self._frame_times[-1] - self._frame_times[0]
+            return (len(self._frame_times) - 1) / span if span > 0 else 0.0
+
+    # --- Exportação ---
+    def snapshot(self):
+        stages = {}
+        for name, hist in list(self._stages.items()):
+            q = hist.quantiles()
+            stages[name] = {
+                'count': hist.count,
+                'mean_ms': hist.total / hist.count * 1000 if hist.count else 0.0,
+                'p50_ms': q[0.5] * 1000,
+                'p95_ms': q[0.95] * 1000,
+                'p99_ms': q[0.99] * 1000,
+            }
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        return {'time': time.time(), 'fps': self.fps(), 'stages': stages, 'counters': counters, 'gauges': gauges}
+
+    def to_prometheus(self, prefix='irrad'):
+        lines = [f"# TYPE {prefix}_stage_seconds summary"]
+        for name, hist in list(self._stages.items()):
+            for q, v in hist.quantiles().items():
+                lines.append(f'{prefix}_stage_seconds{{stage="{name}",quantile="{q}"}} {v:.6f}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {hist.total:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{name}"}} {hist.count}')
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+        lines.append(f"# TYPE {prefix}_events_total counter")
+        for name, value in counters.items():
+            lines.append(f'{prefix}_events_total{{name="{name}"}} {value}')
+        lines.append(f"# TYPE {prefix}_fps gauge")
+        lines.append(f"{prefix}_fps {self.fps():.3f}")
+        for name, value in gauges.items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        snap = self.snapshot()
+        lines = [f"FPS: {snap['fps']:.1f}"]
+        for name, s in snap['stages'].items():
+            lines.append(f"  {name}: n={s['count']} p50={s['p50_ms']:.1f}ms p95={s['p95_ms']:.1f}ms p99={s['p99_ms']:.1f}ms")
+        for name, value in snap['counters'].items():
+            lines.append(f"  {name}: {value}")
+        return "\n".join(lines)
+
+    # Escreve uma linha JSON com o snapshot a cada interval segundos (thread em segundo plano)
+    def start_json_log(self, path, interval=10.0):
+        stop = threading.Event()
+        def loop():
+            while not stop.wait(interval):
+                with open(path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(self.snapshot()) + '\n')
+        threading.Thread(target=loop, name='metricas-json', daemon=True).start()
+        return stop
+
+    # Serve /metrics (Prometheus) e /metrics.json; /profile?frames=N pede um perfil de N frames
+    def start_http_server(self, port, host='127.0.0.1'):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == '/metrics':
+                    body, ctype = metrics.to_prometheus(), 'text/plain; version=0.0.4'
+                elif url.path == '/metrics.json':
+                    body, ctype = json.dumps(metrics.snapshot()), 'application/json'
+                elif url.path == '/profile':
+                    try:
+                        frames = int(parse_qs(url.query).get('frames', ['100'])[0])
+                    except ValueError:
+                        self.send_error(400, "frames deve ser um inteiro")
+                        return
+                    if frames <= 0:
+                        self.send_error(400, "frames deve ser positivo")
+                        return
+                    path = metrics.profile_frames(frames)
+                    body, ctype = json.dumps({'frames': frames, 'output': path}), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass # Sem uma linha na consola por pedido
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='metricas-http', daemon=True).start()
+        return server
+
+    # --- Perfil a pedido ---
+    # Perfila os próximos n frames (contados por mark_frame()). Cada thread que chama
+    # mark_frame() ou profile_point() tem o seu perfilador: a thread principal e, por exemplo, a
+    # thread de inferência do pipeline (ver pipeline.py), onde está a chamada ao modelo. No fim os
+    # perfis de todas as threads são juntos num só ficheiro, gravado pela última thread a parar.
+    # Em Python 3.12+ o cProfile já vê todas as threads e só há um perfilador.
+    # kind: 'cprofile' (sempre disponível) ou 'pyinstrument' (se estiver instalado).
+    def profile_frames(self, n, path=None, kind='cprofile'):
+        if kind == 'pyinstrument':
+            try:
+                import pyinstrument # noqa: F401
+            except ImportError:
+                print("pyinstrument não está instalado; a usar cProfile")
+                kind = 'cprofile'
+        with self._lock:
+            if self._profile_active or self._profile_running:
+                return self._profile_path # Já há um perfil em curso
+            if path is None:
+                ext = 'html' if kind == 'pyinstrument' else 'prof'
+                path = f"perfil_{time.strftime('%Y%m%d_%H%M%S')}.{ext}"
+            self._profile_remaining = n
+            self._profile_path = path
+            self._profile_kind = kind
+            self._profile_active = True
+            self._profile_counting = False
+            self._profile_results = []
+        return path
+
+    # Chamado uma vez por iteração pelas threads de trabalho que devem entrar no perfil
+    def profile_point(self):
+        if not self._profile_active and getattr(self._thread_profile, 'profiler', None) is None:
+            return
+        profiler = getattr(self._thread_profile, 'profiler', None)
+        if self._profile_active and profiler is None:
+            self._start_thread_profiler()
+        elif not self._profile_active and profiler is not None:
+            self._stop_thread_profiler()
+
+    def _start_thread_profiler(self):
+        try:
+            if self._profile_kind == 'pyinstrument':
+                from pyinstrument import Profiler
+                profiler = Profiler()
+                profiler.start()
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+        except (ValueError, RuntimeError):
+            return # Outro perfilador já cobre esta thread (cProfile em Python 3.12+)
+        self._thread_profile.profiler = profiler
+        with self._lock:
+            self._profile_running += 1
+
+    def _stop_thread_profiler(self):
+        profiler = self._thread_profile.profiler
+        self._thread_profile.profiler = None
+        if self._profile_kind == 'pyinstrument':
+            result = profiler.stop()
+        else:
+            profiler.disable()
+            result = profiler
+        with self._lock:
+            self._profile_results.append(result)
+            self._profile_running -= 1
+            last = self._profile_running == 0
+        if last:
+            self._write_profile()
+
+    def _write_profile(self):
+        results, path = self._profile_results, self._profile_path
+        if self._profile_kind == 'pyinstrument':
+            from pyinstrument.renderers import HTMLRenderer
+            from pyinstrument.session import Session
+            session = results[0]
+            for other in results[1:]:
+                session = Session.combine(session, other)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(HTMLRenderer().render(session))
+        else:
+            stats = pstats.Stats(results[0])
+            for other in results[1:]:
+                stats.add(other)
+            stats.dump_stats(path)
+            stats.sort_stats('cumulative').print_stats(15)
+        print(f"Perfil gravado em {path} ({len(results)} thread(s))")
+        self.last_profile = path
+        self._profile_results = []
+
+    def _profile_tick(self):
+        # Conta os frames do perfil pedido (só na thread de mark_frame) e trata do perfilador desta thread
+        if self._profile_active:
+            with self._lock:
+                if not self._profile_counting: # O primeiro frame só liga os perfiladores
+                    self._profile_counting = True
+                else:
+                    self._profile_remaining -= 1
+                    if self._profile_remaining <= 0:
+                        self._profile_active = False
+        self.profile_point()
+
+
+REGISTRY = Metrics() # Registo partilhado pelos scripts
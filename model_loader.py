@@ -0,0 +1,104 @@
+import argparse
+import os
+import threading
+import time
+
+import numpy as np
+
+# --- Carregamento do modelo sem bloquear o arranque ---
+# O import do ultralytics (e do torch) é pesado, por isso só é feito quando o modelo é mesmo
+# preciso. BackgroundModel carrega e aquece o modelo numa thread, para que a janela possa abrir
+# logo com a imagem. Se existir um artefacto já exportado ao lado do .pt (yolov8n.onnx ou
+# yolov8n.torchscript) resolve_model_path() prefere-o: arranca mais depressa nas máquinas sem GPU.
+# O backend de inferência (PyTorch, ONNX Runtime ou OpenVINO) é escolhido em backends.py.
+#   python model_loader.py yolov8n.pt --export onnx
+
+EXPORTED_EXTENSIONS = {'onnx': '.onnx', 'openvino': '_openvino_model', 'torchscript': '.torchscript'}
+PREFERRED_FORMATS = ('onnx', 'openvino', 'torchscript')
+WARMUP_IMGSZ = 640
+
+
+def resolve_model_path(model_path, prefer=PREFERRED_FORMATS):
+    base, ext = os.path.splitext(model_path)
+    if ext != '.pt':
+        return model_path
+    for fmt in prefer:
+        candidate = base + EXPORTED_EXTENSIONS[fmt]
+        if os.path.exists(candidate):
+            return candidate
+    return model_path
+
+
+def load_model(model_path, warmup=True, imgsz=WARMUP_IMGSZ, backend='auto'):
+    from backends import create_backend # O ultralytics só é importado pelo backend torch
+    model = create_backend(model_path, backend, imgsz)
+    if warmup:
+        # A primeira inferência inicializa o backend; fazê-la aqui tira esse custo do primeiro frame real
+        model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), verbose=False, imgsz=imgsz)
+    return model
+
+
+class BackgroundModel:
+    def __init__(self, model_path, warmup=True, imgsz=WARMUP_IMGSZ, backend='auto'):
+        self.model_path = model_path
+        self.backend = backend
+        self.warmup = warmup
+        self.imgsz = imgsz
+        self.error = None
+        self.load_seconds = None
+        self._model = None
+        self._ready = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name='carregar-modelo', daemon=True)
+                self._thread.start()
+        return self
+
+    def _load(self):
+        t0 = time.perf_counter()
+        try:
+            self._model = load_model(self.model_path, self.warmup, self.imgsz, self.backend)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.load_seconds = time.perf_counter() - t0
+            self._ready.set()
+
+    def ready(self):
+        return self._ready.is_set()
+
+    # Devolve o modelo, esperando pelo carregamento (que começa agora se ainda não começou)
+    def get(self, timeout=None):
+        self.start()
+        if not self._ready.wait(timeout):
+            raise TimeoutError(f"O modelo {self.model_path} não carregou em {timeout}s")
+        if self.error is not None:
+            raise self.error
+        return self._model
+
+
+def export_model(model_path, fmt, imgsz=WARMUP_IMGSZ, **kwargs):
+    from ultralytics import YOLO
+    return YOLO(model_path).export(format=fmt, imgsz=imgsz, **kwargs)
+
+
+# --- Script Principal: exportar um artefacto para arranque rápido ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta um modelo YOLOv8 para ONNX/TorchScript e mede o arranque.")
+    parser.add_argument('model', nargs='?', default='yolov8n.pt')
+    parser.add_argument('--export', choices=sorted(EXPORTED_EXTENSIONS), help="Formato a exportar")
+    parser.add_argument('--imgsz', type=int, default=WARMUP_IMGSZ)
+    parser.add_argument('--backend', choices=['auto', 'torch', 'onnxruntime', 'openvino'], default='auto', help="Ver backends.py")
+    args = parser.parse_args()
+
+    if args.export:
+        print(f"Exportado para {export_model(args.model, args.export, args.imgsz)}")
+
+    path = resolve_model_path(args.model)
+    t0 = time.perf_counter()
+    load_model(path, imgsz=args.imgsz, backend=args.backend)
+    print(f"{path}: carregado e aquecido em {time.perf_counter() - t0:.2f}s")
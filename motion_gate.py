@@ -0,0 +1,279 @@
+import cv2
+import numpy as np
+
+from detections import Detections
+from metrics import REGISTRY
+from tiling import merge_detections
+
+# --- Inferência condicionada ao movimento e a regiões de interesse ---
+# Antes de chamar o modelo compara-se uma miniatura do frame em tons de cinzento com a do
+# último frame que passou pelo modelo (ou usa-se um modelo de fundo MOG2):
+#   - nada mudou          -> o modelo não corre e reutilizam-se as últimas deteções;
+#   - mudou só uma parte  -> os recortes à volta das zonas com movimento são juntos num mosaico,
+#                            que passa pelo modelo numa só chamada, e as deteções antigas fora
+#                            dessas zonas mantêm-se; se o mosaico não for mais pequeno do que o
+#                            frame, corre o frame inteiro (nunca mais de uma chamada por frame);
+#   - mudou quase tudo    -> inferência no frame inteiro.
+# Com regiões de interesse definidas (rois) só o movimento dentro delas conta e o modelo
+# nunca vê o resto do frame. A cada max_skipped frames parados há uma inferência completa,
+# para não ficar com deteções antigas indefinidamente. As chamadas ao modelo e a área enviada
+# ao modelo vão para os contadores gate_* do REGISTRY (ver metrics.py).
+
+GATE_WIDTH = 160 # Largura da miniatura usada para detetar movimento
+DIFF_THRESHOLD = 25 # Diferença (0-255) a partir da qual um píxel da miniatura conta como mudado
+MIN_CHANGED_FRACTION = 0.002 # Fração mínima de píxeis mudados para correr o modelo
+ROI_PADDING = 32 # Margem (píxeis do frame) à volta de cada zona com movimento
+MAX_ROI_FRACTION = 0.6 # Acima desta fração do frame, mais vale inferir no frame inteiro
+MAX_ROIS = 4 # Mais zonas do que isto são juntas numa só
+MAX_SKIPPED = 150
+MOSAIC_GAP = 16 # Separação entre recortes no mosaico, para as caixas não passarem de um para outro
+MOSAIC_FILL = 114 # Cinzento do letterbox do YOLO
+
+
+def _merge_rects(rects):
+    # Junta retângulos que se sobrepõem até não haver sobreposições
+    rects = [list(r) for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    del rects[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [tuple(r) for r in rects]
+
+
+def _intersects_any(xyxy, rects):
+    if not len(rects):
+        return np.zeros(len(xyxy), dtype=bool)
+    r = np.asarray(rects, dtype=np.float32)
+    return ((xyxy[:, None, 0] < r[None, :, 2]) & (xyxy[:, None, 2] > r[None, :, 0]) &
+            (xyxy[:, None, 1] < r[None, :, 3]) & (xyxy[:, None, 3] > r[None, :, 1])).any(axis=1)
+
+
+def _contains_any(points, rects):
+    if not len(rects):
+        return np.zeros(len(points), dtype=bool)
+    r = np.asarray(rects, dtype=np.float32)
+    return ((points[:, None, 0] >= r[None, :, 0]) & (points[:, None, 0] < r[None, :, 2]) &
+            (points[:, None, 1] >= r[None, :, 1]) & (points[:, None, 1] < r[None, :, 3])).any(axis=1)
+
+
+# --- Mosaico de recortes: uma só imagem, uma só chamada ao modelo ---
+def pack_mosaic(frame, rects, gap=MOSAIC_GAP):
+    # Arruma os recortes em prateleiras com a largura do frame. Devolve (mosaico, posições) ou None
+    # se o mosaico não ficar mais pequeno do que o frame (aí o frame inteiro custa o mesmo ou menos)
+    h, w = frame.shape[:2]
+    placements = [None] * len(rects)
+    x = y = shelf_h = canvas_w = 0
+    for i in sorted(range(len(rects)), key=lambda i: rects[i][1] - rects[i][3]): # Mais altos primeiro
+        rw, rh = rects[i][2] - rects[i][0], rects[i][3] - rects[i][1]
+        if x and x + rw > w:
+            y += shelf_h + gap
+            x = shelf_h = 0
+        placements[i] = (x, y)
+        canvas_w = max(canvas_w, x + rw)
+        x += rw + gap
+        shelf_h = max(shelf_h, rh)
+    canvas_h = y + shelf_h
+    if canvas_h > h or canvas_w * canvas_h >= w * h:
+        return None
+    canvas = np.full((canvas_h, canvas_w) + frame.shape[2:], MOSAIC_FILL, dtype=frame.dtype)
+    for (x1, y1, x2, y2), (px, py) in zip(rects, placements):
+        canvas[py:py + y2 - y1, px:px + x2 - x1] = frame[y1:y2, x1:x2]
+    return canvas, placements
+
+
+def unpack_mosaic(data, rects, placements):
+    # Caixas do mosaico -> frame: cada caixa pertence ao recorte que contém o seu centro
+    # (as que caem na separação são descartadas) e é recortada aos limites desse recorte
+    parts = []
+    centers = (data[:, :2] + data[:, 2:4]) / 2
+    for (x1, y1, x2, y2), (px, py) in zip(rects, placements):
+        pw, ph = x2 - x1, y2 - y1
+        inside = ((centers[:, 0] >= px) & (centers[:, 0] < px + pw) &
+                  (centers[:, 1] >= py) & (centers[:, 1] < py + ph))
+        part = data[inside].copy()
+        part[:, [0, 2]] = part[:, [0, 2]].clip(px, px + pw) - px + x1
+        part[:, [1, 3]] = part[:, [1, 3]].clip(py, py + ph) - py + y1
+        parts.append(part)
+    return np.concatenate(parts) if parts else np.empty((0, 6), dtype=np.float32)
+
+
+class MotionGate:
+    # method: 'diff' (diferença para o último frame inferido) ou 'mog2' (subtração de fundo)
+    # rois: lista de (x1, y1, x2, y2) em píxeis do frame, ou None para o frame inteiro
+    def __init__(self, method='diff', rois=None, width=GATE_WIDTH, diff_threshold=DIFF_THRESHOLD,
+                 min_changed_fraction=MIN_CHANGED_FRACTION, roi_padding=ROI_PADDING,
+                 max_roi_fraction=MAX_ROI_FRACTION, max_rois=MAX_ROIS):
+        if method not in ('diff', 'mog2'):
+            raise ValueError(f"Método inválido: {method!r} (use 'diff' ou 'mog2')")
+        self.method = method
+        self.rois = [tuple(int(v) for v in r) for r in rois] if rois else None
+        self.width = width
+        self.diff_threshold = diff_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.roi_padding = roi_padding
+        self.max_roi_fraction = max_roi_fraction
+        self.max_rois = max_rois
+        self._reference = None
+        self._small_frame = None
+        self._roi_mask = None
+        self._kernel = np.ones((3, 3), dtype=np.uint8)
+        self._subtractor = (cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16, detectShadows=False)
+                            if method == 'mog2' else None)
+
+    def _small(self, frame):
+        h, w = frame.shape[:2]
+        scale = self.width / w
+        small = cv2.resize(frame, (self.width, max(1, int(round(h * scale)))), interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0), scale
+
+    def _user_mask(self, shape, scale):
+        if self._roi_mask is None or self._roi_mask.shape != shape:
+            self._roi_mask = np.zeros(shape, dtype=np.uint8)
+            for x1, y1, x2, y2 in self.rois:
+                self._roi_mask[int(y1 * scale):int(np.ceil(y2 * scale)), int(x1 * scale):int(np.ceil(x2 * scale))] = 1
+        return self._roi_mask
+
+    def full_rects(self, frame):
+        # Regiões inferidas numa inferência "completa": o frame inteiro ou as rois do utilizador
+        h, w = frame.shape[:2]
+        if self.rois is None:
+            return [(0, 0, w, h)]
+        # Rois sobrepostas juntam-se: cada píxel só é enviado ao modelo uma vez
+        return _merge_rects([(max(x1, 0), max(y1, 0), min(x2, w), min(y2, h)) for x1, y1, x2, y2 in self.rois])
+
+    # Devolve ('skip', []), ('full', retângulos) ou ('crop', retângulos), em píxeis do frame
+    def decide(self, frame):
+        h, w = frame.shape[:2]
+        small, scale = self._small(frame)
+        self._small_frame = small
+        if self._subtractor is not None:
+            motion = (self._subtractor.apply(small) > 0).astype(np.uint8)
+        elif self._reference is None or self._reference.shape != small.shape:
+            return 'full', self.full_rects(frame)
+        else:
+            motion = (cv2.absdiff(small, self._reference) > self.diff_threshold).astype(np.uint8)
+        area = motion.size
+        if self.rois is not None:
+            mask = self._user_mask(motion.shape, scale)
+            motion &= mask
+            area = max(int(mask.sum()), 1)
+        motion = cv2.morphologyEx(motion, cv2.MORPH_OPEN, self._kernel) # Remove ruído de píxeis isolados
+        if cv2.countNonZero(motion) < self.min_changed_fraction * area:
+            return 'skip', []
+
+        n, _, stats, _ = cv2.connectedComponentsWithStats(motion, connectivity=8)
+        pad = self.roi_padding
+        rects = []
+        for x, y, bw, bh, _ in stats[1:]: # A componente 0 é o fundo
+            rects.append((max(int(x / scale) - pad, 0), max(int(y / scale) - pad, 0),
+                          min(int(np.ceil((x + bw) / scale)) + pad, w), min(int(np.ceil((y + bh) / scale)) + pad, h)))
+        if self.rois is not None: # Os recortes nunca saem das rois do utilizador
+            rects = [(max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+                     for a in rects for b in self.full_rects(frame)]
+            rects = [r for r in rects if r[0] < r[2] and r[1] < r[3]]
+        rects = _merge_rects(rects)
+        if len(rects) > self.max_rois:
+            rects = [(min(r[0] for r in rects), min(r[1] for r in rects), max(r[2] for r in rects), max(r[3] for r in rects))]
+        if sum((r[2] - r[0]) * (r[3] - r[1]) for r in rects) > self.max_roi_fraction * w * h:
+            return 'full', self.full_rects(frame)
+        return 'crop', rects
+
+    # Chamado depois de o modelo correr: o frame inferido passa a ser a referência
+    def commit(self):
+        if self._small_frame is not None:
+            self._reference = self._small_frame
+
+
+class GatedDetector:
+    # detect_fn(frame) -> Detections, tal como em KeyframeDetector (ver tracker.py)
+    def __init__(self, detect_fn, gate=None, max_skipped=MAX_SKIPPED, metrics=REGISTRY):
+        self.detect_fn = detect_fn
+        self.gate = gate if gate is not None else MotionGate()
+        self.max_skipped = max_skipped
+        self.metrics = metrics
+        self.last = None
+        self.frames = 0
+        self.skipped = 0
+        self.cropped = 0
+        self.model_calls = 0
+        self.pixels_total = 0
+        self.pixels_inferred = 0
+        self._skipped_in_row = 0
+
+    def _detect_mosaic(self, frame, rects):
+        # Uma só chamada ao modelo para todos os recortes; None se o mosaico não compensa
+        packed = pack_mosaic(frame, rects)
+        if packed is None:
+            return None
+        canvas, placements = packed
+        detections = self.detect_fn(canvas)
+        data = unpack_mosaic(detections.data, rects, placements)
+        if len(rects) > 1: # Um objeto entre recortes vizinhos pode aparecer nos dois
+            data = merge_detections(data, mode='nms')
+        return data, detections.names, canvas.shape[0] * canvas.shape[1]
+
+    def __call__(self, frame):
+        h, w = frame.shape[:2]
+        total = h * w
+        self.frames += 1
+        self.pixels_total += total
+        self.metrics.inc('gate_frames')
+        self.metrics.inc('gate_pixels', total)
+        action, rects = self.gate.decide(frame)
+        if self.last is None or (action == 'skip' and self._skipped_in_row >= self.max_skipped):
+            action, rects = 'full', self.gate.full_rects(frame)
+
+        if action == 'skip':
+            self._skipped_in_row += 1
+            self.skipped += 1
+            self.metrics.inc('gate_frames_saltados')
+            self.metrics.inc('gate_pixels_saltados', total)
+            return self.last
+
+        self._skipped_in_row = 0
+        packed = None
+        if not (action == 'full' and self.gate.rois is None):
+            packed = self._detect_mosaic(frame, rects)
+        if packed is None: # Frame inteiro: mais barato do que o mosaico, ou sem rois
+            detections = self.detect_fn(frame)
+            data, names, inferred = detections.data, detections.names, total
+            if action == 'crop' or self.gate.rois is not None:
+                # O modelo viu o frame todo, mas só contam as zonas pedidas; em 'crop' o resto
+                # vem de self.last e não pode aparecer duas vezes
+                centers = (data[:, :2] + data[:, 2:4]) / 2
+                data = data[_contains_any(centers, rects)]
+        else:
+            data, names, inferred = packed
+        if action == 'crop':
+            self.cropped += 1
+            self.metrics.inc('gate_frames_recortados')
+            # As deteções antigas fora das zonas que mudaram continuam válidas
+            keep = ~_intersects_any(self.last.xyxy, rects)
+            data = np.concatenate([self.last.data[keep], data])
+            names = names if names is not None else self.last.names
+        detections = Detections(data, names)
+        self.model_calls += 1
+        self.pixels_inferred += inferred
+        self.metrics.inc('gate_chamadas_modelo')
+        self.metrics.inc('gate_pixels_inferidos', inferred)
+        self.metrics.inc('gate_pixels_saltados', max(total - inferred, 0))
+        self.gate.commit()
+        self.last = detections
+        return detections
+
+    def summary(self):
+        # A poupança conta-se em chamadas ao modelo e em área enviada ao modelo, não em píxeis da fonte
+        area = 100.0 * self.pixels_inferred / self.pixels_total if self.pixels_total else 0.0
+        return (f"chamadas ao modelo={self.model_calls}/{self.frames} frames (saltados={self.skipped}, "
+                f"recortados={self.cropped}) area enviada ao modelo={area:.1f}%")
@@ -0,0 +1,224 @@
+import argparse
+import threading
+import time
+
+import cv2
+
+from detections import Detections
+from model_loader import load_model
+
+# --- Inferência em lote para várias câmaras com um único modelo ---
+# Cada fonte (webcam, RTSP ou ficheiro) tem uma thread de leitura que guarda apenas o frame mais recente.
+# O motor junta os frames novos de várias fontes num lote de tamanho dinâmico (até max_batch),
+# espera no máximo max_wait segundos para o completar e faz uma só passagem do modelo.
+# Os resultados voltam para a lista de deteções de cada fonte.
+
+CONFIDENCE_THRESHOLD = 0.4
+MAX_BATCH = 16 # Número máximo de frames por passagem do modelo
+MAX_WAIT = 0.02 # Tempo máximo (s) à espera de mais frames depois do primeiro chegar
+
+
+# --- Uma fonte de vídeo lida numa thread própria ---
+class StreamSource:
+    def __init__(self, stream_id, source, new_frame_event):
+        self.stream_id = stream_id
+        self.source = source
+        self.cap = cv2.VideoCapture(source)
+        if not self.cap.isOpened():
+            raise IOError(f"Não foi possível abrir a fonte de vídeo: {source}")
+        self.detections = Detections() # Deteções do último frame processado desta fonte
+        self.last_frame = None # Último frame processado (o que corresponde a self.detections)
+        self.ended = False
+        self.frames_read = 0
+        self.frames_processed = 0
+        self._latest = None
+        self._latest_seq = 0
+        self._taken_seq = 0
+        self._lock = threading.Lock()
+        self._new_frame_event = new_frame_event
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._read_loop, name=f"fonte-{stream_id}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        self.cap.release()
+
+    def _read_loop(self):
+        while not self._stop.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                self.ended = True
+                self._new_frame_event.set() # Acorda o motor para ele reparar no fim
+                return
+            with self._lock:
+                self._latest = frame # Frames não consumidos a tempo são simplesmente substituídos
+                self._latest_seq += 1
+                self.frames_read += 1
+            self._new_frame_event.set()
+
+    def has_new_frame(self):
+        with self._lock:
+            return self._latest_seq > self._taken_seq
+
+    # Devolve o frame mais recente ainda não consumido, ou None
+    def take_latest(self):
+        with self._lock:
+            if self._latest_seq == self._taken_seq:
+                return None
+            self._taken_seq = self._latest_seq
+            return self._latest
+
+    def dropped_frames(self):
+        with self._lock:
+            return self.frames_read - self.frames_processed
+
+
+# --- Motor de lotes partilhando um modelo ---
+class MultiStreamEngine:
+    def __init__(self, model, sources, max_batch=MAX_BATCH, max_wait=MAX_WAIT, conf=CONFIDENCE_THRESHOLD,
+                 on_result=None):
+        self.model = model
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.conf = conf
+        self.on_result = on_result # Função (stream, frame, detections) chamada para cada resultado
+        self._new_frame_event = threading.Event()
+        self.streams = [StreamSource(i, src, self._new_frame_event) for i, src in enumerate(sources)]
+        self._next_stream = 0 # Rotação para que nenhuma fonte fique sempre fora do lote
+        self.batches = 0
+        self.batch_sizes_total = 0
+        self.inference_time_total = 0.0
+
+    def start(self):
+        for stream in self.streams:
+            stream.start()
+        return self
+
+    def stop(self):
+        for stream in self.streams:
+            stream.stop()
+
+    def all_ended(self):
+        return all(s.ended and not s.has_new_frame() for s in self.streams)
+
+    def _ready_streams(self):
+        n = len(self.streams)
+        order = [self.streams[(self._next_stream + k) % n] for k in range(n)]
+        return [s for s in order if s.has_new_frame()]
+
+    # Junta um lote: espera pelo primeiro frame e depois até max_wait ou até o lote estar cheio
+    def _gather_batch(self, timeout=0.5):
+        if not self._new_frame_event.wait(timeout):
+            return []
+        deadline = time.perf_counter() + self.max_wait
+        while True:
+            self._new_frame_event.clear()
+            ready = self._ready_streams()
+            remaining = deadline - time.perf_counter()
+            if len(ready) >= self.max_batch or len(ready) == len(self.streams) or remaining <= 0:
+                break
+            self._new_frame_event.wait(remaining)
+
+        batch = []
+        for stream in ready[:self.max_batch]:
+            frame = stream.take_latest()
+            if frame is not None:
+                batch.append((stream, frame))
+        if batch:
+            self._next_stream = (batch[-1][0].stream_id + 1) % len(self.streams)
+        if any(s.has_new_frame() for s in self.streams):
+            self._new_frame_event.set() # Ficaram frames de fora deste lote
+        return batch
+
+    # Processa um lote; devolve o número de frames processados
+    def step(self):
+        batch = self._gather_batch()
+        if not batch:
+            return 0
+        frames = [frame for _, frame in batch]
+        t0 = time.perf_counter()
+        results = self.model(frames, verbose=False, conf=self.conf) # Uma só passagem para todo o lote
+        self.inference_time_total += time.perf_counter() - t0
+        self.batches += 1
+        self.batch_sizes_total += len(batch)
+
+        for (stream, frame), result in zip(batch, results):
+            stream.detections = Detections.from_result(result, self.model.names)
+            stream.last_frame = frame
+            stream.frames_processed += 1
+            if self.on_result is not None:
+                self.on_result(stream, frame, stream.detections)
+        return len(batch)
+
+    def summary(self):
+        mean_batch = self.batch_sizes_total / self.batches if self.batches else 0.0
+        mean_inf = self.inference_time_total / self.batches if self.batches else 0.0
+        lines = [f"lotes={self.batches} tamanho medio={mean_batch:.1f} inferencia media={mean_inf * 1000:.1f}ms/lote"]
+        for s in self.streams:
+            lines.append(f"  fonte {s.stream_id} ({s.source}): processados={s.frames_processed} "
+                         f"descartados={s.dropped_frames()} deteccoes={len(s.detections)}")
+        return "\n".join(lines)
+
+
+# --- Desenho simples para o modo --show ---
+def draw_stream(stream, frame, detections):
+    img = frame.copy()
+    for det in detections:
+        xyxy = det['xyxy']
+        cv2.rectangle(img, (int(xyxy[0]), int(xyxy[1])), (int(xyxy[2]), int(xyxy[3])), (0, 255, 0), 2)
+        cv2.putText(img, f"{det['label']}: {det['confidence']:.2f}", (int(xyxy[0]), int(xyxy[1]) - 4),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1, cv2.LINE_AA)
+    cv2.imshow(f"Fonte {stream.stream_id}", img)
+
+
+def parse_source(value):
+    # '0', '1', ... são índices de webcam; o resto é caminho ou URL
+    return int(value) if value.isdigit() else value
+
+
+# --- Script Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deteção YOLOv8 em várias fontes com um único modelo e inferência em lote.")
+    parser.add_argument('sources', nargs='+', help="Fontes de vídeo: índice de webcam, ficheiro ou URL RTSP")
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--backend', choices=['auto', 'torch', 'onnxruntime', 'openvino'], default='auto', help="Ver backends.py")
+    parser.add_argument('--conf', type=float, default=CONFIDENCE_THRESHOLD)
+    parser.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    parser.add_argument('--max-wait-ms', type=float, default=MAX_WAIT * 1000)
+    parser.add_argument('--show', action='store_true', help="Mostra uma janela por fonte")
+    parser.add_argument('--stats-every', type=float, default=5.0, help="Intervalo (s) entre estatísticas")
+    args = parser.parse_args()
+
+    model = load_model(args.model, backend=args.backend) # Carregado uma única vez para todas as fontes
+    engine = MultiStreamEngine(model, [parse_source(s) for s in args.sources],
+                               max_batch=args.max_batch, max_wait=args.max_wait_ms / 1000.0, conf=args.conf,
+                               on_result=draw_stream if args.show else None).start()
+
+    print(f"A processar {len(engine.streams)} fontes. Pressione Ctrl+C (ou 'q' nas janelas) para sair.")
+    last_stats = time.time()
+    frames_since_stats = 0
+    try:
+        while not engine.all_ended():
+            frames_since_stats += engine.step()
+            if args.show:
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord('q') or key == 27:
+                    break
+            now = time.time()
+            if now - last_stats >= args.stats_every:
+                print(f"\n{frames_since_stats / (now - last_stats):.1f} frames/s no total")
+                print(engine.summary())
+                last_stats = now
+                frames_since_stats = 0
+    except KeyboardInterrupt:
+        pass
+
+    engine.stop()
+    print(engine.summary())
+    if args.show:
+        cv2.destroyAllWindows()
@@ -0,0 +1,205 @@
+import queue
+import threading
+import time
+
+# --- Pipeline em threads: captura -> inferência -> render ---
+# A captura e a inferência correm em threads próprias, ligadas por filas limitadas.
+# O render (imshow/waitKey e callbacks do rato) fica sempre na thread principal,
+# porque o HighGUI do OpenCV não é seguro fora dela.
+
+BACKPRESSURE_DROP = 'drop'   # Fila cheia: descarta o item mais antigo (menor latência)
+BACKPRESSURE_BLOCK = 'block' # Fila cheia: o produtor espera (não perde frames)
+
+END_OF_STREAM = object() # Marcador de fim de vídeo / erro de leitura
+
+
+# --- Estatísticas de tempo por etapa ---
+class StageTimer:
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.last = seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def mean(self):
+        with self._lock:
+            return self.total / self.count if self.count else 0.0
+
+    def summary(self):
+        return f"{self.name}: n={self.count} media={self.mean() * 1000:.1f}ms ultimo={self.last * 1000:.1f}ms max={self.max * 1000:.1f}ms"
+
+
+# --- Fila limitada com backpressure configurável ---
+class StageQueue:
+    def __init__(self, maxsize=2, backpressure=BACKPRESSURE_DROP):
+        if backpressure not in (BACKPRESSURE_DROP, BACKPRESSURE_BLOCK):
+            raise ValueError(f"Backpressure inválido: {backpressure!r} (use 'drop' ou 'block')")
+        self._queue = queue.Queue(maxsize=max(1, maxsize))
+        self.backpressure = backpressure
+        self.dropped = 0
+
+    def put(self, item, stop_event, force_block=False):
+        # O marcador de fim é sempre entregue em modo bloqueante para não ser descartado
+        if self.backpressure == BACKPRESSURE_BLOCK or force_block:
+            while not stop_event.is_set():
+                try:
+                    self._queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                try:
+                    self._queue.get_nowait() # Descarta o mais antigo
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        # Devolve None se nada chegou dentro do timeout
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def qsize(self):
+        return self._queue.qsize()
+
+
+# --- Pacote que circula entre as etapas ---
+class FramePacket:
+    def __init__(self, frame_id, frame):
+        self.frame_id = frame_id
+        self.frame = frame
+        self.detections = []
+        self.t_capture = time.perf_counter()
+        self.t_inference_done = None
+
+
+# --- Pipeline completo ---
+class DetectionPipeline:
+    # cap: objeto com .read() (cv2.VideoCapture)
+    # infer_fn: função frame -> lista de deteções (mesmo formato de detections_this_frame)
+    # metrics: registo opcional (metrics.Metrics) que recebe também os tempos e os descartes
+    def __init__(self, cap, infer_fn, queue_size=2, backpressure=BACKPRESSURE_DROP, metrics=None):
+        self.cap = cap
+        self.infer_fn = infer_fn
+        self.metrics = metrics
+        self.capture_queue = StageQueue(queue_size, backpressure)
+        self.result_queue = StageQueue(queue_size, backpressure)
+        self.timers = {
+            'captura': StageTimer('captura'),
+            'inferencia': StageTimer('inferencia'),
+            'render': StageTimer('render'),
+            'latencia': StageTimer('latencia'), # Da leitura do frame até estar desenhado
+        }
+        self._stop = threading.Event()
+        self._threads = []
+        self.error = None # Exceção que parou uma das threads; o render recebe END_OF_STREAM
+
+    def _record(self, stage, seconds):
+        self.timers[stage].record(seconds)
+        if self.metrics is not None:
+            self.metrics.observe(stage, seconds)
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name='captura', daemon=True),
+            threading.Thread(target=self._inference_loop, name='inferencia', daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout=1.0)
+        self._threads = []
+
+    def _capture_loop(self):
+        try:
+            self._run_capture()
+        except Exception as e:
+            self._fail('captura', e)
+
+    def _run_capture(self):
+        frame_id = 0
+        while not self._stop.is_set():
+            t0 = time.perf_counter()
+            ret, frame = self.cap.read()
+            if not ret:
+                self.capture_queue.put(END_OF_STREAM, self._stop, force_block=True)
+                return
+            self._record('captura', time.perf_counter() - t0)
+            packet = FramePacket(frame_id, frame)
+            frame_id += 1
+            self.capture_queue.put(packet, self._stop)
+
+    def _fail(self, stage, error):
+        # Uma thread que morre em silêncio deixaria o render à espera para sempre
+        self.error = f"{stage}: {type(error).__name__}: {error}"
+        self.result_queue.put(END_OF_STREAM, self._stop, force_block=True)
+
+    def _inference_loop(self):
+        try:
+            self._run_inference()
+        except Exception as e: # Frame inválido, falta de memória na GPU, ...
+            self._fail('inferencia', e)
+
+    def _run_inference(self):
+        while not self._stop.is_set():
+            if self.metrics is not None:
+                self.metrics.profile_point() # Inclui a chamada ao modelo nos perfis pedidos com 'r' ou /profile
+            packet = self.capture_queue.get(timeout=0.1)
+            if packet is None:
+                continue
+            if packet is END_OF_STREAM:
+                self.result_queue.put(END_OF_STREAM, self._stop, force_block=True)
+                return
+            t0 = time.perf_counter()
+            packet.detections = self.infer_fn(packet.frame)
+            packet.t_inference_done = time.perf_counter()
+            self._record('inferencia', packet.t_inference_done - t0)
+            self.result_queue.put(packet, self._stop)
+
+    # Chamado pela thread principal: devolve um FramePacket, END_OF_STREAM ou None
+    def get_result(self, timeout=0.005):
+        return self.result_queue.get(timeout=timeout)
+
+    # Chamado pela thread principal depois de desenhar o frame do pacote
+    def mark_rendered(self, packet, render_seconds):
+        self._record('render', render_seconds)
+        self._record('latencia', time.perf_counter() - packet.t_capture)
+        if self.metrics is not None:
+            self.metrics.set_counter('frames_descartados_captura', self.capture_queue.dropped)
+            self.metrics.set_counter('frames_descartados_inferencia', self.result_queue.dropped)
+
+    # Os frames desta versão são objetos numpy normais; nada a libertar (ver shm_ring.ProcessPipeline)
+    def release(self, packet):
+        pass
+
+    def dropped_frames(self):
+        return {'captura': self.capture_queue.dropped, 'inferencia': self.result_queue.dropped}
+
+    def summary(self):
+        lines = [t.summary() for t in self.timers.values()]
+        dropped = self.dropped_frames()
+        lines.append(f"frames descartados: captura={dropped['captura']} inferencia={dropped['inferencia']}")
+        return "\n".join(lines)
@@ -0,0 +1,130 @@
+import cv2
+import numpy as np
+
+from spatial_index import GridIndex
+
+# --- Renderizador por camadas com redesenho incremental ---
+# Guarda a imagem base, a imagem já desenhada e o texto/tamanho de cada etiqueta.
+# Numa mudança de seleção (clique, 'n', 'p') não volta a copiar a imagem nem a desenhar
+# todas as caixas: só repõe, a partir da base, os retângulos "sujos" (caixa antiga e nova
+# selecionadas e painel de informação) e redesenha aí as caixas que os intersetam,
+# recortadas ao retângulo, pela mesma ordem de um redesenho completo.
+# O resultado é idêntico, pixel a pixel, ao de redesenhar tudo.
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+DIRTY_PADDING = 2 # Margem à volta de cada caixa (a linha de espessura 2 sai 1px para fora)
+
+_text_size_cache = {}
+
+
+# --- cv2.getTextSize com cache (as mesmas etiquetas repetem-se muito) ---
+def text_size(text, scale, thickness=1):
+    key = (text, scale, thickness)
+    size = _text_size_cache.get(key)
+    if size is None:
+        size = cv2.getTextSize(text, FONT, scale, thickness)
+        _text_size_cache[key] = size
+    return size
+
+
+class LayeredRenderer:
+    # draw_info(img, selected_det) desenha o painel de informação (selected_det é a deteção
+    # selecionada ou None) e devolve o retângulo (x1, y1, x2, y2) que ocupou.
+    def __init__(self, draw_info, color_default, color_selected, text_color, label_scale=0.5, box_thickness=2):
+        self.draw_info = draw_info
+        self.color_default = color_default
+        self.color_selected = color_selected
+        self.text_color = text_color
+        self.label_scale = label_scale
+        self.box_thickness = box_thickness
+        self._base = None
+        self._detections = None
+        self._display = None # Imagem mostrada; None obriga a um redesenho completo
+        self._selected = -1
+        self._info_rect = None
+        self._boxes = np.empty((0, 4), dtype=np.int32)
+        self._labels = []
+        self._extents = np.empty((0, 4), dtype=np.int32)
+        self._extent_index = None
+
+    # Define a imagem base e as deteções; sem efeito se forem os mesmos objetos de antes.
+    # A base é guardada por referência: quem chama não a deve alterar enquanto estiver em uso.
+    def set_frame(self, image, detections):
+        if image is self._base and detections is self._detections:
+            return
+        if detections is not self._detections:
+            self._detections = detections
+            self._prepare_labels()
+        self._base = image
+        self._display = None
+
+    def invalidate(self):
+        self._display = None
+
+    def _prepare_labels(self):
+        det = self._detections
+        n = len(det)
+        self._boxes = det.xyxy.astype(np.int32) if n else np.empty((0, 4), dtype=np.int32)
+        self._labels = []
+        self._extents = np.empty((n, 4), dtype=np.int32)
+        for i, row in enumerate(det):
+            text = f"{row['label']}: {row['confidence']:.2f}"
+            (tw, th), baseline = text_size(text, self.label_scale)
+            self._labels.append((text, tw, th, baseline))
+            x1, y1, x2, y2 = self._boxes[i]
+            self._extents[i] = (x1 - DIRTY_PADDING, y1 - th - baseline - DIRTY_PADDING,
+                                max(x2, x1 + tw) + DIRTY_PADDING, y2 + DIRTY_PADDING)
+        self._extent_index = None # Construído só no primeiro _repair (ver abaixo)
+
+    # Desenha a caixa i em img, cuja origem está em (ox, oy) nas coordenadas da imagem
+    def _draw_box(self, img, i, selected, ox=0, oy=0):
+        x1, y1, x2, y2 = (int(v) for v in self._boxes[i])
+        x1 -= ox; x2 -= ox; y1 -= oy; y2 -= oy
+        text, tw, th, baseline = self._labels[i]
+        color = self.color_selected if selected else self.color_default
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, self.box_thickness)
+        cv2.rectangle(img, (x1, y1 - th - baseline), (x1 + tw, y1), color, -1)
+        cv2.putText(img, text, (x1, y1 - baseline // 2), FONT, self.label_scale, self.text_color, 1, cv2.LINE_AA)
+
+    def _selected_det(self, selected):
+        return self._detections[selected] if selected != -1 else None
+
+    def _full_redraw(self, selected):
+        self._display = self._base.copy()
+        for i in range(len(self._labels)):
+            self._draw_box(self._display, i, i == selected)
+        self._info_rect = self.draw_info(self._display, self._selected_det(selected))
+
+    # Repõe um retângulo a partir da base e redesenha, recortadas, as caixas que o intersetam
+    def _repair(self, rect, selected):
+        h, w = self._display.shape[:2]
+        x0, y0 = max(int(rect[0]), 0), max(int(rect[1]), 0)
+        x1, y1 = min(int(rect[2]), w), min(int(rect[3]), h)
+        if x0 >= x1 or y0 >= y1:
+            return
+        self._display[y0:y1, x0:x1] = self._base[y0:y1, x0:x1]
+        if not len(self._labels):
+            return
+        if self._extent_index is None:
+            # Índice sobre a área desenhada de cada caixa (caixa + etiqueta), para achar quem toca um
+            # retângulo sujo. Só é preciso quando a seleção muda: em vídeo a maior parte dos frames
+            # é desenhada por inteiro e nunca chega aqui.
+            self._extent_index = GridIndex(self._extents)
+        roi = self._display[y0:y1, x0:x1]
+        for i in np.sort(self._extent_index.query_rect(x0, y0, x1, y1)): # Ordem de desenho original
+            self._draw_box(roi, int(i), i == selected, x0, y0)
+
+    def render(self, selected):
+        if not 0 <= selected < len(self._labels):
+            selected = -1
+        if self._display is None:
+            self._full_redraw(selected)
+        elif selected != self._selected:
+            for i in (self._selected, selected):
+                if i != -1:
+                    self._repair(self._extents[i], selected)
+            if self._info_rect is not None:
+                self._repair(self._info_rect, selected)
+            self._info_rect = self.draw_info(self._display, self._selected_det(selected)) # O painel fica por cima de tudo
+        self._selected = selected
+        return self._display
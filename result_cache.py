@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from detections import Detections
+
+# --- Cache de resultados endereçada por conteúdo ---
+# A chave junta o hash do conteúdo da imagem, o hash dos pesos do modelo e os parâmetros
+# de inferência (conf, imgsz, ...). Reabrir uma imagem já processada devolve as deteções
+# sem carregar o modelo. Dois níveis:
+#   - memória: LRU com um número máximo de entradas;
+#   - disco: SQLite, com limite de tamanho; ao passar o limite saem as entradas usadas há mais tempo.
+
+CACHE_PATH = '.cache_deteccoes.sqlite'
+MAX_DISK_BYTES = 256 * 1024 * 1024
+MAX_MEMORY_ENTRIES = 256
+
+_weights_ids = {}
+
+
+def file_hash(path, chunk_size=1 << 20):
+    h = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _weights_files(model_path):
+    # Um modelo exportado pode ser um diretório (ex.: yolov8n_openvino_model com .xml/.bin/metadata)
+    if not os.path.isdir(model_path):
+        return [model_path]
+    return sorted(os.path.join(model_path, n) for n in os.listdir(model_path)
+                  if os.path.isfile(os.path.join(model_path, n)))
+
+
+# Identidade dos pesos: hash do ficheiro, ou dos ficheiros do diretório exportado (memorizado por
+# caminho, tamanhos e datas de modificação).
+# None se o ficheiro ainda não existe (o ultralytics descarrega-o no primeiro uso): ver detect_cached.
+def weights_id(model_path):
+    try:
+        files = _weights_files(model_path)
+        stats = tuple((os.path.basename(p), st.st_size, st.st_mtime_ns) for p, st in ((p, os.stat(p)) for p in files))
+    except OSError:
+        return None
+    memo_key = (os.path.abspath(model_path), stats)
+    wid = _weights_ids.get(memo_key)
+    if wid is None:
+        if os.path.isdir(model_path):
+            h = hashlib.blake2b(digest_size=20)
+            for path in files:
+                h.update(os.path.basename(path).encode('utf-8') + b'\0' + file_hash(path).encode('ascii'))
+            wid = h.hexdigest()
+        else:
+            wid = file_hash(model_path)
+        _weights_ids[memo_key] = wid
+    return wid
+
+
+def cache_key(image_hash, model_id, params):
+    payload = json.dumps({'img': image_hash, 'model': model_id, 'params': params}, sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+
+
+class DetectionCache:
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_DISK_BYTES, memory_entries=MAX_MEMORY_ENTRIES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, data BLOB NOT NULL, "
+                             "names_key TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS names (names_key TEXT PRIMARY KEY, names TEXT NOT NULL)")
+            self._db.commit()
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        self._names_by_key = {}
+
+    def _remember(self, key, detections):
+        self._memory[key] = detections
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            detections = self._memory.get(key)
+            if detections is not None:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return detections
+            if self._db is None:
+                self.misses += 1
+                return None
+            row = self._db.execute("SELECT data, names_key FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            detections = Detections(np.frombuffer(row[0], dtype=np.float32).reshape(-1, 6), self._names(row[1]))
+            self._remember(key, detections)
+            self.hits_disk += 1
+            return detections
+
+    def _names(self, names_key):
+        names = self._names_by_key.get(names_key)
+        if names is None:
+            row = self._db.execute("SELECT names FROM names WHERE names_key = ?", (names_key,)).fetchone()
+            names = {int(k): v for k, v in json.loads(row[0]).items()} if row else {}
+            self._names_by_key[names_key] = names
+        return names
+
+    def put(self, key, detections):
+        with self._lock:
+            self._remember(key, detections)
+            if self._db is None:
+                return
+            # Os nomes das classes são iguais para todas as imagens do mesmo modelo: guardados uma vez
+            names = dict(detections.names) if isinstance(detections.names, dict) else dict(enumerate(detections.names))
+            names_json = json.dumps({str(k): v for k, v in names.items()}, sort_keys=True)
+            names_key = hashlib.blake2b(names_json.encode('utf-8'), digest_size=16).hexdigest()
+            self._db.execute("INSERT OR IGNORE INTO names (names_key, names) VALUES (?, ?)", (names_key, names_json))
+            data = detections.data.tobytes()
+            old = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO entries (key, data, names_key, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                             (key, data, names_key, len(data), time.time()))
+            self._disk_bytes += len(data) - (old[0] if old else 0)
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        while self._disk_bytes > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM entries ORDER BY last_access LIMIT 64").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._disk_bytes -= size
+                if self._disk_bytes <= self.max_bytes:
+                    break
+
+    def stats(self):
+        return {'hits_memoria': self.hits_memory, 'hits_disco': self.hits_disk, 'falhas': self.misses,
+                'bytes_disco': self._disk_bytes if self._db is not None else 0}
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+# --- Deteção com cache para um ficheiro de imagem ---
+# get_model() só é chamado numa falha da cache, por isso numa imagem já vista o modelo nem é carregado.
+# Exceção: se os pesos ainda não estão no disco, o modelo é carregado antes de calcular a chave, para
+# que a chave seja sempre o hash do ficheiro (e não mude depois do download). Se mesmo assim o
+# ficheiro não aparecer nesse caminho usa-se o nome, que é então estável entre execuções.
+# Devolve (deteções, result do ultralytics ou None se veio da cache).
+# Com tiler (um TiledDetector, ver tiling.py) a imagem é processada por mosaicos e result é sempre None;
+# image_source permite reutilizar uma fonte já aberta (ver tiling.open_image).
+def detect_cached(image_path, cache, get_model, model_path, conf=0.25, imgsz=640, tiler=None, image_source=None):
+    params = {'conf': conf, 'imgsz': imgsz}
+    if tiler is not None: # O limiar e o tamanho de entrada são os do tiler
+        params = {'conf': tiler.conf, 'imgsz': tiler.imgsz, 'tiled': tiler.cache_params()}
+    model_id = weights_id(model_path)
+    if model_id is None:
+        get_model()
+        model_id = weights_id(model_path) or f"nome:{os.path.basename(str(model_path))}"
+    key = cache_key(file_hash(image_path), model_id, params)
+    detections = cache.get(key)
+    if detections is not None:
+        return detections, None
+    if tiler is not None:
+        detections = tiler.detect(image_source) if image_source is not None else tiler.detect_path(image_path)
+        cache.put(key, detections)
+        return detections, None
+    model = get_model()
+    result = model(image_path, verbose=False, conf=conf, imgsz=imgsz)[0]
+    detections = Detections.from_result(result, model.names)
+    cache.put(key, detections)
+    return detections, result
@@ -0,0 +1,564 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+import numpy as np
+
+from detections import Detections
+from metrics import REGISTRY
+
+# --- Serviço de deteção assíncrono (HTTP + WebSocket, só biblioteca padrão) ---
+# Um único modelo, carregado e aquecido no arranque, fica residente. Os pedidos concorrentes
+# são agrupados em micro-lotes (até MAX_BATCH imagens ou MAX_WAIT_MS de espera) e cada lote
+# é uma única passagem do modelo, numa thread dedicada. Cada pedido tem um prazo; quando a
+# fila está cheia, ou o prazo não seria cumprido com a fila atual, o pedido é recusado logo
+# (503) em vez de se acumular.
+#   POST /detect            corpo = imagem codificada (JPEG/PNG); devolve os registos
+#                           {xyxy, label, confidence, class_id} em JSON, ou um por linha
+#                           (NDJSON em streaming) com "Accept: application/x-ndjson"
+#   GET  /ws                WebSocket: cada mensagem binária é um frame; a resposta é uma
+#                           mensagem de texto {"frame": n, "detections": [...]}. Se os frames
+#                           chegam mais depressa do que são processados, fica só o mais recente.
+#                           Uma mensagem de texto JSON muda as opções ({"conf": 0.5, "deadline_ms": 200}).
+#   GET  /health, /metrics  estado da fila e métricas no formato do Prometheus (ver metrics.py)
+# Prazo: cabeçalho X-Deadline-Ms ou ?deadline_ms=; limiar: ?conf=.
+# Testar localmente sem pesos nem torch:
+#   python service.py serve --stub
+#   python service.py detect minha_imagem.jpg
+#   python service.py stream video.mp4
+
+HOST = '127.0.0.1'
+PORT = 8080
+MAX_BATCH = 8
+MAX_WAIT_MS = 5.0 # Espera máxima por mais pedidos para completar um lote
+MAX_QUEUE = 64 # Pedidos em espera a partir dos quais há rejeição imediata
+DEFAULT_DEADLINE_MS = 1000.0
+DEFAULT_CONF = 0.25
+MAX_BODY_BYTES = 32 * 1024 * 1024
+DECODE_WORKERS = 4
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+WS_TEXT, WS_BINARY, WS_CLOSE, WS_PING, WS_PONG = 0x1, 0x2, 0x8, 0x9, 0xA
+STATUS_TEXT = {200: 'OK', 101: 'Switching Protocols', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+               503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+
+class Overloaded(Exception):
+    pass
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# --- Micro-lotes ---
+class MicroBatcher:
+    def __init__(self, model, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS, max_queue=MAX_QUEUE, metrics=REGISTRY):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue = max_queue
+        self.metrics = metrics
+        self.batch_seconds = 0.0 # Média móvel do tempo de um lote, para estimar a espera
+        self._queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inferencia') # O modelo fica numa só thread
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown(wait=False)
+
+    def queue_size(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def estimated_wait(self):
+        return (self.queue_size() // self.max_batch + 1) * self.batch_seconds
+
+    async def submit(self, frame, conf, deadline):
+        # Rejeição imediata: mais vale um 503 agora do que uma resposta que chega depois do prazo
+        if self.queue_size() >= self.max_queue:
+            self.metrics.inc('servico_rejeitados')
+            raise Overloaded("fila cheia")
+        if time.monotonic() + self.estimated_wait() > deadline:
+            self.metrics.inc('servico_rejeitados')
+            raise Overloaded("o prazo não seria cumprido")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((frame, conf, deadline, future))
+        self.metrics.set_gauge('servico_fila', self.queue_size())
+        return await future
+
+    async def _next_batch(self):
+        batch = [await self._queue.get()]
+        end = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = end - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _infer(self, frames, conf):
+        results = self.model(frames, verbose=False, conf=conf)
+        return [Detections.from_result(r, self.model.names).data.copy() for r in results]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            now = time.monotonic()
+            live = []
+            for item in batch:
+                future, deadline = item[3], item[2]
+                if future.done(): # O cliente desistiu
+                    continue
+                if now > deadline:
+                    self.metrics.inc('servico_expirados')
+                    future.set_exception(DeadlineExceeded("prazo ultrapassado na fila"))
+                else:
+                    live.append(item)
+            self.metrics.set_gauge('servico_fila', self.queue_size())
+            if not live:
+                continue
+            # Um só limiar para o lote (o mais baixo); cada pedido filtra depois pelo seu
+            conf = min(item[1] for item in live)
+            t0 = time.monotonic()
+            try:
+                datas = await loop.run_in_executor(self._executor, self._infer, [item[0] for item in live], conf)
+            except Exception as e:
+                for item in live:
+                    if not item[3].done():
+                        item[3].set_exception(e)
+                continue
+            secs = time.monotonic() - t0
+            self.batch_seconds = secs if not self.batch_seconds else 0.8 * self.batch_seconds + 0.2 * secs
+            self.metrics.observe('servico_lote', secs)
+            self.metrics.set_gauge('servico_tamanho_lote', len(live))
+            for (frame, c, deadline, future), data in zip(live, datas):
+                if not future.done():
+                    future.set_result(Detections(data, self.model.names).filter(min_conf=c))
+
+
+# --- HTTP mínimo ---
+async def read_request(reader, max_body=MAX_BODY_BYTES):
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode('latin-1').split(' ', 2)
+    except ValueError:
+        raise HttpError(400, "linha de pedido inválida")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        raise HttpError(400, "Content-Length inválido")
+    if length < 0:
+        raise HttpError(400, "Content-Length inválido")
+    if length > max_body:
+        raise HttpError(413, f"corpo maior do que {max_body} bytes")
+    body = await reader.readexactly(length) if length else b''
+    url = urlparse(target)
+    query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+    return method.upper(), url.path, query, headers, body
+
+
+def response_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"] + [f"{k}: {v}" for k, v in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+
+
+async def send_body(writer, status, body, content_type='application/json', keep_alive=True, extra=None):
+    headers = {'Content-Type': content_type, 'Content-Length': len(body),
+               'Connection': 'keep-alive' if keep_alive else 'close'}
+    headers.update(extra or {})
+    writer.write(response_head(status, headers) + body)
+    await writer.drain()
+
+
+async def send_json(writer, status, obj, keep_alive=True, extra=None):
+    await send_body(writer, status, json.dumps(obj).encode('utf-8'), keep_alive=keep_alive, extra=extra)
+
+
+async def send_ndjson(writer, records, keep_alive=True):
+    # Resposta em streaming (chunked): um registo por linha, enviado assim que está pronto
+    writer.write(response_head(200, {'Content-Type': 'application/x-ndjson', 'Transfer-Encoding': 'chunked',
+                                     'Connection': 'keep-alive' if keep_alive else 'close'}))
+    for record in records:
+        line = json.dumps(record).encode('utf-8') + b'\n'
+        writer.write(b'%x\r\n%s\r\n' % (len(line), line))
+        await writer.drain()
+    writer.write(b'0\r\n\r\n')
+    await writer.drain()
+
+
+# --- WebSocket (RFC 6455) mínimo ---
+def ws_accept_key(key):
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii')
+
+
+def ws_frame(opcode, payload, mask=False):
+    n = len(payload)
+    head = bytes([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    if n < 126:
+        head += bytes([mask_bit | n])
+    elif n < 65536:
+        head += bytes([mask_bit | 126]) + struct.pack('!H', n)
+    else:
+        head += bytes([mask_bit | 127]) + struct.pack('!Q', n)
+    if mask: # Obrigatório nas mensagens do cliente para o servidor
+        key = os.urandom(4)
+        return head + key + _unmask(payload, key)
+    return head + payload
+
+
+def _unmask(payload, key):
+    n = len(payload)
+    if not n:
+        return payload
+    # XOR de todo o conteúdo de uma vez (inteiros de precisão arbitrária), sem ciclo por byte
+    pad = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(pad, 'big')).to_bytes(n, 'big')
+
+
+async def ws_read_message(reader, max_size=MAX_BODY_BYTES, writer=None, mask=False):
+    # Devolve (opcode, conteúdo) e junta mensagens fragmentadas. As mensagens de controlo podem chegar
+    # entre fragmentos: com writer, ping é respondido aqui (pong com máscara se mask, do lado do
+    # cliente) e pong é ignorado, sem perder os fragmentos já lidos; close é sempre devolvido.
+    chunks, opcode = [], None
+    while True:
+        b0, b1 = await reader.readexactly(2)
+        fin, op = b0 & 0x80, b0 & 0x0F
+        n = b1 & 0x7F
+        if n == 126:
+            n = struct.unpack('!H', await reader.readexactly(2))[0]
+        elif n == 127:
+            n = struct.unpack('!Q', await reader.readexactly(8))[0]
+        if n > max_size:
+            raise HttpError(413, "mensagem WebSocket demasiado grande")
+        key = await reader.readexactly(4) if b1 & 0x80 else None
+        payload = await reader.readexactly(n)
+        if key is not None:
+            payload = _unmask(payload, key)
+        if op >= 0x8:
+            if writer is None or op == WS_CLOSE:
+                return op, payload
+            if op == WS_PING:
+                writer.write(ws_frame(WS_PONG, payload, mask))
+                await writer.drain()
+            continue
+        if op != 0:
+            opcode = op
+        chunks.append(payload)
+        if sum(len(c) for c in chunks) > max_size:
+            raise HttpError(413, "mensagem WebSocket demasiado grande")
+        if fin:
+            return opcode, b''.join(chunks)
+
+
+# --- Serviço ---
+class DetectionService:
+    def __init__(self, batcher, default_deadline_ms=DEFAULT_DEADLINE_MS, default_conf=DEFAULT_CONF, metrics=REGISTRY):
+        self.batcher = batcher
+        self.default_deadline_ms = default_deadline_ms
+        self.default_conf = default_conf
+        self.metrics = metrics
+        self._decoder = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix='descodificar')
+
+    async def decode(self, data):
+        # cv2.imdecode liberta o GIL: as imagens são descodificadas em paralelo, fora do ciclo de eventos
+        frame = await asyncio.get_running_loop().run_in_executor(
+            self._decoder, cv2.imdecode, np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None:
+            raise HttpError(400, "não foi possível descodificar a imagem")
+        return frame
+
+    async def detect(self, data, conf, deadline):
+        frame = await self.decode(data)
+        t0 = time.perf_counter()
+        detections = await self.batcher.submit(frame, conf, deadline)
+        self.metrics.observe('servico_pedido', time.perf_counter() - t0)
+        self.metrics.inc('servico_pedidos')
+        return detections
+
+    def _options(self, query, headers=None):
+        headers = headers or {}
+        deadline_ms = float(query.get('deadline_ms', headers.get('x-deadline-ms', self.default_deadline_ms)))
+        return float(query.get('conf', self.default_conf)), deadline_ms
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    await send_json(writer, e.status, {'erro': str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, query, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                if path == '/ws':
+                    await self.websocket(reader, writer, query, headers)
+                    break
+                await self.dispatch(writer, method, path, query, headers, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, writer, method, path, query, headers, body, keep_alive):
+        try:
+            if path == '/health':
+                await send_json(writer, 200, {'pronto': True, 'fila': self.batcher.queue_size(),
+                                              'lote_ms': self.batcher.batch_seconds * 1000}, keep_alive)
+            elif path == '/metrics':
+                await send_body(writer, 200, self.metrics.to_prometheus().encode('utf-8'), 'text/plain; version=0.0.4', keep_alive)
+            elif path == '/detect':
+                if method != 'POST':
+                    raise HttpError(405, "use POST com a imagem no corpo")
+                conf, deadline_ms = self._options(query, headers)
+                detections = await self.detect(body, conf, time.monotonic() + deadline_ms / 1000.0)
+                if 'application/x-ndjson' in headers.get('accept', ''):
+                    await send_ndjson(writer, detections.to_dicts(), keep_alive)
+                else:
+                    await send_json(writer, 200, {'detections': detections.to_dicts()}, keep_alive)
+            else:
+                raise HttpError(404, f"caminho desconhecido: {path}")
+        except HttpError as e:
+            await send_json(writer, e.status, {'erro': str(e)}, keep_alive)
+        except ValueError as e: # Parâmetros inválidos (conf, deadline_ms)
+            await send_json(writer, 400, {'erro': str(e)}, keep_alive)
+        except Overloaded as e:
+            await send_json(writer, 503, {'erro': f"sobrecarga: {e}"}, keep_alive, {'Retry-After': 1})
+        except DeadlineExceeded as e:
+            await send_json(writer, 504, {'erro': str(e)}, keep_alive)
+        except Exception as e: # Erro do modelo: o serviço continua para os outros pedidos
+            self.metrics.inc('servico_erros')
+            await send_json(writer, 500, {'erro': f"{type(e).__name__}: {e}"}, keep_alive)
+
+    async def websocket(self, reader, writer, query, headers):
+        key = headers.get('sec-websocket-key')
+        if headers.get('upgrade', '').lower() != 'websocket' or not key:
+            await send_json(writer, 400, {'erro': "pedido de upgrade WebSocket inválido"}, keep_alive=False)
+            return
+        writer.write(response_head(101, {'Upgrade': 'websocket', 'Connection': 'Upgrade',
+                                         'Sec-WebSocket-Accept': ws_accept_key(key)}))
+        await writer.drain()
+        conf, deadline_ms = self._options(query)
+        options = {'conf': conf, 'deadline_ms': deadline_ms}
+        latest = [None] # Só o frame mais recente espera pela inferência
+        wake = asyncio.Event()
+
+        async def send(obj):
+            writer.write(ws_frame(WS_TEXT, json.dumps(obj).encode('utf-8')))
+            await writer.drain()
+
+        async def process():
+            while True:
+                await wake.wait()
+                wake.clear()
+                item, latest[0] = latest[0], None
+                if item is None:
+                    continue
+                frame_id, data, deadline = item
+                try:
+                    detections = await self.detect(data, options['conf'], deadline)
+                    response = {'frame': frame_id, 'detections': detections.to_dicts()}
+                except (Overloaded, DeadlineExceeded, HttpError) as e:
+                    response = {'frame': frame_id, 'erro': str(e)}
+                except Exception as e: # Erro do modelo, como o 500 do HTTP: responde e continua com o próximo frame
+                    self.metrics.inc('servico_erros')
+                    response = {'frame': frame_id, 'erro': f"{type(e).__name__}: {e}"}
+                try:
+                    await send(response)
+                except ConnectionError:
+                    return # O cliente desligou; o ciclo de leitura termina a ligação
+
+        worker = asyncio.get_running_loop().create_task(process())
+        frame_id = 0
+        try:
+            while True:
+                opcode, payload = await ws_read_message(reader, writer=writer)
+                if opcode == WS_BINARY:
+                    if latest[0] is not None:
+                        self.metrics.inc('servico_ws_descartados')
+                    latest[0] = (frame_id, payload, time.monotonic() + options['deadline_ms'] / 1000.0)
+                    frame_id += 1
+                    wake.set()
+                elif opcode == WS_TEXT:
+                    try:
+                        options.update({k: float(v) for k, v in json.loads(payload).items() if k in options})
+                    except (ValueError, TypeError, AttributeError):
+                        await send({'erro': "opções inválidas"})
+                elif opcode == WS_CLOSE:
+                    writer.write(ws_frame(WS_CLOSE, payload[:2]))
+                    await writer.drain()
+                    break
+        except HttpError:
+            writer.write(ws_frame(WS_CLOSE, struct.pack('!H', 1009)))
+        finally:
+            worker.cancel()
+
+
+async def serve(model, host=HOST, port=PORT, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS, max_queue=MAX_QUEUE,
+                deadline_ms=DEFAULT_DEADLINE_MS, conf=DEFAULT_CONF):
+    batcher = MicroBatcher(model, max_batch, max_wait_ms, max_queue)
+    batcher.start()
+    service = DetectionService(batcher, deadline_ms, conf)
+    server = await asyncio.start_server(service.handle, host, port, limit=1 << 20)
+    print(f"Serviço de deteção em http://{host}:{port} (lote até {max_batch}, fila até {max_queue})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+# --- Clientes de teste (também só biblioteca padrão) ---
+def detect_http(image_path, url=f"http://{HOST}:{PORT}", conf=None, deadline_ms=None):
+    with open(image_path, 'rb') as f:
+        data = f.read()
+    params = '&'.join(f"{k}={v}" for k, v in (('conf', conf), ('deadline_ms', deadline_ms)) if v is not None)
+    req = urllib.request.Request(f"{url}/detect" + (f"?{params}" if params else ''), data=data, method='POST',
+                                 headers={'Content-Type': 'application/octet-stream'})
+    with urllib.request.urlopen(req) as resp:
+        return json.loads(resp.read())['detections']
+
+
+async def stream_ws(source, host=HOST, port=PORT, max_frames=None, on_result=print):
+    # Envia os frames de um vídeo/câmara por WebSocket e entrega cada resposta a on_result
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode('ascii')
+    writer.write((f"GET /ws HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode('latin-1'))
+    await writer.drain()
+    status = await reader.readline()
+    if b' 101 ' not in status:
+        raise ConnectionError(f"upgrade recusado: {status!r}")
+    while (await reader.readline()) not in (b'\r\n', b''):
+        pass
+
+    async def receive():
+        while True:
+            opcode, payload = await ws_read_message(reader, writer=writer, mask=True)
+            if opcode == WS_CLOSE:
+                break
+            if opcode == WS_TEXT:
+                on_result(json.loads(payload))
+
+    receiver = asyncio.get_running_loop().create_task(receive())
+    cap = cv2.VideoCapture(source)
+    sent = 0
+    try:
+        while max_frames is None or sent < max_frames:
+            ret, frame = await asyncio.to_thread(cap.read)
+            if not ret:
+                break
+            ok, encoded = cv2.imencode('.jpg', frame)
+            writer.write(ws_frame(WS_BINARY, encoded.tobytes(), mask=True))
+            await writer.drain()
+            sent += 1
+        await asyncio.sleep(0.5) # Dá tempo às últimas respostas
+        writer.write(ws_frame(WS_CLOSE, struct.pack('!H', 1000), mask=True))
+        await writer.drain()
+        await asyncio.wait_for(receiver, 2.0)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        receiver.cancel()
+        cap.release()
+        writer.close()
+
+
+# --- Script Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serviço de deteção assíncrono (HTTP + WebSocket).")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p_serve = sub.add_parser('serve', help="Arranca o serviço")
+    p_serve.add_argument('--model', default='yolov8n.pt')
+    p_serve.add_argument('--backend', choices=['auto', 'torch', 'onnxruntime', 'openvino'], default='auto', help="Ver backends.py")
+    p_serve.add_argument('--stub', action='store_true', help="Modelo falso (stub_model.py): sem pesos nem torch")
+    p_serve.add_argument('--host', default=HOST)
+    p_serve.add_argument('--port', type=int, default=PORT)
+    p_serve.add_argument('--max-batch', type=int, default=MAX_BATCH)
+    p_serve.add_argument('--max-wait-ms', type=float, default=MAX_WAIT_MS)
+    p_serve.add_argument('--max-queue', type=int, default=MAX_QUEUE)
+    p_serve.add_argument('--deadline-ms', type=float, default=DEFAULT_DEADLINE_MS)
+    p_serve.add_argument('--conf', type=float, default=DEFAULT_CONF)
+
+    p_detect = sub.add_parser('detect', help="Envia uma imagem por HTTP")
+    p_detect.add_argument('image')
+    p_detect.add_argument('--url', default=f"http://{HOST}:{PORT}")
+    p_detect.add_argument('--conf', type=float, default=None)
+    p_detect.add_argument('--deadline-ms', type=float, default=None)
+
+    p_stream = sub.add_parser('stream', help="Envia os frames de um vídeo ou câmara por WebSocket")
+    p_stream.add_argument('source', help="Caminho do vídeo ou índice da câmara")
+    p_stream.add_argument('--host', default=HOST)
+    p_stream.add_argument('--port', type=int, default=PORT)
+    p_stream.add_argument('--frames', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        if args.stub:
+            from stub_model import StubModel
+            model = StubModel()
+        else:
+            from model_loader import load_model, resolve_model_path
+            model = load_model(resolve_model_path(args.model), backend=args.backend) # Carregado e aquecido uma vez
+        try:
+            asyncio.run(serve(model, args.host, args.port, args.max_batch, args.max_wait_ms, args.max_queue,
+                              args.deadline_ms, args.conf))
+        except KeyboardInterrupt:
+            print(REGISTRY.summary())
+    elif args.command == 'detect':
+        try:
+            for det in detect_http(args.image, args.url, args.conf, args.deadline_ms):
+                print(f"{det['label']:>15} {det['confidence']:.2f} {[int(c) for c in det['xyxy']]}")
+        except urllib.error.HTTPError as e:
+            print(f"Erro {e.code}: {e.read().decode('utf-8', 'replace')}")
+    else:
+        source = int(args.source) if args.source.isdigit() else args.source
+        asyncio.run(stream_ws(source, args.host, args.port, args.frames,
+                              lambda r: print(f"frame {r.get('frame')}: {len(r.get('detections', []))} deteções"
+                                              + (f" ({r['erro']})" if 'erro' in r else ''))))
@@ -0,0 +1,288 @@
+import multiprocessing as mp
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from detections import Detections
+from pipeline import END_OF_STREAM, StageTimer
+
+# --- Anel de frames em memória partilhada ---
+# Os frames vivem em slots pré-alocados de um único bloco multiprocessing.shared_memory.
+# Entre processos só circulam índices de slot (e as deteções, que são pequenas);
+# os pixels nunca são copiados nem serializados.
+# Cada slot tem um contador de referências: 0 = livre. Quem escreve um frame fica com a
+# primeira referência e passa-a ao próximo processo junto com o índice; quem precisar de
+# guardar o slot por mais tempo chama incref(), e cada referência termina com release().
+
+
+def _attach_shm(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False) # Python 3.13+
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class SharedFrameRing:
+    def __init__(self, num_slots, frame_shape, dtype=np.uint8, lock=None):
+        self.num_slots = num_slots
+        self.frame_shape = tuple(frame_shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_nbytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        self._lock = lock if lock is not None else mp.Lock()
+        self._data_shm = shared_memory.SharedMemory(create=True, size=self.frame_nbytes * num_slots)
+        self._meta_shm = shared_memory.SharedMemory(create=True, size=8 * num_slots)
+        self._owner = True
+        self._map_arrays()
+        self._refcounts[:] = 0
+
+    def _map_arrays(self):
+        self._frames = np.ndarray((self.num_slots,) + self.frame_shape, dtype=self.dtype, buffer=self._data_shm.buf)
+        self._refcounts = np.ndarray((self.num_slots,), dtype=np.int32, buffer=self._meta_shm.buf, offset=0)
+        self._next = np.ndarray((1,), dtype=np.int32, buffer=self._meta_shm.buf, offset=4 * self.num_slots)
+
+    # O anel pode ser passado como argumento a um mp.Process: o filho liga-se aos mesmos blocos
+    def __getstate__(self):
+        return {'num_slots': self.num_slots, 'frame_shape': self.frame_shape, 'dtype': self.dtype.str,
+                'lock': self._lock, 'data': self._data_shm.name, 'meta': self._meta_shm.name}
+
+    def __setstate__(self, state):
+        self.num_slots = state['num_slots']
+        self.frame_shape = state['frame_shape']
+        self.dtype = np.dtype(state['dtype'])
+        self.frame_nbytes = int(np.prod(self.frame_shape)) * self.dtype.itemsize
+        self._lock = state['lock']
+        self._data_shm = _attach_shm(state['data'])
+        self._meta_shm = _attach_shm(state['meta'])
+        self._owner = False
+        self._map_arrays()
+
+    # Reserva um slot livre para escrita; devolve o índice ou None se estão todos ocupados
+    def acquire(self):
+        with self._lock:
+            start = int(self._next[0])
+            for k in range(self.num_slots):
+                idx = (start + k) % self.num_slots
+                if self._refcounts[idx] == 0:
+                    self._refcounts[idx] = 1
+                    self._next[0] = (idx + 1) % self.num_slots
+                    return idx
+        return None
+
+    def incref(self, idx, n=1):
+        with self._lock:
+            if self._refcounts[idx] <= 0:
+                raise ValueError(f"Slot {idx} não está em uso")
+            self._refcounts[idx] += n
+
+    def release(self, idx):
+        with self._lock:
+            if self._refcounts[idx] <= 0:
+                raise ValueError(f"Slot {idx} libertado mais vezes do que foi reservado")
+            self._refcounts[idx] -= 1
+
+    # Vista numpy sobre o slot (sem cópia); só é válida enquanto houver uma referência
+    def view(self, idx):
+        return self._frames[idx]
+
+    def in_use(self):
+        with self._lock:
+            return int(np.count_nonzero(self._refcounts))
+
+    def close(self):
+        # As vistas numpy têm de desaparecer antes de fechar o mapeamento
+        self._frames = self._refcounts = self._next = None
+        try:
+            self._data_shm.close()
+            self._meta_shm.close()
+        except BufferError:
+            pass # Ainda há vistas vivas (ex.: o frame mostrado); o mapeamento sai com o processo
+        if self._owner:
+            self._data_shm.unlink()
+            self._meta_shm.unlink()
+
+
+# --- Processos do pipeline ---
+# Como o StageQueue do pipeline.py em modo 'drop': quando a inferência fica para trás é o frame
+# mais antigo à espera que é descartado, e o seu slot é reciclado para o frame novo. 'pending'
+# conta os frames na fila de captura, que nunca passa de max_pending (a latência fica limitada).
+def _take_oldest(out_queue, pending, dropped):
+    try:
+        item = out_queue.get_nowait()
+    except queue.Empty:
+        return None
+    with pending.get_lock():
+        pending.value -= 1
+    with dropped.get_lock():
+        dropped.value += 1
+    return item[0] # O slot continua com a referência do frame descartado, que passa ao novo
+
+
+def _capture_process(source, ring, out_queue, stop_event, dropped, pending, max_pending):
+    import cv2
+    cap = cv2.VideoCapture(source)
+    frame_id = 0
+    height, width = ring.frame_shape[:2]
+    while not stop_event.is_set():
+        # O slot é escolhido antes da leitura, para o frame ser descodificado diretamente nele
+        idx = _take_oldest(out_queue, pending, dropped) if pending.value >= max_pending else None
+        if idx is None:
+            idx = ring.acquire()
+        if idx is None:
+            idx = _take_oldest(out_queue, pending, dropped)
+        if idx is None:
+            # Slots todos na inferência/render e nenhum à espera: não há o que reciclar.
+            # grab() avança a fonte sem descodificar o frame descartado.
+            if not cap.grab():
+                break
+            with dropped.get_lock():
+                dropped.value += 1
+            continue
+        slot = ring.view(idx)
+        ret, frame = cap.read(slot)
+        if not ret:
+            ring.release(idx)
+            break
+        if frame.ctypes.data != slot.ctypes.data: # Tamanho diferente do anel: o OpenCV alocou outro buffer
+            cv2.resize(frame, (width, height), dst=slot)
+        with pending.get_lock():
+            pending.value += 1
+        out_queue.put((idx, frame_id, time.time()))
+        frame_id += 1
+    cap.release()
+    out_queue.put(None)
+
+
+def _inference_process(model_path, backend, conf, ring, in_queue, out_queue, stop_event, pending):
+    from model_loader import load_model
+    model = load_model(model_path, backend=backend)
+    names = model.names
+    while not stop_event.is_set():
+        try:
+            item = in_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is None:
+            break
+        with pending.get_lock():
+            pending.value -= 1
+        idx, frame_id, t_capture = item
+        t0 = time.perf_counter()
+        results = model(ring.view(idx), verbose=False, conf=conf) # Lê o frame diretamente do slot
+        detections = Detections.from_result(results[0], model.names)
+        # Só o array (N, 6) atravessa a fila; os nomes das classes seguem uma única vez
+        out_queue.put((idx, frame_id, t_capture, time.perf_counter() - t0, detections.data, names))
+        names = None
+    out_queue.put(None)
+
+
+class SharedFramePacket:
+    def __init__(self, slot, frame_id, frame, detections, t_capture):
+        self.slot = slot
+        self.frame_id = frame_id
+        self.frame = frame # Vista sobre o slot em memória partilhada
+        self.detections = detections
+        self.t_capture = t_capture
+
+
+# --- Pipeline captura -> inferência -> render em processos separados ---
+# Mesma interface que pipeline.DetectionPipeline, mais release(packet): o render tem de
+# libertar o slot quando deixa de mostrar o frame (os cliques redesenham a partir dele).
+class ProcessPipeline:
+    def __init__(self, source, model_path, conf, frame_shape, num_slots=8, queue_size=2, backend='auto', metrics=None):
+        self.metrics = metrics
+        self._ctx = mp.get_context('spawn')
+        self.ring = SharedFrameRing(num_slots, frame_shape, lock=self._ctx.Lock())
+        self._dropped = self._ctx.Value('i', 0) # Frames descartados na captura
+        self._pending = self._ctx.Value('i', 0) # Frames na fila de captura
+        self._skipped = 0 # Resultados saltados pelo render (só este processo lhes toca)
+        self.error = None # Mesmo significado que em DetectionPipeline
+        self._names = {} # Nomes das classes, enviados pelo processo de inferência no primeiro resultado
+        self._stop = self._ctx.Event()
+        self._capture_queue = self._ctx.Queue()
+        self._result_queue = self._ctx.Queue()
+        self._processes = [
+            self._ctx.Process(target=_capture_process, name='captura', daemon=True,
+                              args=(source, self.ring, self._capture_queue, self._stop, self._dropped,
+                                    self._pending, max(1, queue_size))),
+            self._ctx.Process(target=_inference_process, name='inferencia', daemon=True,
+                              args=(model_path, backend, conf, self.ring, self._capture_queue, self._result_queue, self._stop,
+                                    self._pending)),
+        ]
+        self.timers = {
+            'inferencia': StageTimer('inferencia'),
+            'render': StageTimer('render'),
+            'latencia': StageTimer('latencia'),
+        }
+
+    def _record(self, stage, seconds):
+        self.timers[stage].record(seconds)
+        if self.metrics is not None:
+            self.metrics.observe(stage, seconds)
+
+    def start(self):
+        for p in self._processes:
+            p.start()
+        return self
+
+    def get_result(self, timeout=0.005):
+        try:
+            item = self._result_queue.get(timeout=timeout)
+        except queue.Empty:
+            return self._check_workers()
+        # Se o render ficou para trás, salta para o resultado mais recente e liberta os slots saltados
+        while item is not None:
+            try:
+                newer = self._result_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.ring.release(item[0])
+            if item[5] is not None:
+                self._names = item[5]
+            self._skipped += 1
+            item = newer
+        if item is None:
+            return END_OF_STREAM
+        idx, frame_id, t_capture, inference_seconds, data, names = item
+        if names is not None:
+            self._names = names
+        self._record('inferencia', inference_seconds)
+        return SharedFramePacket(idx, frame_id, self.ring.view(idx), Detections(data, self._names), t_capture)
+
+    def _check_workers(self):
+        # Um processo que morreu (ex.: o modelo não carregou) nunca envia o fim: o render terminaria
+        # à espera para sempre. O traceback do filho já foi escrito no stderr pelo multiprocessing.
+        for p in self._processes:
+            if p.exitcode not in (None, 0):
+                self.error = f"o processo de {p.name} terminou com o código {p.exitcode}"
+                return END_OF_STREAM
+        return None
+
+    def mark_rendered(self, packet, render_seconds):
+        self._record('render', render_seconds)
+        self._record('latencia', time.time() - packet.t_capture)
+        if self.metrics is not None:
+            self.metrics.set_counter('frames_descartados_captura', self._dropped.value)
+            self.metrics.set_counter('frames_descartados_render', self._skipped)
+
+    def release(self, packet):
+        if packet is not None and packet is not END_OF_STREAM:
+            self.ring.release(packet.slot)
+
+    def dropped_frames(self):
+        return {'captura': self._dropped.value, 'render': self._skipped}
+
+    def stop(self):
+        self._stop.set()
+        for p in self._processes:
+            p.join(timeout=2.0)
+            if p.is_alive():
+                p.terminate()
+        self.ring.close()
+
+    def summary(self):
+        lines = [t.summary() for t in self.timers.values()]
+        dropped = self.dropped_frames()
+        lines.append(f"frames descartados: captura={dropped['captura']} render={dropped['render']}")
+        return "\n".join(lines)
@@ -0,0 +1,164 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+# --- Índice espacial (grelha uniforme) para as caixas de um conjunto de deteções ---
+# Construído uma vez por resultado; responde a consultas por ponto, por retângulo e de caixa
+# mais próxima olhando só para as células relevantes em vez de percorrer todas as caixas.
+#
+# Regra quando várias caixas se sobrepõem no ponto clicado: ganha a de menor área (a caixa
+# "mais interior", normalmente o objeto que o utilizador quer), depois a de maior confiança,
+# e por fim a de menor índice. Todas as consultas devolvem resultados nesta ordem.
+
+MAX_CELLS_PER_BOX = 64 # Caixas que ocupariam mais células ficam numa lista à parte ("grandes")
+MIN_CELL_SIZE = 8.0
+
+
+class GridIndex:
+    def __init__(self, xyxy, conf=None, cell_size=None):
+        self.xyxy = np.asarray(xyxy, dtype=np.float32).reshape(-1, 4)
+        n = self.xyxy.shape[0]
+        self.conf = np.zeros(n, dtype=np.float32) if conf is None else np.asarray(conf, dtype=np.float32)
+        x1, y1, x2, y2 = self.xyxy.T
+        self.areas = (x2 - x1) * (y2 - y1)
+
+        if cell_size is None:
+            # Tamanho de célula próximo do tamanho típico das caixas
+            cell_size = float(np.median(np.maximum(x2 - x1, y2 - y1))) if n else 64.0
+        self.cell_size = max(float(cell_size), MIN_CELL_SIZE)
+        self.origin = (float(x1.min()), float(y1.min())) if n else (0.0, 0.0)
+
+        cx0, cy0 = self._cell(x1, y1)
+        cx1, cy1 = self._cell(x2, y2)
+        spans = (cx1 - cx0 + 1) * (cy1 - cy0 + 1)
+        self._large = np.flatnonzero(spans > MAX_CELLS_PER_BOX)
+
+        buckets = defaultdict(list)
+        for i in np.flatnonzero(spans <= MAX_CELLS_PER_BOX):
+            for cx in range(cx0[i], cx1[i] + 1):
+                for cy in range(cy0[i], cy1[i] + 1):
+                    buckets[(cx, cy)].append(i)
+        self._cells = {key: np.array(v, dtype=np.intp) for key, v in buckets.items()}
+        if n:
+            self._bounds = (int(cx0.min()), int(cy0.min()), int(cx1.max()), int(cy1.max()))
+        else:
+            self._bounds = (0, 0, -1, -1)
+
+    @classmethod
+    def from_detections(cls, detections, cell_size=None):
+        return cls(detections.xyxy, detections.conf, cell_size)
+
+    def __len__(self):
+        return self.xyxy.shape[0]
+
+    def _cell(self, x, y):
+        cx = np.floor((np.asarray(x, dtype=np.float64) - self.origin[0]) / self.cell_size).astype(np.int64)
+        cy = np.floor((np.asarray(y, dtype=np.float64) - self.origin[1]) / self.cell_size).astype(np.int64)
+        return cx, cy
+
+    # Índices candidatos nas células do intervalo [cx0, cx1] x [cy0, cy1], mais as caixas grandes
+    def _candidates(self, cx0, cy0, cx1, cy1):
+        parts = [self._large]
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            # Intervalo maior que o número de células ocupadas: mais barato percorrer as ocupadas
+            parts.extend(v for (cx, cy), v in self._cells.items() if cx0 <= cx <= cx1 and cy0 <= cy <= cy1)
+        else:
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    v = self._cells.get((cx, cy))
+                    if v is not None:
+                        parts.append(v)
+        if len(parts) == 1:
+            return self._large
+        return np.unique(np.concatenate(parts))
+
+    def _rank(self, indices):
+        # Menor área primeiro, depois maior confiança, depois menor índice
+        if indices.size <= 1:
+            return indices
+        order = np.lexsort((indices, -self.conf[indices], self.areas[indices]))
+        return indices[order]
+
+    # --- Consultas por ponto ---
+    def query_point_all(self, x, y):
+        # Todas as caixas que contêm (x, y) (critério estrito, como nos callbacks), pela ordem da regra
+        if not len(self):
+            return np.empty(0, dtype=np.intp)
+        cx, cy = self._cell(x, y)
+        cand = self._candidates(int(cx), int(cy), int(cx), int(cy))
+        b = self.xyxy[cand]
+        inside = (b[:, 0] < x) & (x < b[:, 2]) & (b[:, 1] < y) & (y < b[:, 3])
+        return self._rank(cand[inside])
+
+    def query_point(self, x, y):
+        hits = self.query_point_all(x, y)
+        return int(hits[0]) if hits.size else -1
+
+    # --- Consultas por retângulo ---
+    def query_rect(self, x1, y1, x2, y2, mode='intersects'):
+        # mode='intersects': caixas que tocam o retângulo; mode='within': caixas inteiramente dentro dele
+        if mode not in ('intersects', 'within'):
+            raise ValueError(f"Modo inválido: {mode!r} (use 'intersects' ou 'within')")
+        if not len(self):
+            return np.empty(0, dtype=np.intp)
+        cx0, cy0 = self._cell(x1, y1)
+        cx1, cy1 = self._cell(x2, y2)
+        bx0, by0, bx1, by1 = self._bounds
+        cand = self._candidates(max(int(cx0), bx0), max(int(cy0), by0), min(int(cx1), bx1), min(int(cy1), by1))
+        b = self.xyxy[cand]
+        if mode == 'intersects':
+            keep = (b[:, 0] < x2) & (b[:, 2] > x1) & (b[:, 1] < y2) & (b[:, 3] > y1)
+        else:
+            keep = (b[:, 0] >= x1) & (b[:, 2] <= x2) & (b[:, 1] >= y1) & (b[:, 3] <= y2)
+        return self._rank(cand[keep])
+
+    def count_in_rect(self, x1, y1, x2, y2, mode='within'):
+        return int(self.query_rect(x1, y1, x2, y2, mode).size)
+
+    # --- Caixa mais próxima ---
+    def _distances(self, indices, x, y):
+        b = self.xyxy[indices]
+        dx = np.maximum(np.maximum(b[:, 0] - x, x - b[:, 2]), 0.0)
+        dy = np.maximum(np.maximum(b[:, 1] - y, y - b[:, 3]), 0.0)
+        return np.hypot(dx, dy)
+
+    def nearest(self, x, y, max_distance=None):
+        # Índice da caixa mais próxima de (x, y) (distância 0 se o ponto está dentro), ou -1
+        if not len(self):
+            return -1
+        cx, cy = (int(v) for v in self._cell(x, y))
+        bx0, by0, bx1, by1 = self._bounds
+        max_ring = max(abs(cx - bx0), abs(cx - bx1), abs(cy - by0), abs(cy - by1))
+        if max_distance is not None:
+            max_ring = min(max_ring, int(math.ceil(max_distance / self.cell_size)) + 1)
+
+        best, best_key = -1, None
+        seen = set()
+        for r in range(max_ring + 1):
+            # Células do anel de raio r (perímetro do quadrado (2r+1) x (2r+1))
+            ring = []
+            for gx in range(cx - r, cx + r + 1):
+                for gy in (cy - r, cy + r) if r else (cy,):
+                    ring.append((gx, gy))
+            for gy in range(cy - r + 1, cy + r):
+                ring.extend(((cx - r, gy), (cx + r, gy)))
+            parts = [self._cells[c] for c in ring if c in self._cells]
+            if r == 0:
+                parts.append(self._large)
+            if parts:
+                cand = np.array([i for i in np.unique(np.concatenate(parts)) if i not in seen], dtype=np.intp)
+                seen.update(cand.tolist())
+                if cand.size:
+                    d = self._distances(cand, x, y)
+                    order = np.lexsort((cand, -self.conf[cand], self.areas[cand], d))
+                    key = (float(d[order[0]]), float(self.areas[cand[order[0]]]), -float(self.conf[cand[order[0]]]), int(cand[order[0]]))
+                    if best_key is None or key < best_key:
+                        best, best_key = int(cand[order[0]]), key
+            # Caixas em anéis seguintes estão a pelo menos r * cell_size do ponto
+            if best_key is not None and best_key[0] <= r * self.cell_size:
+                break
+
+        if best_key is None or (max_distance is not None and best_key[0] > max_distance):
+            return -1
+        return best
@@ -0,0 +1,67 @@
+import time
+
+import numpy as np
+
+# --- Modelo falso, determinístico, com a mesma interface que o YOLO do ultralytics ---
+# model(frame_ou_lista, verbose=False, conf=...) devolve uma lista de resultados com
+# .boxes.data (N, 6) [x1, y1, x2, y2, conf, cls], .names e .speed, tal como o ultralytics.
+# Serve para medir o pós-processamento, o hit-testing e o desenho sem pesos nem torch.
+
+STUB_NAMES = {i: name for i, name in enumerate([
+    'person', 'bicycle', 'car', 'motorcycle', 'airplane', 'bus', 'train', 'truck',
+    'boat', 'traffic light', 'fire hydrant', 'stop sign', 'bench', 'bird', 'cat', 'dog',
+])}
+
+
+class StubBoxes:
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class StubResult:
+    def __init__(self, data, names, orig_shape, speed):
+        self.boxes = StubBoxes(data)
+        self.names = names
+        self.orig_shape = orig_shape
+        self.speed = speed
+
+
+class StubModel:
+    # num_boxes: caixas devolvidas por imagem; latency_ms: tempo de "inferência" simulado por imagem
+    def __init__(self, num_boxes=20, seed=0, latency_ms=0.0):
+        self.num_boxes = num_boxes
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.names = STUB_NAMES
+        self._calls = 0 # A sequência de resultados só depende da semente e da ordem das imagens
+
+    def _boxes(self, height, width, conf):
+        rng = np.random.default_rng((self.seed, self._calls))
+        self._calls += 1
+        n = self.num_boxes
+        bw = rng.uniform(0.02, 0.3, n) * width
+        bh = rng.uniform(0.02, 0.3, n) * height
+        x1 = rng.uniform(0, 1, n) * (width - bw)
+        y1 = rng.uniform(0, 1, n) * (height - bh)
+        scores = rng.uniform(max(conf, 0.0), 1.0, n)
+        classes = rng.integers(0, len(self.names), n)
+        data = np.stack([x1, y1, x1 + bw, y1 + bh, scores, classes], axis=1).astype(np.float32)
+        return data[np.argsort(-data[:, 4], kind='stable')] # Por confiança decrescente, como o NMS
+
+    def __call__(self, source, verbose=False, conf=0.25, **kwargs):
+        frames = source if isinstance(source, (list, tuple)) else [source]
+        results = []
+        for frame in frames:
+            if isinstance(frame, str):
+                import cv2
+                frame = cv2.imread(frame)
+            t0 = time.perf_counter()
+            if self.latency_ms:
+                time.sleep(self.latency_ms / 1000.0)
+            data = self._boxes(frame.shape[0], frame.shape[1], conf)
+            speed = {'preprocess': 0.0, 'inference': (time.perf_counter() - t0) * 1000, 'postprocess': 0.0}
+            results.append(StubResult(data, self.names, frame.shape[:2], speed))
+        return results
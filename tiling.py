@@ -0,0 +1,353 @@
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from detections import Detections
+
+# --- Inferência por mosaico (estilo SAHI) para imagens muito grandes ---
+# Numa imagem de 8K-20K px o modelo reduz tudo para 640 px e os objetos pequenos desaparecem.
+# Aqui a imagem é percorrida em mosaicos sobrepostos, lidos um a um (memory-map ou leitura por
+# janela) e agrupados em lotes; cada lote é uma só chamada ao modelo. A leitura e descodificação
+# dos mosaicos corre numa pool de threads, em paralelo com a inferência; com o modelo partilhado
+# as chamadas ao modelo são feitas uma de cada vez (model_per_worker=True dá um modelo por thread).
+# As caixas de cada mosaico passam para as coordenadas da imagem original e no fim uma fusão
+# global (NMS ou NMM com interseção sobre a menor área, como no SAHI) junta os objetos cortados
+# entre mosaicos. Opcionalmente a imagem inteira reduzida também passa pelo modelo.
+#   python tiling.py inspecao.tif --tile 640 --overlap 0.2 --workers 2 -o deteccoes.json
+# Memória limitada (2 * workers lotes em voo, mais a vista reduzida) só nas fontes com leitura
+# por janela: .npy e TIFF sem compressão (memory-map) e TIFF comprimido em mosaicos ou faixas
+# (tifffile). JPEG, PNG e outros são descodificados uma única vez para memória (ver decode_once).
+
+TILE_SIZE = 640
+TILE_OVERLAP = 0.2 # Fração do mosaico partilhada com o vizinho
+TILE_BATCH = 8
+TILE_WORKERS = 2
+MATCH_THRESHOLD = 0.5
+OVERVIEW_SIDE = 2048 # Lado maior da vista reduzida (visualizador e passagem da imagem inteira)
+SEGMENT_CACHE = 32 # Segmentos TIFF descodificados guardados (vizinhos partilham segmentos)
+
+
+# --- Fontes de imagem com leitura por janela ---
+def _to_bgr(region, rgb):
+    if region.ndim == 2:
+        return cv2.cvtColor(np.ascontiguousarray(region), cv2.COLOR_GRAY2BGR)
+    region = region[:, :, :3]
+    if region.dtype != np.uint8: # TIFF de 16 bits: reduz para 8 bits
+        region = (region >> 8).astype(np.uint8) if region.dtype == np.uint16 else region.astype(np.uint8)
+    return np.ascontiguousarray(region[:, :, ::-1] if rgb else region)
+
+
+class ArraySource:
+    # Array (ou memmap) HxW[xC]; rgb=True se os canais estiverem em RGB
+    def __init__(self, array, rgb=False):
+        self.array = array
+        self.rgb = rgb
+        self.shape = array.shape[:2]
+
+    def read(self, x1, y1, x2, y2, step=1):
+        # Só as linhas/colunas pedidas são lidas do disco
+        return _to_bgr(self.array[y1:y2:step, x1:x2:step], self.rgb)
+
+    def overview(self, max_side=OVERVIEW_SIDE):
+        h, w = self.shape
+        step = max(1, math.ceil(max(h, w) / max_side))
+        return self.read(0, 0, w, h, step), 1.0 / step
+
+    def close(self):
+        mm = getattr(self.array, '_mmap', None)
+        if mm is not None:
+            mm.close()
+
+
+class TiffSource:
+    # TIFF comprimido, em mosaicos (tiles) ou em faixas (strips): só os segmentos que tocam a janela
+    # são lidos do disco e descodificados, com uma pequena cache dos últimos segmentos.
+    # Um TIFF com uma só faixa para a imagem inteira acaba por ser descodificado de uma vez.
+    def __init__(self, path):
+        import tifffile
+        self._tif = tifffile.TiffFile(path)
+        page = self._tif.pages[0]
+        if page.samplesperpixel > 1 and page.planarconfig != 1: # Só canais intercalados (contig)
+            self._tif.close()
+            raise ValueError("TIFF com planos de cor separados")
+        self.page = page
+        self.shape = (page.imagelength, page.imagewidth)
+        if page.is_tiled:
+            self.seg_h, self.seg_w = page.tilelength, page.tilewidth
+        else:
+            self.seg_h, self.seg_w = min(page.rowsperstrip, page.imagelength), page.imagewidth
+        self.across = math.ceil(page.imagewidth / self.seg_w)
+        self.rgb = page.samplesperpixel >= 3
+        self._cache = OrderedDict()
+        self._lock = threading.Lock() # O ficheiro é partilhado pelas threads de leitura
+
+    def _segment(self, index):
+        with self._lock:
+            segment = self._cache.get(index)
+            if segment is not None:
+                self._cache.move_to_end(index)
+                return segment
+            fh = self._tif.filehandle
+            fh.seek(self.page.dataoffsets[index])
+            data = fh.read(self.page.databytecounts[index])
+        segment, _, _ = self.page.decode(data, index, jpegtables=self.page.jpegtables) # Fora do lock
+        if segment is None: # Segmento vazio no ficheiro
+            segment = np.zeros((self.seg_h, self.seg_w, self.page.samplesperpixel), dtype=self.page.dtype)
+        segment = segment.reshape(segment.shape[-3:]) # (altura, largura, canais)
+        with self._lock:
+            self._cache[index] = segment
+            while len(self._cache) > SEGMENT_CACHE:
+                self._cache.popitem(last=False)
+        return segment
+
+    def read(self, x1, y1, x2, y2, step=1):
+        h, w = self.shape
+        out = np.zeros((len(range(y1, y2, step)), len(range(x1, x2, step)), self.page.samplesperpixel),
+                       dtype=self.page.dtype)
+        for ty in range(y1 // self.seg_h, (y2 - 1) // self.seg_h + 1):
+            sy = ty * self.seg_h
+            gy0, gy1 = max(y1, sy), min(y2, sy + self.seg_h, h)
+            fy = y1 + -(-(gy0 - y1) // step) * step # Primeira linha da grelha 'step' dentro do segmento
+            if fy >= gy1:
+                continue
+            for tx in range(x1 // self.seg_w, (x2 - 1) // self.seg_w + 1):
+                sx = tx * self.seg_w
+                gx0, gx1 = max(x1, sx), min(x2, sx + self.seg_w, w)
+                fx = x1 + -(-(gx0 - x1) // step) * step
+                if fx >= gx1:
+                    continue
+                part = self._segment(ty * self.across + tx)[fy - sy:gy1 - sy:step, fx - sx:gx1 - sx:step]
+                oy, ox = (fy - y1) // step, (fx - x1) // step
+                out[oy:oy + part.shape[0], ox:ox + part.shape[1]] = part
+        return _to_bgr(out[:, :, 0] if out.shape[2] == 1 else out, self.rgb)
+
+    def overview(self, max_side=OVERVIEW_SIDE):
+        # Percorre os segmentos um a um: a memória fica limitada à cache, não ao tamanho da imagem
+        h, w = self.shape
+        step = max(1, math.ceil(max(h, w) / max_side))
+        return self.read(0, 0, w, h, step), 1.0 / step
+
+    def close(self):
+        self._tif.close()
+
+
+def decode_once(path):
+    # JPEG, PNG, ... não permitem ler só uma janela: a imagem é descodificada uma única vez e
+    # reutilizada pelos mosaicos e pelo visualizador. Aqui a memória cresce com o tamanho da
+    # imagem; para imagens de 8K-20K prefira TIFF em mosaicos ou .npy.
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None: # Ex.: acima do limite de píxeis do OpenCV
+        try:
+            from PIL import Image
+            Image.MAX_IMAGE_PIXELS = None # As imagens de inspeção passam o limite anti "decompression bomb"
+            with Image.open(path) as pil:
+                img = _to_bgr(np.asarray(pil.convert('RGB')), rgb=True)
+        except (ImportError, OSError):
+            raise OSError(f"Não foi possível abrir a imagem: {path}")
+    return ArraySource(img)
+
+
+def open_image(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.npy':
+        return ArraySource(np.load(path, mmap_mode='r'))
+    if ext in ('.tif', '.tiff'):
+        try:
+            import tifffile
+        except ImportError:
+            return decode_once(path)
+        try:
+            return ArraySource(tifffile.memmap(path, mode='r'), rgb=True) # Sem compressão: memory-map
+        except ValueError:
+            pass
+        try:
+            return TiffSource(path)
+        except ValueError:
+            pass
+    return decode_once(path)
+
+
+# --- Grelha de mosaicos ---
+def _starts(length, tile, stride):
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile) # O último mosaico encosta à margem
+    return starts
+
+
+def tile_grid(width, height, tile_size=TILE_SIZE, overlap=TILE_OVERLAP):
+    stride = max(1, int(round(tile_size * (1.0 - overlap))))
+    return [(x, y, min(x + tile_size, width), min(y + tile_size, height))
+            for y in _starts(height, tile_size, stride) for x in _starts(width, tile_size, stride)]
+
+
+# --- Fusão global das caixas de todos os mosaicos ---
+def _overlap(box, boxes, metric):
+    iw = np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0])
+    ih = np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1])
+    inter = np.clip(iw, 0, None) * np.clip(ih, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if metric == 'ios': # Interseção sobre a menor: um pedaço cortado dentro do objeto inteiro conta como o mesmo
+        denom = np.minimum(area, areas)
+    else:
+        denom = area + areas - inter
+    return inter / np.maximum(denom, 1e-9)
+
+
+def merge_detections(data, mode='nmm', metric='ios', threshold=MATCH_THRESHOLD):
+    # mode='nms' descarta as caixas sobrepostas; mode='nmm' funde-as na caixa que as envolve a todas
+    if mode not in ('nms', 'nmm'):
+        raise ValueError(f"Modo de fusão inválido: {mode!r} (use 'nms' ou 'nmm')")
+    kept = []
+    for c in np.unique(data[:, 5]):
+        rows = data[data[:, 5] == c]
+        rows = rows[np.argsort(-rows[:, 4], kind='stable')]
+        while len(rows):
+            best = rows[0].copy()
+            rest = rows[1:]
+            same = _overlap(best, rest, metric) >= threshold
+            if mode == 'nmm' and same.any():
+                group = rest[same]
+                best[:2] = np.minimum(best[:2], group[:, :2].min(axis=0))
+                best[2:4] = np.maximum(best[2:4], group[:, 2:4].max(axis=0))
+            kept.append(best)
+            rows = rest[~same]
+    if not kept:
+        return np.empty((0, 6), dtype=np.float32)
+    merged = np.array(kept, dtype=np.float32)
+    return merged[np.argsort(-merged[:, 4], kind='stable')]
+
+
+class TiledDetector:
+    # get_model() devolve o modelo; com model_per_worker=True é chamado uma vez por thread e deve
+    # criar um modelo novo (inferência em paralelo). Caso contrário o modelo é partilhado: as
+    # chamadas ao modelo são serializadas e só a leitura dos mosaicos corre em paralelo com elas.
+    def __init__(self, get_model, tile_size=TILE_SIZE, overlap=TILE_OVERLAP, batch_size=TILE_BATCH, workers=TILE_WORKERS,
+                 conf=0.25, imgsz=640, merge='nmm', match_threshold=MATCH_THRESHOLD, full_image=True, model_per_worker=False):
+        self.get_model = get_model
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.workers = workers
+        self.conf = conf
+        self.imgsz = imgsz
+        self.merge = merge
+        self.match_threshold = match_threshold
+        self.full_image = full_image
+        self.model_per_worker = model_per_worker
+        self.names = None
+        self.last_stats = {}
+        self._local = threading.local()
+        self._model_lock = threading.Lock()
+
+    # Parâmetros que mudam o resultado (fazem parte da chave da cache, ver result_cache.py)
+    def cache_params(self):
+        return {'tile': self.tile_size, 'overlap': self.overlap, 'merge': self.merge,
+                'match_threshold': self.match_threshold, 'full_image': self.full_image}
+
+    def _predict(self, images):
+        if self.model_per_worker:
+            model = getattr(self._local, 'model', None)
+            if model is None:
+                model = self._local.model = self.get_model()
+            results = model(images, verbose=False, conf=self.conf, imgsz=self.imgsz)
+        else:
+            with self._model_lock:
+                model = self.get_model()
+                results = model(images, verbose=False, conf=self.conf, imgsz=self.imgsz)
+        if self.names is None:
+            self.names = model.names
+        return [Detections.from_result(r, model.names).data.copy() for r in results]
+
+    def _run_batch(self, source, batch):
+        datas = self._predict([source.read(*t) for t in batch])
+        for data, (x1, y1, _, _) in zip(datas, batch):
+            data[:, [0, 2]] += x1 # Coordenadas do mosaico -> imagem original
+            data[:, [1, 3]] += y1
+        return datas
+
+    def detect(self, source, progress=None):
+        t0 = time.perf_counter()
+        h, w = source.shape
+        tiles = tile_grid(w, h, self.tile_size, self.overlap)
+        batches = [tiles[i:i + self.batch_size] for i in range(0, len(tiles), self.batch_size)]
+        parts, done = [], 0
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            def collect():
+                nonlocal done
+                parts.extend(pending.popleft().result())
+                done += 1
+                if progress is not None:
+                    progress(done, len(batches))
+            for batch in batches:
+                pending.append(pool.submit(self._run_batch, source, batch))
+                if len(pending) >= 2 * self.workers: # Janela limitada de lotes em voo
+                    collect()
+            while pending:
+                collect()
+        if self.full_image and max(h, w) > self.tile_size:
+            overview, scale = source.overview(max(self.imgsz, self.tile_size))
+            data = self._predict([overview])[0]
+            data[:, :4] /= scale
+            parts.append(data)
+        raw = np.concatenate(parts) if parts else np.empty((0, 6), dtype=np.float32)
+        merged = merge_detections(raw, self.merge, threshold=self.match_threshold)
+        self.last_stats = {'mosaicos': len(tiles), 'caixas_brutas': len(raw), 'caixas_finais': len(merged),
+                           'segundos': time.perf_counter() - t0}
+        return Detections(merged, self.names)
+
+    def detect_path(self, path, progress=None):
+        source = open_image(path)
+        try:
+            return self.detect(source, progress)
+        finally:
+            source.close()
+
+
+# --- Script Principal ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deteção por mosaicos em imagens muito grandes.")
+    parser.add_argument('image')
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--backend', choices=['auto', 'torch', 'onnxruntime', 'openvino'], default='auto', help="Ver backends.py")
+    parser.add_argument('--tile', type=int, default=TILE_SIZE)
+    parser.add_argument('--overlap', type=float, default=TILE_OVERLAP)
+    parser.add_argument('--batch', type=int, default=TILE_BATCH)
+    parser.add_argument('--workers', type=int, default=TILE_WORKERS)
+    parser.add_argument('--conf', type=float, default=0.25)
+    parser.add_argument('--merge', choices=['nmm', 'nms'], default='nmm')
+    parser.add_argument('--no-full-image', action='store_true', help="Não corre o modelo na imagem inteira reduzida")
+    parser.add_argument('--model-per-worker', action='store_true', help="Um modelo por thread (mais memória, inferência em paralelo)")
+    parser.add_argument('-o', '--output', default=None, help="Ficheiro JSON com as deteções")
+    args = parser.parse_args()
+
+    from model_loader import load_model
+    shared = []
+    def get_model():
+        if args.model_per_worker:
+            return load_model(args.model, backend=args.backend)
+        if not shared:
+            shared.append(load_model(args.model, backend=args.backend))
+        return shared[0]
+
+    tiler = TiledDetector(get_model, args.tile, args.overlap, args.batch, args.workers, args.conf, merge=args.merge,
+                          full_image=not args.no_full_image, model_per_worker=args.model_per_worker)
+    detections = tiler.detect_path(args.image, lambda d, n: print(f"\rLotes: {d}/{n}", end='', flush=True))
+    print()
+    stats = tiler.last_stats
+    print(f"{stats['mosaicos']} mosaicos, {stats['caixas_brutas']} caixas antes da fusão, "
+          f"{stats['caixas_finais']} depois, em {stats['segundos']:.1f}s")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(detections.to_dicts(), f, indent=2)
@@ -0,0 +1,189 @@
+import time
+
+import cv2
+import numpy as np
+
+from detections import Detections
+
+# --- Deteção em keyframes com tracking entre eles ---
+# O YOLO só corre a cada K frames (ou quando a cena muda de repente); nos frames intermédios
+# as caixas são propagadas por um tracker leve (associação por IoU + velocidade constante).
+# Cada caixa recebe um identificador de track estável, o que permite à seleção seguir o
+# mesmo objeto de frame para frame. K ajusta-se sozinho para manter o FPS alvo.
+
+
+# --- IoU entre dois conjuntos de caixas (M, 4) x (N, 4) ---
+def iou_matrix(a, b):
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0).astype(np.float32)
+
+
+class IouTracker:
+    def __init__(self, iou_threshold=0.3, max_missed=2, velocity_smoothing=0.5):
+        self.iou_threshold = iou_threshold
+        self.max_missed = max_missed # Keyframes seguidos sem correspondência antes de apagar o track
+        self.velocity_smoothing = velocity_smoothing
+        self.names = {}
+        self._next_id = 0
+        self._data = np.empty((0, 6), dtype=np.float32) # Caixa atual (prevista) + conf + classe
+        self._measured = np.empty((0, 4), dtype=np.float32) # Última caixa vinda do detetor
+        self._velocity = np.empty((0, 4), dtype=np.float32) # Deslocamento por frame
+        self._ids = np.empty(0, dtype=np.int64)
+        self._missed = np.empty(0, dtype=np.int32)
+        self._frames_since_update = np.empty(0, dtype=np.int32)
+
+    def _visible(self):
+        mask = self._missed == 0
+        return Detections(self._data[mask], self.names, self._ids[mask])
+
+    # Frame sem deteção: avança todos os tracks pela sua velocidade
+    def predict(self):
+        if len(self._ids):
+            self._data[:, :4] += self._velocity
+            self._frames_since_update += 1
+        return self._visible()
+
+    # Keyframe: associa as novas deteções aos tracks existentes
+    def update(self, detections):
+        if detections.names:
+            self.names = detections.names
+        det = detections.data
+        n_tracks, n_det = len(self._ids), len(det)
+        self._frames_since_update += 1
+
+        iou = iou_matrix(self._data[:, :4], det[:, :4])
+        if n_tracks and n_det:
+            iou[self._data[:, 5][:, None] != det[:, 5][None, :]] = 0.0 # Só associa caixas da mesma classe
+        track_for_det = np.full(n_det, -1, dtype=np.int64)
+        if iou.size:
+            # Associação gulosa pela maior IoU
+            pairs = np.argwhere(iou >= self.iou_threshold)
+            order = np.argsort(-iou[pairs[:, 0], pairs[:, 1]], kind='stable')
+            used_tracks = set()
+            for t, d in pairs[order]:
+                if t in used_tracks or track_for_det[d] != -1:
+                    continue
+                used_tracks.add(t)
+                track_for_det[d] = t
+
+        matched_tracks = track_for_det[track_for_det >= 0]
+        matched_dets = np.flatnonzero(track_for_det >= 0)
+        if matched_tracks.size:
+            steps = np.maximum(self._frames_since_update[matched_tracks], 1)[:, None].astype(np.float32)
+            new_velocity = (det[matched_dets, :4] - self._measured[matched_tracks]) / steps
+            a = self.velocity_smoothing
+            self._velocity[matched_tracks] = a * self._velocity[matched_tracks] + (1 - a) * new_velocity
+            self._data[matched_tracks] = det[matched_dets]
+            self._measured[matched_tracks] = det[matched_dets, :4]
+            self._missed[matched_tracks] = 0
+            self._frames_since_update[matched_tracks] = 0
+
+        unmatched = np.ones(n_tracks, dtype=bool)
+        unmatched[matched_tracks] = False
+        self._missed[unmatched] += 1
+        self._velocity[unmatched] = 0.0 # Sem confirmação o track deixa de se mover
+
+        new_dets = np.flatnonzero(track_for_det < 0)
+        if new_dets.size:
+            new_ids = np.arange(self._next_id, self._next_id + new_dets.size, dtype=np.int64)
+            self._next_id += new_dets.size
+            self._data = np.concatenate([self._data, det[new_dets]])
+            self._measured = np.concatenate([self._measured, det[new_dets, :4]])
+            self._velocity = np.concatenate([self._velocity, np.zeros((new_dets.size, 4), dtype=np.float32)])
+            self._ids = np.concatenate([self._ids, new_ids])
+            self._missed = np.concatenate([self._missed, np.zeros(new_dets.size, dtype=np.int32)])
+            self._frames_since_update = np.concatenate([self._frames_since_update, np.zeros(new_dets.size, dtype=np.int32)])
+            track_for_det[new_dets] = np.arange(n_tracks, n_tracks + new_dets.size)
+
+        keep = self._missed <= self.max_missed
+        if not keep.all():
+            remap = np.cumsum(keep) - 1
+            self._data, self._measured, self._velocity = self._data[keep], self._measured[keep], self._velocity[keep]
+            self._ids, self._missed = self._ids[keep], self._missed[keep]
+            self._frames_since_update = self._frames_since_update[keep]
+            track_for_det = remap[track_for_det]
+
+        # Devolve as deteções do keyframe pela ordem original, com o id do track de cada uma
+        return Detections(det, detections.names, self._ids[track_for_det])
+
+
+# --- Decide quando correr o detetor ---
+class KeyframeScheduler:
+    def __init__(self, target_fps=25.0, k_min=1, k_max=10, scene_threshold=20.0, thumb_size=(64, 36)):
+        self.target_fps = target_fps
+        self.k_min = k_min
+        self.k_max = k_max
+        self.k = k_min
+        self.scene_threshold = scene_threshold # Diferença média (0-255) na miniatura que conta como mudança de cena
+        self.thumb_size = thumb_size
+        self.frames_since_keyframe = 0
+        self.keyframes = 0
+        self.scene_changes = 0
+        self._last_thumb = None
+        self._last_tick = None
+        self._frame_time = None # Média móvel do intervalo entre frames
+
+    def _thumb(self, frame):
+        small = cv2.resize(frame, self.thumb_size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return small.astype(np.int16)
+
+    def should_detect(self, frame):
+        thumb = self._thumb(frame)
+        scene_change = (self._last_thumb is not None and
+                        float(np.abs(thumb - self._last_thumb).mean()) > self.scene_threshold)
+        self._last_thumb = thumb
+        if self._last_tick is None or scene_change or self.frames_since_keyframe + 1 >= self.k:
+            self.scene_changes += int(scene_change)
+            self.keyframes += 1
+            self.frames_since_keyframe = 0
+            return True
+        self.frames_since_keyframe += 1
+        return False
+
+    # Chamado uma vez por frame: mede o ritmo real e ajusta K
+    def tick(self):
+        now = time.perf_counter()
+        if self._last_tick is not None:
+            dt = now - self._last_tick
+            self._frame_time = dt if self._frame_time is None else 0.9 * self._frame_time + 0.1 * dt
+            budget = 1.0 / self.target_fps
+            if self._frame_time > budget and self.k < self.k_max:
+                self.k += 1
+                self._frame_time = budget # Dá tempo ao novo K de fazer efeito
+            elif self._frame_time < 0.7 * budget and self.k > self.k_min:
+                self.k -= 1
+                self._frame_time = budget
+        self._last_tick = now
+
+
+# --- Função de deteção com keyframes (mesma assinatura que detect_frame: frame -> Detections) ---
+class KeyframeDetector:
+    def __init__(self, detect_fn, scheduler=None, tracker=None):
+        self.detect_fn = detect_fn
+        self.scheduler = scheduler if scheduler is not None else KeyframeScheduler()
+        self.tracker = tracker if tracker is not None else IouTracker()
+        self.frames = 0
+
+    def __call__(self, frame):
+        if self.scheduler.should_detect(frame):
+            detections = self.tracker.update(self.detect_fn(frame))
+        else:
+            detections = self.tracker.predict()
+        self.scheduler.tick()
+        self.frames += 1
+        return detections
+
+    def summary(self):
+        s = self.scheduler
+        return f"keyframes={s.keyframes}/{self.frames} mudancas de cena={s.scene_changes} K atual={s.k}"
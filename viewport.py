@@ -0,0 +1,102 @@
+import numpy as np
+import cv2
+
+from detections import Detections
+from tiling import OVERVIEW_SIDE
+
+# --- Vista com zoom e deslocamento sobre uma imagem muito grande ---
+# A janela mostra sempre view_size píxeis. Com zoom baixo a vista é composta a partir da
+# imagem reduzida (overview), calculada uma vez; com zoom alto só a janela visível é lida
+# da fonte (ver tiling.py), com salto de píxeis quando o zoom é inferior a 1. Com fontes de leitura
+# por janela (.npy, TIFF) a memória não depende do tamanho da imagem; JPEG/PNG são descodificados
+# uma vez para memória (ver tiling.decode_once). As deteções (em coordenadas da imagem original)
+# são projetadas para a vista; só as que tocam a janela visível, via índice espacial.
+
+BACKGROUND = (40, 40, 40)
+MAX_ZOOM = 4.0
+
+
+class Viewport:
+    def __init__(self, source, view_size=(1280, 800), overview_side=OVERVIEW_SIDE):
+        self.source = source
+        self.view_w, self.view_h = view_size
+        self.image_h, self.image_w = source.shape
+        self.overview, self.overview_scale = source.overview(overview_side)
+        self.min_zoom = min(self.view_w / self.image_w, self.view_h / self.image_h)
+        self.fit()
+
+    # --- Geometria ---
+    def fit(self):
+        self.zoom = self.min_zoom
+        self.cx, self.cy = self.image_w / 2.0, self.image_h / 2.0
+
+    def _origin(self):
+        # Ponto da imagem que fica no canto superior esquerdo da vista
+        return self.cx - self.view_w / (2.0 * self.zoom), self.cy - self.view_h / (2.0 * self.zoom)
+
+    def to_image(self, vx, vy):
+        ox, oy = self._origin()
+        return ox + vx / self.zoom, oy + vy / self.zoom
+
+    def _clamp(self):
+        # Com a imagem mais pequena do que a vista fica centrada; senão não se sai das margens
+        half_w, half_h = self.view_w / (2.0 * self.zoom), self.view_h / (2.0 * self.zoom)
+        self.cx = self.image_w / 2.0 if 2 * half_w >= self.image_w else min(max(self.cx, half_w), self.image_w - half_w)
+        self.cy = self.image_h / 2.0 if 2 * half_h >= self.image_h else min(max(self.cy, half_h), self.image_h - half_h)
+
+    def zoom_at(self, factor, vx, vy):
+        # Mantém fixo o ponto da imagem que está sob o cursor
+        ix, iy = self.to_image(vx, vy)
+        self.zoom = min(max(self.zoom * factor, self.min_zoom), MAX_ZOOM)
+        self.cx = ix - (vx - self.view_w / 2.0) / self.zoom
+        self.cy = iy - (vy - self.view_h / 2.0) / self.zoom
+        self._clamp()
+
+    def pan(self, dx, dy):
+        # Deslocamento em píxeis da vista (arrastar para a direita mostra o que está à esquerda)
+        self.cx -= dx / self.zoom
+        self.cy -= dy / self.zoom
+        self._clamp()
+
+    def center_on(self, xyxy):
+        self.cx, self.cy = (xyxy[0] + xyxy[2]) / 2.0, (xyxy[1] + xyxy[3]) / 2.0
+        self._clamp()
+
+    def window(self):
+        # Retângulo visível em coordenadas da imagem, já recortado às margens
+        ox, oy = self._origin()
+        x1, y1 = max(int(np.floor(ox)), 0), max(int(np.floor(oy)), 0)
+        x2 = min(int(np.ceil(ox + self.view_w / self.zoom)), self.image_w)
+        y2 = min(int(np.ceil(oy + self.view_h / self.zoom)), self.image_h)
+        return x1, y1, x2, y2
+
+    # --- Composição da vista ---
+    def render_base(self):
+        canvas = np.full((self.view_h, self.view_w, 3), BACKGROUND, dtype=np.uint8)
+        x1, y1, x2, y2 = self.window()
+        if x2 <= x1 or y2 <= y1:
+            return canvas
+        ox, oy = self._origin()
+        vx1, vy1 = int(round((x1 - ox) * self.zoom)), int(round((y1 - oy) * self.zoom))
+        vx2 = min(vx1 + max(int(round((x2 - x1) * self.zoom)), 1), self.view_w)
+        vy2 = min(vy1 + max(int(round((y2 - y1) * self.zoom)), 1), self.view_h)
+        if self.zoom <= self.overview_scale:
+            s = self.overview_scale # A imagem reduzida já tem resolução suficiente
+            region = self.overview[int(y1 * s):max(int(np.ceil(y2 * s)), int(y1 * s) + 1),
+                                   int(x1 * s):max(int(np.ceil(x2 * s)), int(x1 * s) + 1)]
+        else:
+            step = max(1, int(1.0 / self.zoom)) # Lê só um píxel em cada 'step'
+            region = self.source.read(x1, y1, x2, y2, step)
+        interpolation = cv2.INTER_AREA if self.zoom < 1.0 else cv2.INTER_NEAREST
+        canvas[vy1:vy2, vx1:vx2] = cv2.resize(region, (vx2 - vx1, vy2 - vy1), interpolation=interpolation)
+        return canvas
+
+    def project(self, detections):
+        # Deteções visíveis em coordenadas da vista, e os seus índices em 'detections'
+        if not len(detections):
+            return Detections(names=detections.names), np.empty(0, dtype=np.intp)
+        indices = np.sort(detections.spatial_index().query_rect(*self.window()))
+        view = detections[indices]
+        ox, oy = self._origin()
+        view.data[:, :4] = (view.data[:, :4] - (ox, oy, ox, oy)) * self.zoom
+        return view, indices